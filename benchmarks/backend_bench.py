@@ -0,0 +1,132 @@
+"""
+Storage backend benchmark - JSON file tree vs SQLite at many users.
+
+Populates each backend with --users users (state + --messages messages,
+1% with a pending scheduled message), then measures:
+- a cold per-message turn the way the engine does it without the session
+  cache: load state, recent 5, append user, recent 20, append assistant,
+  save state
+- one due-message poll across all users
+- on-disk footprint
+
+Usage:
+    python benchmarks/backend_bench.py [--users 10000] [--messages 20] [--turns 2000]
+"""
+
+import argparse
+import os
+import random
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+_WORK_DIR = Path(tempfile.mkdtemp(prefix="gate-backends-"))
+os.environ["DATA_DIR"] = str(_WORK_DIR / "users")
+
+from memory.backends import set_backend  # noqa: E402
+from memory.backends.json_files import JsonFileBackend  # noqa: E402
+from memory.backends.sqlite import SqliteBackend  # noqa: E402
+
+
+def _state(user_id: str) -> dict:
+    return {
+        "user_id": user_id,
+        "username": f"user{user_id}",
+        "user": {"name": None, "commitment": None, "deadline": None},
+        "coaching": {"current_step": None, "step_number": 0, "awaiting_completion": False, "completed_steps": []}
+    }
+
+
+def populate(backend, users: int, messages: int):
+    now = datetime.now()
+    for u in range(users):
+        user_id = str(100000 + u)
+        backend.save_document(user_id, "state", _state(user_id))
+        backend.replace_messages(user_id, [
+            {
+                "id": i + 1,
+                "role": "user" if i % 2 == 0 else "assistant",
+                "content": f"message {i} " + "lorem ipsum " * 8,
+                "timestamp": now.isoformat(),
+                "metadata": {}
+            }
+            for i in range(messages)
+        ])
+        if u % 100 == 0:
+            pending = [{"id": 1, "type": "soft_ping", "send_at": (now - timedelta(minutes=1)).isoformat(), "status": "pending"}]
+            backend.save_document(user_id, "scheduled", {"pending": pending, "sent": []})
+            backend.index_pending(user_id, pending)
+
+
+def turn(backend, user_id: str):
+    state = backend.load_document(user_id, "state", lambda: _state(user_id))
+    backend.recent_messages(user_id, 5)
+    backend.append_message(user_id, {"role": "user", "content": "done", "timestamp": datetime.now().isoformat(), "metadata": {}})
+    backend.recent_messages(user_id, 20)
+    backend.append_message(user_id, {"role": "assistant", "content": "what's next", "timestamp": datetime.now().isoformat(), "metadata": {}})
+    backend.save_document(user_id, "state", state)
+
+
+def disk_usage(path: Path) -> int:
+    return sum(p.stat().st_size for p in path.rglob("*") if p.is_file())
+
+
+def percentile(values, pct):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * pct / 100))]
+
+
+def bench(name: str, backend, root: Path, args):
+    set_backend(backend)
+
+    start = time.perf_counter()
+    populate(backend, args.users, args.messages)
+    populate_seconds = time.perf_counter() - start
+
+    user_ids = [str(100000 + u) for u in range(args.users)]
+    latencies = []
+    for _ in range(args.turns):
+        user_id = random.choice(user_ids)
+        t0 = time.perf_counter()
+        turn(backend, user_id)
+        latencies.append((time.perf_counter() - t0) * 1000)
+
+    t0 = time.perf_counter()
+    due = backend.due_pending(datetime.now())
+    due_ms = (time.perf_counter() - t0) * 1000
+
+    print(
+        f"{name:>7} {populate_seconds:>10.1f} {statistics.median(latencies):>9.2f} "
+        f"{percentile(latencies, 99):>9.2f} {due_ms:>9.1f} {len(due):>5} "
+        f"{disk_usage(root) / 1e6:>8.1f}"
+    )
+    backend.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=10000)
+    parser.add_argument("--messages", type=int, default=20, help="history length per user")
+    parser.add_argument("--turns", type=int, default=2000, help="random turns to time")
+    args = parser.parse_args()
+
+    print(f"{args.users} users x {args.messages} messages, {args.turns} timed turns")
+    print(f"{'backend':>7} {'populate s':>10} {'turn p50':>9} {'turn p99':>9} {'due ms':>9} {'due':>5} {'disk MB':>8}")
+    try:
+        json_root = _WORK_DIR / "users"
+        bench("json", JsonFileBackend(json_root), json_root, args)
+
+        sqlite_root = _WORK_DIR / "sqlite"
+        bench("sqlite", SqliteBackend(sqlite_root / "gate.db"), sqlite_root, args)
+    finally:
+        shutil.rmtree(_WORK_DIR, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
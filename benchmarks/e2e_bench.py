@@ -0,0 +1,288 @@
+"""
+End-to-end benchmark - simulated users against the fake LLM provider.
+
+Runs scripted conversations for --users users through one of:
+    sync      ResponseEngine.process_message, one turn at a time
+    async     ResponseEngine.process_message_async, all users concurrently
+    telegram  bot.handle_text_message with fake Update objects (streaming
+              replies and all), all users concurrently
+
+Everything is offline: LLM_PROVIDER=fake with --latency as the latency
+distribution, and a temporary DATA_DIR. Reports per-turn p50/p99 latency,
+messages/sec, LLM calls, Telegram API calls, file I/O (opens for
+read/write and atomic renames under DATA_DIR, counted with an audit hook)
+and the per-stage breakdown from the turn traces.
+
+Afterwards it checks a user with a legacy history.json (messages without
+ids): compacting them into the archive and folding them into the summary
+must not lose or reorder a message.
+
+Usage:
+    python benchmarks/e2e_bench.py [--mode async] [--users 1000] [--messages 5]
+                                   [--latency lognormal:0.05:0.3] [--backend json]
+"""
+
+import argparse
+import asyncio
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+_WORK_DIR = tempfile.mkdtemp(prefix="gate-e2e-")
+
+
+def _configure(args):
+    """Environment has to be set before config is imported."""
+    os.environ["LLM_PROVIDER"] = "fake"
+    os.environ["FAKE_LLM_LATENCY"] = args.latency
+    os.environ["STORAGE_BACKEND"] = args.backend
+    os.environ["DATA_DIR"] = os.path.join(_WORK_DIR, "users")
+    os.environ["SQLITE_PATH"] = os.path.join(_WORK_DIR, "gate.db")
+    os.environ["ARCHIVE_DIR"] = os.path.join(_WORK_DIR, "archive")
+    os.environ["RATE_LIMIT_STATE_PATH"] = os.path.join(_WORK_DIR, "rate_limits.json")
+    os.environ["KNOWLEDGE_INDEX_PATH"] = os.path.join(_WORK_DIR, "knowledge_index.json")
+    os.environ.setdefault("OPENAI_API_KEY", "e2e-bench")
+    os.environ.setdefault("TELEGRAM_BOT_TOKEN", "e2e-bench")
+
+
+SCRIPT = [
+    "hey",
+    "i want to start running in the mornings but i keep snoozing my alarm",
+    "honestly i don't know what's stopping me",
+    "i have like 20 minutes before work",
+    "done",
+    "that's not the problem, the problem is i get distracted by my phone",
+    "ok i did it",
+    "what's the point if I fail again anyway",
+]
+
+
+class FileIOCounter:
+    """Counts file opens and renames under one directory via sys.addaudithook."""
+
+    def __init__(self, root: str):
+        self.root = os.path.realpath(root)
+        self.counts = Counter()
+        self.active = False
+        self._lock = threading.Lock()
+        sys.addaudithook(self._hook)
+
+    def _hook(self, event, args):
+        if not self.active or event not in ("open", "os.rename", "sqlite3.connect"):
+            return
+        path = args[0] if args else None
+        if not isinstance(path, (str, bytes, os.PathLike)) or not os.fsdecode(path).startswith(self.root):
+            return
+        if event == "open":
+            mode, flags = args[1], args[2]
+            if mode is not None:
+                writes = any(c in mode for c in "wax+")
+            else:
+                writes = bool(flags & (os.O_WRONLY | os.O_RDWR))
+            key = "open_write" if writes else "open_read"
+        else:
+            key = "rename" if event == "os.rename" else "sqlite_connect"
+        with self._lock:
+            self.counts[key] += 1
+
+
+class FakeMessage:
+    """Just enough of telegram.Message for the handlers."""
+
+    def __init__(self, text: str, calls: Counter):
+        self.text = text
+        self._calls = calls
+
+    async def reply_text(self, text: str, **kwargs):
+        self._calls["send"] += 1
+        return FakeMessage(text, self._calls)
+
+    async def edit_text(self, text: str, **kwargs):
+        self._calls["edit"] += 1
+        self.text = text
+        return self
+
+
+def fake_update(user_id: int, text: str, calls: Counter):
+    return SimpleNamespace(
+        effective_user=SimpleNamespace(id=user_id, username=f"user{user_id}"),
+        message=FakeMessage(text, calls)
+    )
+
+
+def check_legacy_user(backend_name: str, messages: int = 500, keep: int = 100):
+    """A pre-id history.json user: archived + live must be the original history, and the summary must keep folding."""
+    import json
+    from config import DATA_DIR
+    from core.summary import pending_span
+    from engine.response import engine
+    from memory import archive
+    from memory.backends import get_backend
+    from memory.backends.json_files import JsonFileBackend, LEGACY_FILE
+    from memory.backends.migrate import migrate_user
+    from memory.session import session_cache
+
+    user_id = "legacy-user"
+    original = [
+        {
+            "role": "user" if i % 2 else "assistant",
+            "content": f"legacy message {i}",
+            # Spread over a few months so the archive writes several segments
+            "timestamp": f"2024-{1 + i * 3 // messages:02d}-15T09:00:00"
+        }
+        for i in range(messages)
+    ]
+    user_dir = DATA_DIR / user_id
+    user_dir.mkdir(parents=True, exist_ok=True)
+    (user_dir / LEGACY_FILE).write_text(json.dumps(original))
+    if backend_name == "sqlite":
+        migrate_user(JsonFileBackend(DATA_DIR), get_backend(), user_id)
+
+    archived = archive.compact_user(user_id, keep=keep)
+    assert archived == messages - keep, f"archived {archived}, expected {messages - keep}"
+    stored = archive.load_archived(user_id) + get_backend().load_messages(user_id)
+    assert [m["content"] for m in stored] == [m["content"] for m in original], "archived + live != original"
+    assert [m["id"] for m in stored] == list(range(1, messages + 1)), "ids are not 1..n"
+
+    folds = 0
+    while True:
+        session = session_cache.get(user_id)
+        before = (session.state.get("summary") or {}).get("through")
+        if pending_span(session.state.get("summary") or {}, session.message_count) is None:
+            break
+        engine._update_summary(user_id)
+        summary = session_cache.get(user_id).state.get("summary") or {}
+        assert summary.get("text"), f"fold {folds + 1} stored no summary text"
+        assert summary["through"] > (before or 0), f"fold {folds + 1} did not advance"
+        folds += 1
+    assert folds, "no summary fold was due"
+    print(f"legacy user: {archived} archived + {keep} live == {messages} original, "
+          f"{folds} summary folds through message {summary['through']}")
+
+
+def percentile(samples, p):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * p))]
+
+
+async def run_concurrent(turn, users: int, messages: int, concurrency: int, latencies: list):
+    """Each user sends their script in order; up to `concurrency` users at once."""
+    gate = asyncio.Semaphore(concurrency)
+
+    async def one_user(u: int):
+        async with gate:
+            for m in range(messages):
+                started = time.perf_counter()
+                await turn(100000 + u, SCRIPT[m % len(SCRIPT)])
+                latencies.append(time.perf_counter() - started)
+
+    await asyncio.gather(*(one_user(u) for u in range(users)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--mode", choices=("sync", "async", "telegram"), default="async")
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--messages", type=int, default=5, help="messages per user")
+    parser.add_argument("--concurrency", type=int, default=250, help="users in flight at once (async/telegram)")
+    parser.add_argument("--latency", default="lognormal:0.05:0.3", help="fake LLM latency distribution")
+    parser.add_argument("--backend", choices=("json", "sqlite"), default="json")
+    args = parser.parse_args()
+
+    _configure(args)
+
+    import logging
+    logging.disable(logging.WARNING)
+
+    from core.agent import gate_agent
+    from core.llm import llm_client
+    from core.metrics import llm_metrics
+    from core.security import rate_limiter
+    from engine.response import engine
+    from memory.session import session_cache
+
+    # Keep the rate limiter out of the measurement (and its exit snapshot out of the deleted work dir)
+    rate_limiter.get_user_limits = lambda user_id: (10**6, 10**6)
+    rate_limiter.state_path = None
+    # Prefix, tokenizer and knowledge index load on first use - not inside the measurement
+    gate_agent.warm()
+
+    io = FileIOCounter(_WORK_DIR)
+    telegram_calls = Counter()
+    latencies = []
+
+    print(f"mode={args.mode} backend={args.backend} users={args.users} messages/user={args.messages} "
+          f"latency={args.latency}")
+
+    try:
+        io.active = True
+        start = time.perf_counter()
+
+        if args.mode == "sync":
+            for m in range(args.messages):
+                for u in range(args.users):
+                    started = time.perf_counter()
+                    engine.process_message(str(100000 + u), SCRIPT[m % len(SCRIPT)])
+                    latencies.append(time.perf_counter() - started)
+            elapsed = time.perf_counter() - start
+            # Background extraction threads
+            for thread in threading.enumerate():
+                if thread.name.startswith("after-reply-"):
+                    thread.join()
+        else:
+            if args.mode == "async":
+                async def turn(user_id: int, text: str):
+                    await engine.process_message_async(str(user_id), text)
+            else:
+                import bot
+
+                async def turn(user_id: int, text: str):
+                    await bot.handle_text_message(fake_update(user_id, text, telegram_calls), None)
+
+            async def run():
+                await run_concurrent(turn, args.users, args.messages, args.concurrency, latencies)
+                done = time.perf_counter() - start
+                # Let background extraction finish so its I/O is counted
+                while engine._background:
+                    await asyncio.gather(*list(engine._background), return_exceptions=True)
+                return done
+
+            elapsed = asyncio.run(run())
+
+        session_cache.flush()
+        io.active = False
+        total = len(latencies)
+
+        print(f"{total} turns in {elapsed:.2f}s -> {total / elapsed:,.0f} msgs/sec")
+        print(f"turn latency: p50 {percentile(latencies, 0.50) * 1000:.0f} ms, "
+              f"p99 {percentile(latencies, 0.99) * 1000:.0f} ms, max {max(latencies) * 1000:.0f} ms")
+
+        turns = llm_metrics.turn_snapshot()
+        fake_calls = llm_client.client.chat.completions.calls + llm_client.async_client.chat.completions.calls
+        print(f"llm calls: {fake_calls} ({turns['calls_per_turn']:.2f}/turn: "
+              + ", ".join(f"{purpose} {count:.2f}" for purpose, count in sorted(turns["by_purpose"].items())) + ")")
+        if args.mode == "telegram":
+            print(f"telegram api calls: {telegram_calls['send']} sends, {telegram_calls['edit']} edits")
+        print("file i/o under DATA_DIR: " + ", ".join(f"{key} {count:,}" for key, count in sorted(io.counts.items()))
+              + f" ({sum(io.counts.values()) / total:.1f} per turn)")
+
+        perf = llm_metrics.perf_snapshot()
+        print(f"storage bytes per turn: {perf['bytes_read_per_turn']:,.0f} read, {perf['bytes_written_per_turn']:,.0f} written")
+        print("stages (p50 / p99 ms):")
+        for name, stats in perf["stages"].items():
+            print(f"  {name:<18} {stats['p50_ms']:>9.2f} / {stats['p99_ms']:>9.2f}")
+
+        check_legacy_user(args.backend)
+    finally:
+        shutil.rmtree(_WORK_DIR, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+"""
+Import-time benchmark - cold start of the bot, workers and harnesses.
+
+Every measurement runs in a fresh interpreter, so nothing is cached in
+sys.modules. For each module in --modules it reports the median wall
+time of `import <module>` over --runs processes, then the heaviest
+imports under the slowest module by cumulative time (python -X importtime).
+Finally it times a cold process through the first turn against the fake
+LLM provider: import, warm-up (LLM clients, system prefix, tokenizer,
+knowledge index) and one reply.
+
+Usage:
+    python benchmarks/import_bench.py [--runs 5] [--top 15] [--modules config,engine.response,bot,webhook]
+"""
+
+import argparse
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+IMPORT_SNIPPET = """
+import time
+started = time.perf_counter()
+import {module}
+print(time.perf_counter() - started)
+"""
+
+FIRST_TURN_SNIPPET = """
+import asyncio, json, logging, time
+logging.disable(logging.WARNING)
+started = time.perf_counter()
+import bot
+imported = time.perf_counter()
+bot.warm_up()
+warmed = time.perf_counter()
+from core.security import rate_limiter
+rate_limiter.state_path = None
+asyncio.run(bot.engine.process_message_async("100000", "hey"))
+print(json.dumps({"import": imported - started, "warm_up": warmed - imported, "first_turn": time.perf_counter() - warmed}))
+"""
+
+
+def _env(work_dir: str) -> dict:
+    env = dict(os.environ)
+    env.update({
+        "PYTHONPATH": ROOT,
+        "LLM_PROVIDER": "fake",
+        "FAKE_LLM_LATENCY": "fixed:0",
+        "EXTRACTION_ENABLED": "false",
+        "DATA_DIR": os.path.join(work_dir, "users"),
+        "RATE_LIMIT_STATE_PATH": os.path.join(work_dir, "rate_limits.json"),
+        "KNOWLEDGE_INDEX_PATH": os.path.join(work_dir, "knowledge_index.json"),
+    })
+    env.setdefault("OPENAI_API_KEY", "import-bench")
+    env.setdefault("TELEGRAM_BOT_TOKEN", "import-bench")
+    return env
+
+
+def _run(args, env) -> subprocess.CompletedProcess:
+    return subprocess.run([sys.executable, *args], cwd=ROOT, env=env, capture_output=True, text=True, check=True)
+
+
+def import_times(module: str, runs: int, env: dict) -> list:
+    snippet = IMPORT_SNIPPET.format(module=module)
+    return [float(_run(["-c", snippet], env).stdout.split()[-1]) for _ in range(runs)]
+
+
+def heaviest(module: str, top: int, env: dict) -> list:
+    """(cumulative us, self us, name) for the slowest imports under `import module`."""
+    stderr = _run(["-X", "importtime", "-c", f"import {module}"], env).stderr
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        own, cumulative, name = (part.strip() for part in line[len("import time:"):].split("|"))
+        if own.isdigit():
+            rows.append((int(cumulative), int(own), name))
+    return sorted(rows, reverse=True)[:top]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=15)
+    parser.add_argument("--modules", default="config,engine.response,bot,webhook")
+    args = parser.parse_args()
+
+    work_dir = tempfile.mkdtemp(prefix="gate-import-")
+    env = _env(work_dir)
+    modules = args.modules.split(",")
+
+    try:
+        # One untimed run so .pyc files exist - a deployed worker doesn't compile on start
+        for module in modules:
+            _run(["-c", f"import {module}"], env)
+
+        print(f"import time, median of {args.runs} fresh processes:")
+        medians = {}
+        for module in modules:
+            samples = import_times(module, args.runs, env)
+            medians[module] = statistics.median(samples)
+            print(f"  {module:<18} {medians[module] * 1000:7.0f} ms  (min {min(samples) * 1000:.0f})")
+
+        slowest = max(medians, key=medians.get)
+        print(f"\nheaviest imports under `import {slowest}` (cumulative / self ms):")
+        for cumulative, own, name in heaviest(slowest, args.top, env):
+            print(f"  {cumulative / 1000:7.1f} {own / 1000:7.1f}  {name}")
+
+        first = json.loads(_run(["-c", FIRST_TURN_SNIPPET], env).stdout.splitlines()[-1])
+        print(f"\ncold process to first reply (fake provider): import {first['import'] * 1000:.0f} ms, "
+              f"warm_up {first['warm_up'] * 1000:.0f} ms, first turn {first['first_turn'] * 1000:.0f} ms")
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
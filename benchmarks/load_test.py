@@ -0,0 +1,120 @@
+"""
+Load test - concurrent chats through ResponseEngine.
+
+Swaps the OpenAI clients for a stub that sleeps like a real completion,
+then drives N simulated users at once. Compares the blocking path
+(process_message, one turn at a time - what the handlers used to do)
+with process_message_async running every user concurrently.
+
+Usage:
+    python benchmarks/load_test.py [--latency 0.5] [--messages 3] [--users 1,5,10,25,50]
+"""
+
+import argparse
+import asyncio
+import os
+import shutil
+import sys
+import tempfile
+import time
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Isolated data dir + dummy key so nothing touches real users or the network
+_DATA_DIR = tempfile.mkdtemp(prefix="gate-load-")
+os.environ["DATA_DIR"] = _DATA_DIR
+os.environ["SQLITE_PATH"] = os.path.join(_DATA_DIR, "gate.db")
+os.environ["RATE_LIMIT_STATE_PATH"] = os.path.join(_DATA_DIR, "rate_limits.json")
+os.environ["KNOWLEDGE_INDEX_PATH"] = os.path.join(_DATA_DIR, "knowledge_index.json")
+# Reply path only - background extraction would just add stub calls
+os.environ["EXTRACTION_ENABLED"] = "false"
+os.environ.setdefault("OPENAI_API_KEY", "load-test")
+
+from core.agent import gate_agent  # noqa: E402
+from core.llm import llm_client  # noqa: E402
+from core.security import rate_limiter  # noqa: E402
+from engine.response import engine  # noqa: E402
+
+
+def _completion(text: str):
+    return SimpleNamespace(
+        choices=[SimpleNamespace(message=SimpleNamespace(content=text))],
+        usage=None
+    )
+
+
+class _SyncCompletions:
+    def __init__(self, latency: float):
+        self.latency = latency
+
+    def create(self, **kwargs):
+        time.sleep(self.latency)
+        return _completion("what's actually stopping you")
+
+
+class _AsyncCompletions:
+    def __init__(self, latency: float):
+        self.latency = latency
+
+    async def create(self, **kwargs):
+        await asyncio.sleep(self.latency)
+        return _completion("what's actually stopping you")
+
+
+def install_stub(latency: float):
+    llm_client.client = SimpleNamespace(chat=SimpleNamespace(completions=_SyncCompletions(latency)))
+    llm_client.async_client = SimpleNamespace(chat=SimpleNamespace(completions=_AsyncCompletions(latency)))
+
+
+def run_blocking(users: int, messages: int) -> float:
+    """Every turn in series - the old handler behaviour on one event loop."""
+    start = time.perf_counter()
+    for m in range(messages):
+        for u in range(users):
+            engine.process_message(f"sync_{users}_{u}", f"message {m}")
+    return time.perf_counter() - start
+
+
+async def run_async(users: int, messages: int) -> float:
+    """Each user sends their messages in order; users run concurrently."""
+    async def one_user(u: int):
+        for m in range(messages):
+            await engine.process_message_async(f"async_{users}_{u}", f"message {m}")
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one_user(u) for u in range(users)))
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--latency", type=float, default=0.5, help="simulated LLM latency in seconds")
+    parser.add_argument("--messages", type=int, default=3, help="messages per user")
+    parser.add_argument("--users", default="1,5,10,25,50", help="comma-separated concurrency levels")
+    parser.add_argument("--skip-blocking", action="store_true", help="only run the async path")
+    args = parser.parse_args()
+
+    install_stub(args.latency)
+    gate_agent.warm()
+    # Keep the rate limiter out of the measurement
+    rate_limiter.get_user_limits = lambda user_id: (10**6, 10**6)
+
+    levels = [int(n) for n in args.users.split(",")]
+
+    print(f"simulated LLM latency: {args.latency}s, {args.messages} messages/user")
+    print(f"{'users':>6} {'path':>9} {'seconds':>9} {'msgs/sec':>9}")
+    try:
+        for users in levels:
+            total = users * args.messages
+            if not args.skip_blocking:
+                elapsed = run_blocking(users, args.messages)
+                print(f"{users:>6} {'blocking':>9} {elapsed:>9.2f} {total / elapsed:>9.1f}")
+            elapsed = asyncio.run(run_async(users, args.messages))
+            print(f"{users:>6} {'async':>9} {elapsed:>9.2f} {total / elapsed:>9.1f}")
+    finally:
+        shutil.rmtree(_DATA_DIR, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
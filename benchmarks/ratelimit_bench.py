@@ -0,0 +1,109 @@
+"""
+Rate limiter benchmark - per-user datetime lists vs fixed buckets.
+
+Tracks --users users, then times random check_rate_limit calls against a
+frozen copy of the old list-based limiter and the current one, and
+reports memory held per tracked user plus the snapshot/restore cost.
+
+Usage:
+    python benchmarks/ratelimit_bench.py [--users 50000] [--history 20] [--checks 200000]
+"""
+
+import argparse
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+from pathlib import Path
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+_WORK_DIR = Path(tempfile.mkdtemp(prefix="gate-ratelimit-"))
+os.environ["DATA_DIR"] = str(_WORK_DIR / "users")
+os.environ["RATE_LIMIT_STATE_PATH"] = str(_WORK_DIR / "rate_limits.json")
+
+from core.security import RateLimiter  # noqa: E402
+
+# High enough that nobody gets limited - we're timing the bookkeeping
+PER_MINUTE, PER_HOUR = 10**6, 10**6
+
+
+class LegacyRateLimiter:
+    """RateLimiter before fixed buckets: a list of datetimes per user."""
+
+    def __init__(self):
+        self.user_requests = {}
+
+    def check_rate_limit(self, user_id):
+        now = datetime.now()
+        if user_id not in self.user_requests:
+            self.user_requests[user_id] = []
+        cutoff = now - timedelta(hours=1)
+        self.user_requests[user_id] = [ts for ts in self.user_requests[user_id] if ts > cutoff]
+        minute_ago = now - timedelta(minutes=1)
+        recent_minute = [ts for ts in self.user_requests[user_id] if ts > minute_ago]
+        if len(recent_minute) >= PER_MINUTE:
+            return False, "Too many messages. Slow down."
+        if len(self.user_requests[user_id]) >= PER_HOUR:
+            return False, "Hourly limit reached. Try again later."
+        self.user_requests[user_id].append(now)
+        return True, None
+
+
+def populate(limiter, user_ids, history: int):
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    for _ in range(history):
+        for user_id in user_ids:
+            limiter.check_rate_limit(user_id)
+    used = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    return used
+
+
+def time_checks(limiter, user_ids, checks: int) -> float:
+    rng = random.Random(3)
+    sample = [rng.choice(user_ids) for _ in range(checks)]
+    start = time.perf_counter()
+    for user_id in sample:
+        limiter.check_rate_limit(user_id)
+    return checks / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=50000)
+    parser.add_argument("--history", type=int, default=20, help="requests per user before timing")
+    parser.add_argument("--checks", type=int, default=200000)
+    args = parser.parse_args()
+
+    user_ids = [str(100000 + u) for u in range(args.users)]
+    current = RateLimiter(_WORK_DIR / "rate_limits.json", snapshot_seconds=float("inf"))
+    current.get_user_limits = lambda user_id: (PER_MINUTE, PER_HOUR)
+
+    print(f"{args.users} users x {args.history} requests, {args.checks} timed checks")
+    print(f"{'limiter':>8} {'checks/sec':>12} {'bytes/user':>11}")
+    try:
+        for name, limiter in (("legacy", LegacyRateLimiter()), ("buckets", current)):
+            used = populate(limiter, user_ids, args.history)
+            rate = time_checks(limiter, user_ids, args.checks)
+            print(f"{name:>8} {rate:>12,.0f} {used / args.users:>11,.0f}")
+
+        start = time.perf_counter()
+        current.save()
+        save_ms = (time.perf_counter() - start) * 1000
+        start = time.perf_counter()
+        restored = RateLimiter(_WORK_DIR / "rate_limits.json")
+        load_ms = (time.perf_counter() - start) * 1000
+        size = (_WORK_DIR / "rate_limits.json").stat().st_size
+        print(f"snapshot {save_ms:.0f} ms, restore {load_ms:.0f} ms ({len(restored)} users, {size / 1e6:.1f} MB)")
+    finally:
+        shutil.rmtree(_WORK_DIR, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
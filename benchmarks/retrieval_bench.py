@@ -0,0 +1,103 @@
+"""
+Knowledge retrieval benchmark - BM25 index over the real knowledge/ corpus.
+
+Times a cold build (chunk + index + persist), a warm load of the persisted
+index, and per-query search latency for coaching-chat style messages,
+then prints the top hits for a few sample queries as a sanity check.
+
+Usage:
+    python benchmarks/retrieval_bench.py [--queries 20000] [--k 2]
+"""
+
+import argparse
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+_WORK_DIR = Path(tempfile.mkdtemp(prefix="gate-retrieval-"))
+os.environ["DATA_DIR"] = str(_WORK_DIR / "users")
+os.environ["KNOWLEDGE_INDEX_PATH"] = str(_WORK_DIR / "knowledge_index.json")
+
+from config import KNOWLEDGE_DIR  # noqa: E402
+from core.retrieval import KnowledgeIndex  # noqa: E402
+
+QUERIES = [
+    "hey",
+    "done",
+    "i want to start running in the mornings but i keep snoozing my alarm",
+    "honestly i don't know what's stopping me, i just never get around to it",
+    "my goal is to finish the first draft of my thesis by march",
+    "that's not the problem, the problem is i get distracted by my phone",
+    "tbh i feel kinda stuck, work has been crazy and i haven't touched it in 4 days",
+    "can we talk about something else? my manager moved the deadline up",
+    "what's the point if I fail again anyway",
+    "i spent 3 hours on youtube instead of studying, again",
+    "my team keeps missing deadlines and i don't know how to tell them",
+    "i'm motivated for a week and then it just fades",
+    "everything feels like a bottleneck, where do i even start",
+    "i keep losing energy in the afternoon and nothing gets done",
+    "should i focus on one thing or try a bunch of small bets",
+]
+
+
+def percentile(samples, p):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * p))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--queries", type=int, default=20000)
+    parser.add_argument("--k", type=int, default=2)
+    args = parser.parse_args()
+
+    index_path = _WORK_DIR / "knowledge_index.json"
+    corpus_bytes = sum(path.stat().st_size for path in Path(KNOWLEDGE_DIR).glob("*.md"))
+
+    try:
+        start = time.perf_counter()
+        KnowledgeIndex(KNOWLEDGE_DIR, index_path).load()
+        build_ms = (time.perf_counter() - start) * 1000
+
+        index = KnowledgeIndex(KNOWLEDGE_DIR, index_path)
+        start = time.perf_counter()
+        index.load()
+        load_ms = (time.perf_counter() - start) * 1000
+
+        print(f"corpus {corpus_bytes / 1e3:.0f} KB -> {len(index.chunks)} chunks, {len(index.postings)} terms, "
+              f"index {index_path.stat().st_size / 1e3:.0f} KB")
+        print(f"cold build {build_ms:.0f} ms, warm load {load_ms:.0f} ms")
+
+        rng = random.Random(0)
+        latencies = []
+        for _ in range(args.queries):
+            query = rng.choice(QUERIES)
+            start = time.perf_counter()
+            index.search(query, k=args.k)
+            latencies.append((time.perf_counter() - start) * 1e6)
+
+        print(f"{args.queries} queries, k={args.k}: "
+              f"mean {sum(latencies) / len(latencies):.0f} us, "
+              f"p50 {percentile(latencies, 0.50):.0f} us, "
+              f"p99 {percentile(latencies, 0.99):.0f} us")
+
+        print()
+        for query in QUERIES[2:6]:
+            print(f"{query!r}")
+            results = index.search(query, k=args.k)
+            for score, chunk in results:
+                print(f"  {score:5.1f}  {chunk['source']}: {chunk['heading'][:70]}")
+            if not results:
+                print("  (nothing above KNOWLEDGE_MIN_SCORE)")
+    finally:
+        shutil.rmtree(_WORK_DIR, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
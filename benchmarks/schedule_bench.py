@@ -0,0 +1,117 @@
+"""
+Due-message polling benchmark - directory scan vs ScheduleIndex.
+
+Writes --users users with a scheduled.json each (--due-pct of them due
+now, the rest spread over the next three days), then times:
+- the old poll: read every user's scheduled.json
+- building the index from those files (one-off, first start)
+- a poll through the index
+- re-arming users' pings (index_pending per user turn)
+- reloading the index from its journal (every later start)
+
+Usage:
+    python benchmarks/schedule_bench.py [--users 100000] [--due-pct 1] [--updates 10000]
+"""
+
+import argparse
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+_WORK_DIR = Path(tempfile.mkdtemp(prefix="gate-schedule-"))
+os.environ["DATA_DIR"] = str(_WORK_DIR / "users")
+
+from memory.backends.json_files import JsonFileBackend  # noqa: E402
+from memory.backends.schedule_index import ScheduleIndex  # noqa: E402
+from memory.storage import read_json  # noqa: E402
+
+
+def pending_for(now: datetime, due: bool) -> list:
+    if due:
+        send_at = now - timedelta(minutes=random.randint(1, 60))
+    else:
+        send_at = now + timedelta(minutes=random.randint(1, 3 * 24 * 60))
+    return [{"id": 1, "type": "soft_ping", "send_at": send_at.isoformat(), "status": "pending"}]
+
+
+def populate(data_dir: Path, users: int, due_pct: float, now: datetime):
+    # Plain writes: this is fixture setup, not what's being measured
+    due_every = max(1, int(100 / due_pct)) if due_pct else 0
+    for u in range(users):
+        user_dir = data_dir / str(100000 + u)
+        user_dir.mkdir(parents=True)
+        pending = pending_for(now, due=bool(due_every) and u % due_every == 0)
+        (user_dir / "scheduled.json").write_text(json.dumps({"pending": pending, "sent": []}))
+
+
+def scan_due(data_dir: Path, now: datetime) -> list:
+    """The pre-index JsonFileBackend.due_pending."""
+    due = []
+    for user_dir in data_dir.iterdir():
+        scheduled_file = user_dir / "scheduled.json"
+        if not scheduled_file.exists():
+            continue
+        scheduled = read_json(scheduled_file, lambda: {"pending": []})
+        for msg in scheduled.get("pending", []):
+            if datetime.fromisoformat(msg["send_at"]) <= now:
+                due.append((user_dir.name, msg))
+    return due
+
+
+def timed(fn, *args):
+    start = time.perf_counter()
+    result = fn(*args)
+    return result, (time.perf_counter() - start) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=100000)
+    parser.add_argument("--due-pct", type=float, default=1.0, help="percent of users due at poll time")
+    parser.add_argument("--updates", type=int, default=10000, help="index_pending calls to time")
+    args = parser.parse_args()
+
+    data_dir = _WORK_DIR / "users"
+    now = datetime.now()
+    try:
+        print(f"populating {args.users} users ({args.due_pct}% due)...")
+        populate(data_dir, args.users, args.due_pct, now)
+
+        scan, scan_ms = timed(scan_due, data_dir, now)
+
+        backend = JsonFileBackend(data_dir)
+        _, build_ms = timed(lambda: backend.schedule_index)
+        indexed, poll_ms = timed(backend.due_pending, now)
+        _, idle_poll_ms = timed(backend.due_pending, now - timedelta(days=1))
+
+        user_ids = [str(100000 + u) for u in range(args.users)]
+        start = time.perf_counter()
+        for _ in range(args.updates):
+            backend.index_pending(random.choice(user_ids), pending_for(now, due=False))
+        update_us = (time.perf_counter() - start) / args.updates * 1e6
+
+        index_path = backend.schedule_index.path
+        _, reload_ms = timed(ScheduleIndex, index_path)
+
+        assert sorted(u for u, _ in scan) == sorted(u for u, _ in indexed), "index disagrees with scan"
+
+        print(f"{'directory scan poll':<28} {scan_ms:>10.1f} ms  ({len(scan)} due)")
+        print(f"{'index build (first start)':<28} {build_ms:>10.1f} ms")
+        print(f"{'index reload (journal)':<28} {reload_ms:>10.1f} ms  ({index_path.stat().st_size / 1e6:.1f} MB)")
+        print(f"{'index poll':<28} {poll_ms:>10.2f} ms  ({len(indexed)} due)")
+        print(f"{'index poll, nothing due':<28} {idle_poll_ms:>10.3f} ms")
+        print(f"{'index_pending':<28} {update_us:>10.1f} us/call")
+    finally:
+        shutil.rmtree(_WORK_DIR, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,133 @@
+"""
+Storage benchmark - writes/sec under concurrent same-user traffic.
+
+Several threads (and optionally processes) hammer ONE user with a
+read-modify-write cycle: load state.json, bump a counter, save it.
+
+- legacy: the old pattern (open 'w' + json.dump in place, no lock)
+- atomic: memory.storage (temp file + fsync + rename under user_lock)
+
+Reports writes/sec, lost updates (final counter vs. expected) and
+reads that hit a truncated/corrupt file.
+
+Usage:
+    python benchmarks/storage_bench.py [--threads 8] [--writes 200] [--processes 2]
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Worker processes re-import this module under spawn; reuse the parent's dir
+_DATA_DIR = os.environ.get("GATE_STORAGE_BENCH_DIR") or tempfile.mkdtemp(prefix="gate-storage-")
+os.environ["GATE_STORAGE_BENCH_DIR"] = _DATA_DIR
+os.environ["DATA_DIR"] = _DATA_DIR
+
+from config import DATA_DIR  # noqa: E402
+from memory.storage import atomic_write_json, read_json, user_lock  # noqa: E402
+
+USER_ID = "bench_user"
+
+
+def _state_file():
+    user_dir = DATA_DIR / USER_ID
+    user_dir.mkdir(parents=True, exist_ok=True)
+    return user_dir / "state.json"
+
+
+def legacy_increment(errors: list):
+    path = _state_file()
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            state = json.load(f)
+    except (json.JSONDecodeError, IOError):
+        errors.append(1)
+        state = {"counter": 0}
+    state["counter"] = state.get("counter", 0) + 1
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(state, f, indent=2, ensure_ascii=False)
+
+
+def atomic_increment(errors: list):
+    path = _state_file()
+    with user_lock(USER_ID):
+        state = read_json(path, lambda: errors.append(1) or {"counter": 0})
+        state["counter"] = state.get("counter", 0) + 1
+        atomic_write_json(path, state)
+
+
+MODES = {"legacy": legacy_increment, "atomic": atomic_increment}
+
+
+def _worker(mode: str, writes: int, threads: int, results):
+    """One process: `threads` threads doing `writes` increments each."""
+    errors = []
+    func = MODES[mode]
+
+    def run():
+        for _ in range(writes):
+            try:
+                func(errors)
+            except OSError:
+                errors.append(1)
+
+    pool = [threading.Thread(target=run) for _ in range(threads)]
+    for t in pool:
+        t.start()
+    for t in pool:
+        t.join()
+    results.put(len(errors))
+
+
+def bench(mode: str, threads: int, writes: int, processes: int):
+    atomic_write_json(_state_file(), {"counter": 0})
+    results = multiprocessing.Queue()
+
+    start = time.perf_counter()
+    procs = [
+        multiprocessing.Process(target=_worker, args=(mode, writes, threads, results))
+        for _ in range(processes)
+    ]
+    for p in procs:
+        p.start()
+    for p in procs:
+        p.join()
+    elapsed = time.perf_counter() - start
+
+    errors = sum(results.get() for _ in procs)
+    expected = threads * writes * processes
+    try:
+        with open(_state_file(), 'r', encoding='utf-8') as f:
+            final = json.load(f).get("counter", 0)
+    except json.JSONDecodeError:
+        final = 0
+    return expected / elapsed, expected - final, errors
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--threads", type=int, default=8, help="threads per process")
+    parser.add_argument("--writes", type=int, default=200, help="increments per thread")
+    parser.add_argument("--processes", type=int, default=2, help="worker processes")
+    args = parser.parse_args()
+
+    print(f"{args.processes} processes x {args.threads} threads x {args.writes} writes, one user")
+    print(f"{'mode':>7} {'writes/sec':>11} {'lost':>7} {'bad reads':>10}")
+    try:
+        for mode in MODES:
+            rate, lost, errors = bench(mode, args.threads, args.writes, args.processes)
+            print(f"{mode:>7} {rate:>11.0f} {lost:>7} {errors:>10}")
+    finally:
+        shutil.rmtree(_DATA_DIR, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
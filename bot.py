@@ -5,11 +5,13 @@ One system prompt. Conversation history. One LLM call.
 """
 
 import asyncio
+import io
 import logging
-import os
-import tempfile
+import time
+from typing import List, Tuple, Union
 
-from telegram import Update, BotCommand
+from telegram import Update, BotCommand, Message
+from telegram.error import BadRequest, RetryAfter
 from telegram.ext import (
     Application,
     CommandHandler,
@@ -17,19 +19,36 @@ from telegram.ext import (
     ContextTypes,
     filters
 )
-from openai import OpenAI
 
 from config import (
     TELEGRAM_BOT_TOKEN,
-    OPENAI_API_KEY,
     ELEVENLABS_API_KEY,
     DEFAULT_VOICE_ID,
-    ADMIN_USER_ID
+    ADMIN_USER_ID,
+    REENGAGEMENT_ENABLED,
+    SCHEDULE_POLL_SECONDS,
+    STREAM_RESPONSES,
+    STREAM_EDIT_INTERVAL_SECONDS,
+    METRICS_EXPORT_PATH,
+    METRICS_EXPORT_INTERVAL_SECONDS,
+    EXTRACTION_ENABLED,
+    ARCHIVE_ENABLED,
+    ARCHIVE_INTERVAL_HOURS
 )
+from engine.mailbox import Mailbox
 from engine.response import engine
-from memory.state import load_state, save_state, clear_user_data
-from memory.history import get_message_count
+from memory.state import clear_user_data
+from memory.scheduled import get_due_messages, cancel_pending
+from memory.session import session_cache
+from memory.storage import atomic_write_bytes, async_user_lock
+from memory import archive
 from core.security import rate_limiter
+from core.metrics import llm_metrics
+from core.agent import gate_agent
+from core.llm import llm_client
+from core.transcription import transcriber
+from core.workers import owns
+from core.http import close_pools
 
 # Configure logging
 logging.basicConfig(
@@ -38,25 +57,23 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-# OpenAI client for Whisper
-openai_client = OpenAI(api_key=OPENAI_API_KEY) if OPENAI_API_KEY else None
-
 
 async def start_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handle /start command."""
     user_id = str(update.effective_user.id)
-    username = update.effective_user.username or None
 
-    # Process as first message
-    result = engine.process_message(user_id, "hey", username=username)
-    await update.message.reply_text(result['response'])
+    # Process as first message, queued like any other so it can't race a turn in flight
+    await mailbox.submit(user_id, (update, "hey"))
 
 
 async def clear_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handle /clear command - delete all user data."""
     user_id = str(update.effective_user.id)
 
-    success = clear_user_data(user_id)
+    # Wait out a turn in flight and its background writes, so nothing recreates data after the wipe
+    async with async_user_lock(user_id):
+        await engine.settle(user_id)
+        success = await asyncio.to_thread(clear_user_data, user_id)
 
     if success:
         await update.message.reply_text("cleared. /start to begin again")
@@ -68,9 +85,10 @@ async def stats_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handle /stats command - show simple stats."""
     user_id = str(update.effective_user.id)
 
-    state = load_state(user_id)
-    message_count = get_message_count(user_id)
-    user_data = state.get("user", {})
+    session = await asyncio.to_thread(session_cache.get, user_id)
+    with session.lock:
+        message_count = session.message_count
+        user_data = dict(session.state.get("user", {}))
 
     name = user_data.get("name", "unknown")
     commitment = user_data.get("commitment", "none")
@@ -101,7 +119,11 @@ ADMIN:
 /limit <user_id> <per_min> <per_hour> - set user limits
 /limit <user_id> - view user limits
 /unlimit <user_id> - remove custom limits
-/users - list users with custom limits"""
+/users - list users with custom limits
+/cache - prompt/response cache hit rates, savings and llm calls per turn
+/llm - llm latency percentiles, retries, hedges and circuit state
+/perf - p50/p99 per turn stage, storage bytes and tokens per turn
+/perf json | prom - full metrics export as a file"""
 
     await update.message.reply_text(help_text)
 
@@ -139,7 +161,7 @@ async def admin_limit_command(update: Update, context: ContextTypes.DEFAULT_TYPE
         per_min = int(args[1]) if len(args) > 1 else None
         per_hr = int(args[2]) if len(args) > 2 else None
 
-        rate_limiter.set_user_limit(target_user, per_minute=per_min, per_hour=per_hr)
+        await asyncio.to_thread(rate_limiter.set_user_limit, target_user, per_min, per_hr)
 
         await update.message.reply_text(
             f"set limits for {target_user}:\n"
@@ -163,7 +185,7 @@ async def admin_unlimit_command(update: Update, context: ContextTypes.DEFAULT_TY
         return
 
     target_user = context.args[0]
-    rate_limiter.remove_user_limit(target_user)
+    await asyncio.to_thread(rate_limiter.remove_user_limit, target_user)
     await update.message.reply_text(f"removed custom limits for {target_user} (now using defaults)")
 
 
@@ -188,58 +210,279 @@ async def admin_users_command(update: Update, context: ContextTypes.DEFAULT_TYPE
     await update.message.reply_text("\n".join(lines))
 
 
+async def admin_cache_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Handle /cache command - admin only. Prompt cache usage since startup."""
+    user_id = str(update.effective_user.id)
+
+    if user_id != ADMIN_USER_ID:
+        await update.message.reply_text("not authorized")
+        return
+
+    snapshot = llm_metrics.snapshot()
+    response_cache = gate_agent.response_cache.stats() if gate_agent.response_cache else None
+    if not snapshot and not (response_cache and response_cache["lookups"]):
+        await update.message.reply_text("no llm calls yet")
+        return
+
+    lines = ["prompt cache since startup:"]
+    for purpose, stats in snapshot.items():
+        hit_ms = f"{stats['hit_latency_ms']:.0f}ms" if stats["hit_latency_ms"] is not None else "-"
+        miss_ms = f"{stats['miss_latency_ms']:.0f}ms" if stats["miss_latency_ms"] is not None else "-"
+        lines.append(
+            f"  {purpose}: {stats['cache_hits']}/{stats['calls']} calls hit, "
+            f"{stats['cached_tokens']}/{stats['prompt_tokens']} tokens cached ({stats['cached_ratio']:.0%}), "
+            f"saved ${stats['saved_usd']:.4f}, latency hit {hit_ms} / miss {miss_ms}"
+        )
+
+    turns = llm_metrics.turn_snapshot()
+    if turns["turns"]:
+        per_purpose = ", ".join(f"{purpose} {count:.2f}" for purpose, count in sorted(turns["by_purpose"].items()))
+        lines.append(f"llm calls per turn: {turns['calls_per_turn']:.2f} ({per_purpose}) over {turns['turns']} turns")
+
+    if response_cache:
+        lines.append(
+            f"response cache: {response_cache['hits']}/{response_cache['lookups']} hits ({response_cache['hit_rate']:.0%}) "
+            f"= {response_cache['hits']} llm calls saved, {response_cache['entries']} entries, "
+            f"{response_cache['evictions']} evicted"
+        )
+
+    coalesced = llm_metrics.latency_snapshot().get("reply", {}).get("events", {}).get("coalesced", 0)
+    if coalesced:
+        saved = f"{coalesced} reply" + (f" + {coalesced} extraction" if EXTRACTION_ENABLED else "")
+        lines.append(f"coalescing: {coalesced} messages merged into earlier turns = {saved} calls saved")
+
+    voice = transcriber.stats()
+    if voice["hits"] or voice["misses"]:
+        lines.append(
+            f"voice transcripts: {voice['hits']}/{voice['hits'] + voice['misses']} reused ({voice['hit_rate']:.0%}), "
+            f"{voice['entries']} cached"
+        )
+
+    await update.message.reply_text("\n".join(lines))
+
+
+async def admin_llm_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Handle /llm command - admin only. Call latency and resilience counters since startup."""
+    user_id = str(update.effective_user.id)
+
+    if user_id != ADMIN_USER_ID:
+        await update.message.reply_text("not authorized")
+        return
+
+    def ms(value):
+        return f"{value:.0f}" if value is not None else "-"
+
+    lines = [f"circuit: {llm_client.breaker.state} ({llm_client.breaker.failures} consecutive failures)"]
+    for purpose, stats in llm_metrics.latency_snapshot().items():
+        events = stats["events"]
+        lines.append(
+            f"  {purpose}: {stats['count']} ok, p50 {ms(stats['p50_ms'])} / p95 {ms(stats['p95_ms'])} / "
+            f"p99 {ms(stats['p99_ms'])} / max {ms(stats['max_ms'])} ms; "
+            f"{events.get('retry', 0)} retries, {events.get('timeout', 0)} timeouts, "
+            f"{events.get('hedge', 0)} hedges ({events.get('hedge_win', 0)} won), "
+            f"{events.get('failure', 0)} failed, {events.get('breaker_open', 0)} short-circuited"
+        )
+
+    await update.message.reply_text("\n".join(lines))
+
+
+async def admin_perf_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Handle /perf command - admin only. Per-stage turn latency since startup, or a metrics export."""
+    user_id = str(update.effective_user.id)
+
+    if user_id != ADMIN_USER_ID:
+        await update.message.reply_text("not authorized")
+        return
+
+    export = context.args[0].lower() if context.args else None
+    if export in ("json", "prom"):
+        data = llm_metrics.export_json() if export == "json" else llm_metrics.prometheus()
+        await update.message.reply_document(
+            document=io.BytesIO(data.encode("utf-8")),
+            filename=f"gate-metrics.{export}"
+        )
+        return
+
+    perf = llm_metrics.perf_snapshot()
+    if not perf["turns"]:
+        await update.message.reply_text("no turns yet")
+        return
+
+    def ms(value):
+        return f"{value:.1f}" if value is not None else "-"
+
+    lines = [f"{perf['turns']} turns since startup (p50 / p99 / max ms, n):"]
+    for name, stats in perf["stages"].items():
+        lines.append(f"  {name}: {ms(stats['p50_ms'])} / {ms(stats['p99_ms'])} / {ms(stats['max_ms'])} ({stats['count']})")
+    lines.append(
+        f"per turn: {perf['bytes_read_per_turn'] / 1024:.1f} KB read, {perf['bytes_written_per_turn'] / 1024:.1f} KB written, "
+        f"{perf['prompt_tokens_per_turn']:.0f} prompt tokens ({perf['cached_tokens_per_turn']:.0f} cached), "
+        f"{perf['completion_tokens_per_turn']:.0f} completion"
+    )
+
+    await update.message.reply_text("\n".join(lines))
+
+
+class StreamingReply:
+    """A placeholder reply edited as the response streams in, at most once per interval."""
+
+    PLACEHOLDER = "..."
+
+    def __init__(self, message: Message, interval: float = STREAM_EDIT_INTERVAL_SECONDS):
+        self.message = message
+        self.interval = interval
+        self.sent: Message = None
+        self.shown = None
+        self.last_edit = 0.0
+
+    async def start(self):
+        self.sent = await self.message.reply_text(self.PLACEHOLDER)
+        self.shown = self.PLACEHOLDER
+        self.last_edit = time.monotonic()
+
+    async def update(self, text: str):
+        """Partial text; only edits when the interval has passed."""
+        if time.monotonic() - self.last_edit >= self.interval:
+            try:
+                await self._edit(text)
+            except Exception as e:
+                # A failed progress edit mustn't abort the reply
+                logger.warning(f"Streaming edit failed: {e}")
+
+    async def finish(self, text: str):
+        """Final text - waits out flood control once so it always lands."""
+        await self._edit(text, wait=True)
+
+    async def _edit(self, text: str, wait: bool = False):
+        if not text or text == self.shown:
+            return
+        self.last_edit = time.monotonic()
+        try:
+            await self.sent.edit_text(text)
+            self.shown = text
+        except RetryAfter as e:
+            if wait:
+                await asyncio.sleep(e.retry_after)
+                await self.sent.edit_text(text)
+                self.shown = text
+            else:
+                # Flood control: skip partial edits until the wait is over
+                self.last_edit = time.monotonic() + e.retry_after
+        except BadRequest as e:
+            if "not modified" not in str(e).lower():
+                raise
+
+
+async def reply_to(update: Update, user_id: str, message: Union[str, List[str]], username: str = None):
+    """Run a message (or a coalesced burst) through the engine and reply, streaming if enabled."""
+    if not STREAM_RESPONSES:
+        result = await engine.process_message_async(user_id, message, username=username)
+        await update.message.reply_text(result['response'])
+        return
+
+    reply = StreamingReply(update.message)
+    await reply.start()
+    result = await engine.process_message_stream(user_id, message, username=username, on_partial=reply.update)
+    await reply.finish(result['response'])
+
+
+async def reply_to_batch(user_id: str, batch: List[Tuple[Update, str]]):
+    """Mailbox handler: one turn for one or more queued messages, answered under the last one."""
+    update = batch[-1][0]
+    messages = [text for _, text in batch]
+    await reply_to(update, user_id, messages[0] if len(messages) == 1 else messages, update.effective_user.username or None)
+
+
+# One turn at a time per user, in order; optionally coalesces bursts (COALESCE_MESSAGES)
+mailbox = Mailbox(reply_to_batch)
+
+
 async def handle_text_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handle regular text messages."""
     user_id = str(update.effective_user.id)
-    message = update.message.text
-    username = update.effective_user.username or None
 
-    # Process through engine
-    result = engine.process_message(user_id, message, username=username)
-    await update.message.reply_text(result['response'])
+    # Process through engine, queued behind any turn already running for this user
+    await mailbox.submit(user_id, (update, update.message.text))
 
 
 async def handle_voice_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handle voice messages - transcribe and process."""
     user_id = str(update.effective_user.id)
-    username = update.effective_user.username or None
 
-    if not openai_client:
+    if not transcriber.enabled:
         await update.message.reply_text("voice not configured")
         return
 
     try:
-        # Download voice file
         voice = update.message.voice
-        file = await context.bot.get_file(voice.file_id)
-
-        with tempfile.NamedTemporaryFile(suffix=".ogg", delete=False) as tmp:
-            await file.download_to_drive(tmp.name)
-            tmp_path = tmp.name
-
-        # Transcribe with Whisper
-        with open(tmp_path, "rb") as audio_file:
-            transcript = openai_client.audio.transcriptions.create(
-                model="whisper-1",
-                file=audio_file
-            )
 
-        # Clean up temp file
-        os.unlink(tmp_path)
+        # Downloaded into memory only on a transcript cache miss
+        async def download() -> bytearray:
+            file = await context.bot.get_file(voice.file_id)
+            return await file.download_as_bytearray()
 
-        transcription = transcript.text
+        transcription = await transcriber.transcribe(voice.file_unique_id, download)
 
-        # Process through engine
-        result = engine.process_message(user_id, transcription, username=username)
-        await update.message.reply_text(result['response'])
+        # Process through engine, in the same queue as text
+        await mailbox.submit(user_id, (update, transcription))
 
     except Exception as e:
         logger.error(f"Voice message error: {e}")
         await update.message.reply_text("couldn't process voice. try text")
 
 
+async def send_due_messages(context: ContextTypes.DEFAULT_TYPE):
+    """Job queue: deliver scheduled re-engagement messages that are due."""
+    due = await asyncio.to_thread(get_due_messages)
+    for user_id, scheduled in due:
+        # Webhook workers each deliver for the users they own
+        if not owns(user_id):
+            continue
+        try:
+            text = await engine.generate_reengagement_async(user_id, scheduled)
+            await context.bot.send_message(chat_id=int(user_id), text=text)
+            await asyncio.to_thread(engine.record_reengagement, user_id, scheduled, text)
+            logger.info(f"Sent {scheduled.get('type')} to {user_id}")
+        except Exception as e:
+            # Blocked bot, deleted chat... don't retry every poll
+            logger.error(f"Scheduled message to {user_id} failed: {e}")
+            await asyncio.to_thread(cancel_pending, user_id, "send_failed")
+
+
+async def export_metrics(context: ContextTypes.DEFAULT_TYPE):
+    """Job queue: write the metrics file for scraping (METRICS_EXPORT_PATH)."""
+    path = METRICS_EXPORT_PATH
+    data = llm_metrics.export_json() if path.endswith(".json") else llm_metrics.prometheus()
+    try:
+        await asyncio.to_thread(atomic_write_bytes, path, data.encode("utf-8"))
+    except OSError as e:
+        logger.error(f"Metrics export to {path} failed: {e}")
+
+
+async def archive_history(context: ContextTypes.DEFAULT_TYPE):
+    """Job queue: move old history to cold storage and evict idle users (memory.archive)."""
+    try:
+        await asyncio.to_thread(archive.run)
+    except Exception as e:
+        logger.error(f"Archive pass failed: {e}")
+
+
+def warm_up():
+    """
+    Build what importing the bot leaves for first use - the LLM clients,
+    system prefix, tokenizer and knowledge index - so the first turn
+    doesn't pay for it.
+    """
+    started = time.perf_counter()
+    llm_client.client
+    llm_client.async_client
+    gate_agent.warm()
+    logger.info(f"Warmed up in {time.perf_counter() - started:.2f}s")
+
+
 async def post_init(application: Application):
     """Set up bot commands after initialization."""
+    await asyncio.to_thread(warm_up)
     commands = [
         BotCommand("start", "begin"),
         BotCommand("clear", "reset everything"),
@@ -249,14 +492,31 @@ async def post_init(application: Application):
     await application.bot.set_my_commands(commands)
 
 
-def main():
-    """Start the bot."""
-    if not TELEGRAM_BOT_TOKEN:
-        logger.error("TELEGRAM_BOT_TOKEN not set")
-        return
-
-    # Create application
-    application = Application.builder().token(TELEGRAM_BOT_TOKEN).post_init(post_init).build()
+async def post_shutdown(application: Application):
+    """Write any pending session and rate limiter state before exit, then close the HTTP pools."""
+    await asyncio.to_thread(session_cache.flush)
+    await asyncio.to_thread(rate_limiter.save)
+    await close_pools()
+
+
+def build_application(polling: bool = True) -> Application:
+    """
+    The Application with every handler and job registered.
+
+    polling=False leaves out the Updater - webhook workers (webhook.py)
+    feed updates into application.update_queue themselves.
+    """
+    # concurrent_updates lets handlers for different chats run in parallel
+    builder = (
+        Application.builder()
+        .token(TELEGRAM_BOT_TOKEN)
+        .post_init(post_init)
+        .post_shutdown(post_shutdown)
+        .concurrent_updates(True)
+    )
+    if not polling:
+        builder = builder.updater(None)
+    application = builder.build()
 
     # Add command handlers
     application.add_handler(CommandHandler("start", start_command))
@@ -268,11 +528,35 @@ def main():
     application.add_handler(CommandHandler("limit", admin_limit_command))
     application.add_handler(CommandHandler("unlimit", admin_unlimit_command))
     application.add_handler(CommandHandler("users", admin_users_command))
+    application.add_handler(CommandHandler("cache", admin_cache_command))
+    application.add_handler(CommandHandler("llm", admin_llm_command))
+    application.add_handler(CommandHandler("perf", admin_perf_command))
 
     # Add message handlers
     application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_text_message))
     application.add_handler(MessageHandler(filters.VOICE, handle_voice_message))
 
+    # Scheduled re-engagement delivery
+    if REENGAGEMENT_ENABLED:
+        application.job_queue.run_repeating(send_due_messages, interval=SCHEDULE_POLL_SECONDS, first=10)
+
+    if METRICS_EXPORT_PATH:
+        application.job_queue.run_repeating(export_metrics, interval=METRICS_EXPORT_INTERVAL_SECONDS, first=METRICS_EXPORT_INTERVAL_SECONDS)
+
+    if ARCHIVE_ENABLED:
+        application.job_queue.run_repeating(archive_history, interval=ARCHIVE_INTERVAL_HOURS * 3600, first=300)
+
+    return application
+
+
+def main():
+    """Start the bot (long polling, one process - see webhook.py for several)."""
+    if not TELEGRAM_BOT_TOKEN:
+        logger.error("TELEGRAM_BOT_TOKEN not set")
+        return
+
+    application = build_application()
+
     # Start the bot
     logger.info("Starting Gate Bot...")
     application.run_polling(allowed_updates=Update.ALL_TYPES)
@@ -26,16 +26,104 @@ OPENAI_API_KEY = os.getenv("OPENAI_API_KEY", "")  # For Whisper transcription
 PRIMARY_MODEL = "gpt-4o"
 
 # Fast model for extraction tasks (OpenAI)
-EXTRACTION_MODEL = "gpt-4o"
+EXTRACTION_MODEL = os.getenv("EXTRACTION_MODEL", "gpt-4o-mini")
+
+# openai | fake (core/fake_llm.py: offline canned replies for benchmarks and local runs)
+LLM_PROVIDER = os.getenv("LLM_PROVIDER", "openai")
+FAKE_LLM_LATENCY = os.getenv("FAKE_LLM_LATENCY", "lognormal:0.6:0.4")   # fixed:s | uniform:lo:hi | lognormal:median:sigma
+FAKE_LLM_SEED = int(os.getenv("FAKE_LLM_SEED", "0"))
+
+# Every completion goes through LLMClient.complete/acomplete (core/llm.py)
+LLM_DEADLINE_SECONDS = 30.0         # Whole call, retries included
+LLM_REPLY_DEADLINE_SECONDS = 20.0   # Tighter for replies a user is waiting on
+LLM_MAX_RETRIES = 2                 # On 429 / 5xx / timeouts / connection errors
+LLM_RETRY_BASE_SECONDS = 0.5        # Full-jitter exponential backoff
+LLM_RETRY_MAX_SECONDS = 8.0
+LLM_HEDGE_ENABLED = os.getenv("LLM_HEDGE_ENABLED", "false").lower() == "true"
+LLM_HEDGE_DELAY_SECONDS = 3.0       # Hedge after this until there are enough samples for p95
+LLM_BREAKER_FAILURES = 5            # Consecutive failures that open the circuit
+LLM_BREAKER_COOLDOWN_SECONDS = 30.0 # Fail fast this long before letting one probe through
+
+# One combined extraction call per turn (classification, facts, episodes), after the reply is sent
+EXTRACTION_ENABLED = os.getenv("EXTRACTION_ENABLED", "true").lower() == "true"
+
+# Reuse replies to short messages when the whole prompt context is identical (e.g. /start's "hey")
+RESPONSE_CACHE_ENABLED = os.getenv("RESPONSE_CACHE_ENABLED", "false").lower() == "true"
+RESPONSE_CACHE_TTL_SECONDS = 3600
+RESPONSE_CACHE_MAX_ENTRIES = 1000
+RESPONSE_CACHE_MAX_MESSAGE_CHARS = 40   # Only messages this short ("hey", "done", "ok") are cached
+
+# Per-user turn queue (engine/mailbox.py): turns for one user always run one at a time.
+# With coalescing, messages that pile up behind a running turn - or arrive within
+# COALESCE_WINDOW_SECONDS of each other - are answered together with one reply
+COALESCE_MESSAGES = os.getenv("COALESCE_MESSAGES", "false").lower() == "true"
+COALESCE_WINDOW_SECONDS = float(os.getenv("COALESCE_WINDOW_SECONDS", "0"))   # 0 = no extra wait
+COALESCE_MAX_MESSAGES = 5
+
+# USD per million input tokens, for prompt-cache savings in core/metrics.py
+INPUT_PRICE_PER_MTOK = 2.50
+CACHED_INPUT_PRICE_PER_MTOK = 1.25
+
+# Shared HTTP connection pools for outbound API clients (core/http.py): OpenAI chat and Whisper
+HTTP_MAX_CONNECTIONS = int(os.getenv("HTTP_MAX_CONNECTIONS", "100"))   # Per process, all hosts
+HTTP_MAX_KEEPALIVE_CONNECTIONS = 20
+HTTP_KEEPALIVE_EXPIRY_SECONDS = float(os.getenv("HTTP_KEEPALIVE_EXPIRY_SECONDS", "60"))  # httpx default is 5s
+HTTP_CONNECT_TIMEOUT_SECONDS = 5.0
+HTTP2_ENABLED = os.getenv("HTTP2_ENABLED", "false").lower() == "true"     # Needs the h2 package
+
+# Stream replies into Telegram, editing one message as tokens arrive
+STREAM_RESPONSES = os.getenv("STREAM_RESPONSES", "true").lower() == "true"
+STREAM_EDIT_INTERVAL_SECONDS = 1.0  # Telegram rate-limits edits; don't edit faster than this
 
 # ============================================================================
 # PATHS
 # ============================================================================
 
 BASE_DIR = Path(__file__).parent
-DATA_DIR = BASE_DIR / "data" / "users"
+DATA_DIR = Path(os.getenv("DATA_DIR", BASE_DIR / "data" / "users"))
 INSTANCES_DIR = BASE_DIR / "instances"
 FRAMEWORKS_DIR = BASE_DIR / "frameworks"
+KNOWLEDGE_DIR = BASE_DIR / "knowledge"
+
+# ============================================================================
+# STORAGE
+# ============================================================================
+
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "json")    # json | sqlite
+SQLITE_PATH = Path(os.getenv("SQLITE_PATH", BASE_DIR / "data" / "gate.db"))
+
+# History archive (memory/archive.py): messages beyond the hot tail move to gzipped
+# monthly JSONL segments, and idle users leave live storage until they come back
+ARCHIVE_ENABLED = os.getenv("ARCHIVE_ENABLED", "false").lower() == "true"
+ARCHIVE_DIR = Path(os.getenv("ARCHIVE_DIR", BASE_DIR / "data" / "archive"))
+HISTORY_HOT_MESSAGES = 200          # Messages kept in live storage per user
+ARCHIVE_BATCH_MESSAGES = 200        # Archive once this many beyond the hot tail have piled up
+ARCHIVE_EVICT_IDLE_DAYS = int(os.getenv("ARCHIVE_EVICT_IDLE_DAYS", "30"))   # 0 = never evict
+ARCHIVE_INTERVAL_HOURS = 6          # How often the bot runs an archive pass
+
+# ============================================================================
+# WEBHOOK / WORKERS
+# ============================================================================
+
+# python webhook.py: Telegram posts updates to WEBHOOK_URL, a small router
+# hands each one to the worker process that owns its user
+WEBHOOK_URL = os.getenv("WEBHOOK_URL", "")              # Public https URL, e.g. https://gate.example.com/telegram
+WEBHOOK_LISTEN = os.getenv("WEBHOOK_LISTEN", "0.0.0.0")
+WEBHOOK_PORT = int(os.getenv("PORT", "8080"))
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET", "")        # Checked against X-Telegram-Bot-Api-Secret-Token
+WEBHOOK_WORKERS = int(os.getenv("WEBHOOK_WORKERS", str(os.cpu_count() or 1)))
+
+# Set by webhook.py in each worker process; None when polling in one process
+WORKER_ID = int(os.environ["WORKER_ID"]) if os.getenv("WORKER_ID") else None
+
+
+def per_worker(path: Path) -> Path:
+    """gate.json -> gate.worker2.json inside worker 2; unchanged in a single process."""
+    path = Path(path)
+    if WORKER_ID is None:
+        return path
+    return path.with_name(f"{path.stem}.worker{WORKER_ID}{path.suffix}")
+
 
 # ============================================================================
 # ADMIN
@@ -43,6 +131,12 @@ FRAMEWORKS_DIR = BASE_DIR / "frameworks"
 
 ADMIN_USER_ID = "6904183057"
 
+# Metrics export for scraping: written every interval when set.
+# *.json gets the JSON stats, anything else the Prometheus text format
+# (e.g. a node_exporter textfile collector's gate.prom); one file per webhook worker
+METRICS_EXPORT_PATH = str(per_worker(os.environ["METRICS_EXPORT_PATH"])) if os.getenv("METRICS_EXPORT_PATH") else ""
+METRICS_EXPORT_INTERVAL_SECONDS = 60
+
 # ============================================================================
 # SECURITY LIMITS
 # ============================================================================
@@ -52,7 +146,11 @@ MAX_MESSAGES_PER_MINUTE = 10        # Default for regular users
 MAX_MESSAGES_PER_HOUR = 100         # Default for regular users
 MAX_SUSPICIOUS_ATTEMPTS = 3         # Before temporary block
 BLOCK_DURATION_MINUTES = 30
-MAX_INPUT_TOKENS = 2500             # Context budget cap
+# Counters are per worker (each owns its users); /limit overrides are shared by all workers
+RATE_LIMIT_STATE_PATH = per_worker(os.getenv("RATE_LIMIT_STATE_PATH", BASE_DIR / "data" / "rate_limits.json"))
+RATE_LIMIT_OVERRIDES_PATH = Path(os.getenv("RATE_LIMIT_OVERRIDES_PATH", BASE_DIR / "data" / "rate_limit_overrides.json"))
+RATE_LIMIT_SNAPSHOT_SECONDS = 60    # Snapshot counters to disk / evict idle users this often
+MAX_INPUT_TOKENS = 3500             # Context budget cap (~2.2k is the cached static prefix)
 
 # ============================================================================
 # MEMORY SETTINGS
@@ -62,6 +160,32 @@ RECENT_MESSAGES_COUNT = 5           # Always loaded
 MAX_FACTS_TOKENS = 500              # Approximate token budget for facts
 SESSION_TIMEOUT_HOURS = 2           # Silence threshold for session end
 
+# In-memory user session cache (memory/session.py)
+SESSION_CACHE_IDLE_SECONDS = 1800   # Evict users idle longer than this
+SESSION_CACHE_MAX_USERS = 5000      # Hard cap on cached users (LRU beyond this)
+SESSION_FLUSH_DELAY_SECONDS = 2.0   # Debounce window for write-behind flushes
+SESSION_HISTORY_WINDOW = 20         # Recent messages kept in RAM per user - and sent to the agent
+
+# Rolling summary of everything older than the history window (core/summary.py),
+# kept in state and sent ahead of the recent turns
+SUMMARY_ENABLED = os.getenv("SUMMARY_ENABLED", "true").lower() == "true"
+SUMMARY_BATCH_MESSAGES = 10         # Fold aged-out messages in once this many have piled up
+SUMMARY_MAX_FOLD_MESSAGES = 40      # Most messages folded in by one call (catch-up happens over several turns)
+SUMMARY_BACKLOG_MESSAGES = 200      # How far back a user's first summary reaches
+MAX_SUMMARY_TOKENS = 300            # Summary length cap, in the prompt and from the model
+
+# ============================================================================
+# KNOWLEDGE RETRIEVAL
+# ============================================================================
+
+# BM25 over knowledge/*.md (core/retrieval.py); top chunks go into the reply prompt
+KNOWLEDGE_RETRIEVAL_ENABLED = os.getenv("KNOWLEDGE_RETRIEVAL_ENABLED", "true").lower() == "true"
+KNOWLEDGE_INDEX_PATH = Path(os.getenv("KNOWLEDGE_INDEX_PATH", BASE_DIR / "data" / "knowledge_index.json"))
+KNOWLEDGE_TOP_K = 2                 # Chunks retrieved per reply
+KNOWLEDGE_MIN_SCORE = 6.0           # BM25 score below which a chunk isn't worth injecting
+MAX_KNOWLEDGE_TOKENS = 400          # Token cap for injected chunks
+KNOWLEDGE_CHUNK_MAX_CHARS = 1200    # Sections longer than this are split on paragraphs
+
 # ============================================================================
 # SCHEDULED MESSAGES
 # ============================================================================
@@ -72,9 +196,20 @@ REENGAGEMENT_WINDOWS = {
     "direct_question_hours": 72     # After this
 }
 
+# Schedule a re-engagement ping after every reply and deliver due ones
+REENGAGEMENT_ENABLED = os.getenv("REENGAGEMENT_ENABLED", "false").lower() == "true"
+SCHEDULE_POLL_SECONDS = 60          # How often the job queue checks for due messages
+
 # ============================================================================
 # VOICE SETTINGS
 # ============================================================================
 
 ELEVENLABS_API_KEY = os.getenv("ELEVENLABS_API_KEY", "")
 DEFAULT_VOICE_ID = os.getenv("ELEVENLABS_VOICE_ID", "jRI54nLfVot0kbYqbGF5")
+
+# Whisper transcription of incoming voice notes
+TRANSCRIPTION_MODEL = "whisper-1"
+TRANSCRIPTION_CONCURRENCY = 4           # Uploads in flight at once; the rest wait their turn
+TRANSCRIPTION_TIMEOUT_SECONDS = 60
+TRANSCRIPTION_CACHE_MAX_ENTRIES = 500   # Keyed by Telegram file_unique_id
+TRANSCRIPTION_CACHE_TTL_SECONDS = 86400
@@ -5,23 +5,136 @@ System prompt + history → response
 No frameworks. No methods. Just seeing.
 """
 
+import hashlib
+import json
 import logging
+import re
+import threading
+import time
+from collections import OrderedDict
+from functools import cached_property
 from pathlib import Path
-from typing import List, Dict
+from types import SimpleNamespace
+from typing import AsyncIterator, List, Dict, Optional, Tuple
 
+from core.context import build_messages, count_tokens, message_tokens, static_prefix
 from core.llm import llm_client
-from config import PRIMARY_MODEL
+from core.metrics import llm_metrics
+from core.retrieval import knowledge_index
+from core.tracing import stage
+from config import (
+    PRIMARY_MODEL,
+    LLM_REPLY_DEADLINE_SECONDS,
+    KNOWLEDGE_RETRIEVAL_ENABLED,
+    KNOWLEDGE_TOP_K,
+    RESPONSE_CACHE_ENABLED,
+    RESPONSE_CACHE_TTL_SECONDS,
+    RESPONSE_CACHE_MAX_ENTRIES,
+    RESPONSE_CACHE_MAX_MESSAGE_CHARS,
+)
 
 logger = logging.getLogger(__name__)
 
 VOICE_PROMPT_PATH = Path(__file__).parent.parent / "instances" / "base" / "gate_voice.md"
+SECURITY_RULES_PATH = Path(__file__).parent.parent / "instances" / "base" / "security_rules.md"
+
+
+class ResponseCache:
+    """
+    Exact-match reply cache for short messages, with TTL and LRU eviction.
+
+    The key is the normalized message plus a hash of everything else sent
+    to the model (system prefix, facts, knowledge, earlier turns), so a hit
+    means the LLM would have seen an identical prompt - in practice a
+    first-contact "hey" from /start, or the same short message with no
+    prior context.
+    """
+
+    _PUNCTUATION_RE = re.compile(r"[^\w\s']+")
+    _WHITESPACE_RE = re.compile(r"\s+")
+
+    def __init__(
+        self,
+        ttl: float = RESPONSE_CACHE_TTL_SECONDS,
+        max_entries: int = RESPONSE_CACHE_MAX_ENTRIES,
+        max_message_chars: int = RESPONSE_CACHE_MAX_MESSAGE_CHARS
+    ):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_message_chars = max_message_chars
+        self._entries: "OrderedDict[str, Tuple[float, str]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def normalize(self, message: str) -> str:
+        text = self._PUNCTUATION_RE.sub(" ", message.lower())
+        return self._WHITESPACE_RE.sub(" ", text).strip()
+
+    def key(self, api_messages: List[Dict]) -> Optional[str]:
+        """Cache key for a built prompt, or None if this turn isn't cacheable."""
+        if not api_messages or api_messages[-1].get("role") != "user":
+            return None
+        message = self.normalize(api_messages[-1].get("content") or "")
+        if not message or len(message) > self.max_message_chars:
+            return None
+        context = json.dumps(api_messages[:-1], sort_keys=True, ensure_ascii=False)
+        return f"{message}\0{hashlib.sha256(context.encode('utf-8')).hexdigest()}"
+
+    def get(self, key: str) -> Optional[str]:
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] <= now:
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key: str, text: str):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, text)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def stats(self) -> Dict:
+        """Lookups, hits (= LLM calls saved), misses, evictions and current size."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "lookups": lookups,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": self.hits / lookups if lookups else 0.0
+            }
 
 
 class GateAgent:
 
     def __init__(self):
-        self.system_prompt = self._load_voice_prompt()
-        logger.info(f"[AGENT] Loaded voice prompt: {len(self.system_prompt)} chars")
+        # Nothing is read here - importing the agent stays cheap; see warm()
+        self.response_cache = ResponseCache() if RESPONSE_CACHE_ENABLED else None
+
+    @cached_property
+    def system_prompt(self) -> str:
+        """Static prefix: identical for every user and turn, so the provider can cache it."""
+        prompt = static_prefix([self._load_voice_prompt(), self._load_security_rules()])
+        logger.info(f"[AGENT] Loaded system prefix: {len(prompt)} chars, {count_tokens(prompt)} tokens")
+        return prompt
+
+    def warm(self):
+        """Load the system prefix, tokenizer and knowledge index now rather than inside the first turn."""
+        self.system_prompt
+        if KNOWLEDGE_RETRIEVAL_ENABLED and not knowledge_index.loaded:
+            knowledge_index.load()
 
     def _load_voice_prompt(self) -> str:
         try:
@@ -30,10 +143,36 @@ class GateAgent:
             logger.error(f"Voice prompt not found at {VOICE_PROMPT_PATH}")
             return "you are gate. you see what people are actually doing underneath what they say. you ask questions that expose the gap. you don't pretend along with them."
 
-    def reload(self):
-        self.system_prompt = self._load_voice_prompt()
+    def _load_security_rules(self) -> str:
+        try:
+            return SECURITY_RULES_PATH.read_text(encoding="utf-8")
+        except FileNotFoundError:
+            logger.error(f"Security rules not found at {SECURITY_RULES_PATH}")
+            return ""
+
+    def _retrieve_knowledge(self, history: List[Dict]) -> List[str]:
+        """Top knowledge chunks for the message being replied to."""
+        if not KNOWLEDGE_RETRIEVAL_ENABLED or not history or history[-1].get("role") != "user":
+            return []
+        with stage("retrieval"):
+            results = knowledge_index.search(history[-1].get("content") or "", k=KNOWLEDGE_TOP_K)
+        if results:
+            logger.debug(f"[AGENT] Knowledge: {[(round(score, 1), chunk['heading']) for score, chunk in results]}")
+        return [f"## {chunk['heading']}\n{chunk['text']}" for _, chunk in results]
 
-    def respond(self, history: List[Dict], user_state: Dict = None) -> str:
+    def _cached(self, api_messages: List[Dict]) -> Tuple[Optional[str], Optional[str]]:
+        """(cache key, cached reply) - both None when caching is off or the turn isn't cacheable."""
+        if self.response_cache is None:
+            return None, None
+        key = self.response_cache.key(api_messages)
+        if key is None:
+            return None, None
+        cached = self.response_cache.get(key)
+        if cached is not None:
+            logger.info(f"[AGENT] Response cache hit: '{cached[:80]}'")
+        return key, cached
+
+    def _build_api_messages(self, history: List[Dict], user_state: Dict = None, instructions: str = None) -> List[Dict]:
         user_state = user_state or {}
 
         # Minimal context
@@ -43,27 +182,65 @@ class GateAgent:
         if user_state.get("commitment"):
             context_parts.append(f"they said they'd do: {user_state['commitment']}")
 
-        context = "\n".join(context_parts) if context_parts else ""
+        # Retrieval is for replies; re-engagement has instructions of its own
+        knowledge = self._retrieve_knowledge(history) if instructions is None else []
 
-        # Build system prompt
-        if context:
-            full_system = f"{self.system_prompt}\n\n---\n\nwhat you know about them:\n{context}"
-        else:
-            full_system = self.system_prompt
+        # Static prefix, then facts/summary/knowledge/instructions, then as much recent history as MAX_INPUT_TOKENS allows
+        with stage("context"):
+            return build_messages(
+                self.system_prompt, context_parts, history,
+                instructions=instructions, knowledge=knowledge, summary=user_state.get("summary")
+            )
+
+    def respond(self, history: List[Dict], user_state: Dict = None) -> str:
+        api_messages = self._build_api_messages(history, user_state)
+        cache_key, cached = self._cached(api_messages)
+        if cached is not None:
+            return cached
 
         try:
-            # Build messages with system prompt for OpenAI format
-            api_messages = [{"role": "system", "content": full_system}]
-            api_messages.extend(history)
+            with stage("llm"):
+                response = llm_client.complete(
+                    "reply",
+                    deadline=LLM_REPLY_DEADLINE_SECONDS,
+                    model=PRIMARY_MODEL,
+                    max_tokens=150,
+                    messages=api_messages
+                )
 
-            response = llm_client.client.chat.completions.create(
-                model=PRIMARY_MODEL,
-                max_tokens=150,
-                messages=api_messages
-            )
+            result = response.choices[0].message.content.strip()
+            result = self._clean(result)
+            if cache_key:
+                self.response_cache.put(cache_key, result)
+
+            logger.info(f"[AGENT] Response: '{result[:80]}...'")
+            return result
+
+        except Exception as e:
+            logger.error(f"[AGENT] Error: {e}")
+            return "what's actually going on"
+
+    async def respond_async(self, history: List[Dict], user_state: Dict = None) -> str:
+        """Same as respond(), but awaits the AsyncOpenAI client so the event loop keeps serving other chats."""
+        api_messages = self._build_api_messages(history, user_state)
+        cache_key, cached = self._cached(api_messages)
+        if cached is not None:
+            return cached
+
+        try:
+            with stage("llm"):
+                response = await llm_client.acomplete(
+                    "reply",
+                    deadline=LLM_REPLY_DEADLINE_SECONDS,
+                    model=PRIMARY_MODEL,
+                    max_tokens=150,
+                    messages=api_messages
+                )
 
             result = response.choices[0].message.content.strip()
             result = self._clean(result)
+            if cache_key:
+                self.response_cache.put(cache_key, result)
 
             logger.info(f"[AGENT] Response: '{result[:80]}...'")
             return result
@@ -72,6 +249,73 @@ class GateAgent:
             logger.error(f"[AGENT] Error: {e}")
             return "what's actually going on"
 
+    async def respond_stream(self, history: List[Dict], user_state: Dict = None) -> AsyncIterator[str]:
+        """
+        Streaming respond_async(): yields text deltas as they arrive.
+        Raw model output - run _clean() on the joined text at the end.
+        """
+        api_messages = self._build_api_messages(history, user_state)
+        cache_key, cached = self._cached(api_messages)
+        if cached is not None:
+            yield cached
+            return
+
+        started = time.perf_counter()
+        # 'llm' here is until the stream opens; the engine records ttft and the full stream
+        with stage("llm"):
+            stream = await llm_client.acomplete(
+                "reply",
+                deadline=LLM_REPLY_DEADLINE_SECONDS,
+                model=PRIMARY_MODEL,
+                max_tokens=150,
+                messages=api_messages,
+                stream=True,
+                stream_options={"include_usage": True}
+            )
+        parts = []
+        usage = None
+        try:
+            async for chunk in stream:
+                if chunk.choices and chunk.choices[0].delta.content:
+                    parts.append(chunk.choices[0].delta.content)
+                    yield chunk.choices[0].delta.content
+                if getattr(chunk, "usage", None):
+                    # Final chunk (no choices) carries usage for the whole call
+                    usage = chunk.usage
+            # Only a reply that streamed to the end is worth reusing
+            if cache_key and parts:
+                self.response_cache.put(cache_key, self._clean("".join(parts)))
+        finally:
+            # Stopped early (e.g. output filter tripped) - drop the connection
+            await stream.close()
+            if usage is None:
+                # No usage chunk, but the tokens were still spent - count an estimate
+                usage = SimpleNamespace(
+                    prompt_tokens=sum(message_tokens(m) for m in api_messages),
+                    completion_tokens=count_tokens("".join(parts))
+                )
+            llm_metrics.record_usage("reply", usage, time.perf_counter() - started)
+
+    async def reengage_async(self, history: List[Dict], trigger_prompt: str, user_state: Dict = None) -> str:
+        """Generate a scheduled re-engagement message from one of REENGAGEMENT_PROMPTS."""
+        api_messages = self._build_api_messages(history, user_state, f"they went quiet. {trigger_prompt.strip()}")
+
+        try:
+            response = await llm_client.acomplete(
+                "reengagement",
+                model=PRIMARY_MODEL,
+                max_tokens=30,
+                messages=api_messages
+            )
+
+            result = self._clean(response.choices[0].message.content.strip())
+            logger.info(f"[AGENT] Re-engagement: '{result}'")
+            return result
+
+        except Exception as e:
+            logger.error(f"[AGENT] Re-engagement error: {e}")
+            return "still here"
+
     def _clean(self, text: str) -> str:
         if not text:
             return "what's actually going on"
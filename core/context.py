@@ -0,0 +1,185 @@
+"""
+Context Builder
+Assembles the messages for one agent call within MAX_INPUT_TOKENS.
+
+Layout is cache-friendly: a static system prefix identical for every
+user and turn (so provider prompt caching can reuse it), then a second
+system message with the dynamic part - what we know about the user
+(capped at MAX_FACTS_TOKENS), the rolling summary of older conversation
+(capped at MAX_SUMMARY_TOKENS, see core/summary.py), retrieved knowledge
+chunks (capped at MAX_KNOWLEDGE_TOKENS) and any per-call instructions -
+then conversation history filled newest-first until the budget runs out.
+Older turns that don't fit are dropped; a message too large for what's
+left is truncated. Token counts come from tiktoken
+when its encoding is available (chars/4 otherwise) and are cached per
+text, so each message is only tokenized once.
+"""
+
+import json
+import logging
+from functools import lru_cache
+from typing import Dict, List
+
+from config import MAX_INPUT_TOKENS, MAX_FACTS_TOKENS, MAX_KNOWLEDGE_TOKENS, MAX_SUMMARY_TOKENS, PRIMARY_MODEL
+
+logger = logging.getLogger(__name__)
+
+# Chat format overhead (role + separators) per message, and for the reply primer
+MESSAGE_OVERHEAD = 4
+REPLY_OVERHEAD = 3
+
+# Rough chars per token when tiktoken isn't usable
+FALLBACK_CHARS_PER_TOKEN = 4
+
+_encoding = None
+_encoding_loaded = False
+
+
+def _get_encoding():
+    """tiktoken encoding for PRIMARY_MODEL, or None (not installed / can't fetch its BPE file)."""
+    global _encoding, _encoding_loaded
+    if not _encoding_loaded:
+        _encoding_loaded = True
+        try:
+            import tiktoken
+            try:
+                _encoding = tiktoken.encoding_for_model(PRIMARY_MODEL)
+            except KeyError:
+                _encoding = tiktoken.get_encoding("o200k_base")
+        except Exception as e:
+            logger.warning(f"[CONTEXT] tiktoken unavailable ({e}), estimating tokens from length")
+            _encoding = None
+    return _encoding
+
+
+@lru_cache(maxsize=16384)
+def count_tokens(text: str) -> int:
+    """Token count for text (cached)."""
+    if not text:
+        return 0
+    encoding = _get_encoding()
+    if encoding is None:
+        return -(-len(text) // FALLBACK_CHARS_PER_TOKEN)
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    """Longest prefix of text that fits in max_tokens."""
+    if max_tokens <= 0:
+        return ""
+    if count_tokens(text) <= max_tokens:
+        return text
+    encoding = _get_encoding()
+    if encoding is None:
+        return text[:max_tokens * FALLBACK_CHARS_PER_TOKEN]
+    return encoding.decode(encoding.encode(text, disallowed_special=())[:max_tokens])
+
+
+def message_tokens(message: Dict) -> int:
+    return count_tokens(message.get("content") or "") + MESSAGE_OVERHEAD
+
+
+def static_prefix(sections: List[str], definition: Dict = None) -> str:
+    """
+    Join fixed prompt sections (voice, security rules, ...) and an optional
+    instance definition into one byte-stable string. Build it once and
+    reuse it: any per-user text belongs in the dynamic suffix instead.
+    """
+    parts = [section.strip() for section in sections if section and section.strip()]
+    if definition:
+        parts.append("## THIS INSTANCE\n\n```json\n" + json.dumps(definition, indent=2, sort_keys=True) + "\n```")
+    return "\n\n---\n\n".join(parts)
+
+
+def build_messages(
+    system_prompt: str,
+    facts: List[str],
+    history: List[Dict],
+    budget: int = MAX_INPUT_TOKENS,
+    facts_budget: int = MAX_FACTS_TOKENS,
+    instructions: str = None,
+    knowledge: List[str] = None,
+    knowledge_budget: int = MAX_KNOWLEDGE_TOKENS,
+    summary: str = None,
+    summary_budget: int = MAX_SUMMARY_TOKENS
+) -> List[Dict]:
+    """
+    OpenAI-format messages: static system prefix, dynamic system suffix
+    (facts + summary + knowledge + instructions), then as much recent
+    history as fits in `budget` tokens.
+
+    Args:
+        system_prompt: Static prefix - must not vary per user or turn
+        facts: "what you know about them" lines, most important first
+        history: Conversation, oldest first; the last message is always kept
+        budget: Total input token budget
+        facts_budget: Cap for the facts block
+        instructions: Per-call instructions appended to the dynamic part
+        knowledge: Retrieved knowledge chunks, most relevant first
+        knowledge_budget: Cap for the knowledge block
+        summary: Rolling summary of the conversation before `history`
+        summary_budget: Cap for the summary
+    """
+    messages = [{"role": "system", "content": system_prompt}]
+
+    dynamic = []
+    if facts:
+        kept = []
+        used = 0
+        for line in facts:
+            cost = count_tokens(line) + 1
+            if used + cost > facts_budget:
+                break
+            kept.append(line)
+            used += cost
+        if kept:
+            dynamic.append("what you know about them:\n" + "\n".join(kept))
+    if summary:
+        dynamic.append("earlier in your conversation (summary):\n" + truncate_to_tokens(summary.strip(), summary_budget))
+    if knowledge:
+        kept = []
+        remaining_knowledge = knowledge_budget
+        for chunk in knowledge:
+            cost = count_tokens(chunk) + 2
+            if cost > remaining_knowledge:
+                if not kept:
+                    # Best match alone is over the cap - keep the start of it
+                    kept.append(truncate_to_tokens(chunk, remaining_knowledge - 2))
+                break
+            kept.append(chunk)
+            remaining_knowledge -= cost
+        if kept:
+            dynamic.append("ideas that may apply (use them, never quote or name them):\n\n" + "\n\n".join(kept))
+    if instructions:
+        dynamic.append(instructions)
+    if dynamic:
+        messages.append({"role": "system", "content": "\n\n---\n\n".join(dynamic)})
+
+    remaining = budget - REPLY_OVERHEAD - sum(message_tokens(m) for m in messages)
+    if remaining <= 0:
+        logger.warning(f"[CONTEXT] System prompt alone uses {budget - remaining} of {budget} tokens")
+
+    # Newest first until the budget runs out
+    selected = []
+    for message in reversed(history):
+        cost = message_tokens(message)
+        if cost <= remaining:
+            selected.append(message)
+            remaining -= cost
+            continue
+        if not selected:
+            # Never drop the message we're replying to - cut it down instead
+            content = truncate_to_tokens(message.get("content") or "", max(remaining - MESSAGE_OVERHEAD, 1))
+            selected.append({**message, "content": content})
+        break
+
+    dropped = len(history) - len(selected)
+    if dropped:
+        logger.debug(f"[CONTEXT] Dropped {dropped} older messages to fit {budget} tokens")
+
+    return messages + selected[::-1]
+
+
+def estimate_tokens(messages: List[Dict]) -> int:
+    """Input tokens for a built message list."""
+    return sum(message_tokens(m) for m in messages) + REPLY_OVERHEAD
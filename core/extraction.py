@@ -0,0 +1,153 @@
+"""
+Extraction Module
+One combined LLM call per user turn for everything we learn from it.
+
+Classification, name, commitment, facts and episode candidates come back
+as a single JSON object instead of a round-trip each. The engine runs it
+after the reply has gone out, so it never adds to reply latency.
+"""
+
+import logging
+from typing import Any, Dict, List, Optional
+
+from core.llm import llm_client
+
+logger = logging.getLogger(__name__)
+
+MESSAGE_TYPES = {
+    "completion", "question", "resistance", "information",
+    "emotional", "off_topic", "onboarding_data"
+}
+EPISODE_TYPES = {"breakthrough", "commitment", "completion", "resistance"}
+
+EXTRACTION_PROMPT = """
+You extract structured data from one turn of a goal-focused coaching conversation.
+Only extract what the user actually said in THIS message. Use null / empty values
+when something isn't there - never guess.
+
+Classify the user's message as ONE of:
+- completion: confirming they completed a step ("done", "did it", "finished")
+- question: asking something
+- resistance: doubt or avoidance ("but", "can't", "won't work", "what if")
+- information: sharing facts about themselves
+- emotional: expressing feelings
+- off_topic: unrelated to their goal
+- onboarding_data: goal, current state or desired outcome
+
+Episodes are only for significant moments: a breakthrough (new realization), a
+commitment (they commit to a specific action), a completion (they did a step),
+or resistance (a clear, meaningful pushback). Most turns have none.
+"""
+
+EXTRACTION_SCHEMA = """
+{
+    "classification": {"type": "<type>", "confidence": <0.0-1.0>},
+    "name": "<first name they gave, or null>",
+    "commitment": "<specific action they committed to, or null>",
+    "deadline": "<when they said they'd do it, or null>",
+    "facts": {
+        "goal": "<their goal, or null>",
+        "identity": {"<key>": "<value>"},
+        "context": {"<key>": "<value>"},
+        "resources": {"<key>": "<value>"},
+        "blockers": ["<blocker>"]
+    },
+    "episodes": [
+        {"type": "breakthrough|commitment|completion|resistance", "summary": "<one line>", "significance": "<why it matters>"}
+    ]
+}
+"""
+
+
+def _text(value: Any) -> Optional[str]:
+    if isinstance(value, str) and value.strip() and value.strip().lower() not in ("null", "none"):
+        return value.strip()
+    return None
+
+
+def _normalize(data: Dict) -> Dict:
+    """Coerce the model's JSON into the schema, dropping anything malformed."""
+    classification = data.get("classification") if isinstance(data.get("classification"), dict) else {}
+    message_type = classification.get("type")
+    try:
+        confidence = float(classification.get("confidence") or 0.0)
+    except (TypeError, ValueError):
+        confidence = 0.0
+
+    raw_facts = data.get("facts") if isinstance(data.get("facts"), dict) else {}
+    facts = {}
+    if _text(raw_facts.get("goal")):
+        facts["goal"] = _text(raw_facts["goal"])
+    for key in ("identity", "context", "resources"):
+        if isinstance(raw_facts.get(key), dict):
+            values = {str(k): v for k, v in raw_facts[key].items() if v not in (None, "", [], {})}
+            if values:
+                facts[key] = values
+    if isinstance(raw_facts.get("blockers"), list):
+        blockers = [b.strip() for b in raw_facts["blockers"] if isinstance(b, str) and b.strip()]
+        if blockers:
+            facts["blockers"] = blockers
+
+    episodes: List[Dict] = []
+    for episode in data.get("episodes") or []:
+        if isinstance(episode, dict) and episode.get("type") in EPISODE_TYPES and _text(episode.get("summary")):
+            episodes.append({
+                "type": episode["type"],
+                "summary": _text(episode["summary"]),
+                "significance": _text(episode.get("significance"))
+            })
+
+    return {
+        "classification": {
+            "type": message_type if message_type in MESSAGE_TYPES else "unknown",
+            "confidence": max(0.0, min(confidence, 1.0))
+        },
+        "name": _text(data.get("name")),
+        "commitment": _text(data.get("commitment")),
+        "deadline": _text(data.get("deadline")),
+        "facts": facts,
+        "episodes": episodes
+    }
+
+
+def _prompt(previous: Optional[str], known: Optional[Dict]) -> str:
+    known = {k: v for k, v in (known or {}).items() if v}
+    prompt = EXTRACTION_PROMPT
+    if known:
+        prompt += "\nAlready known (don't re-extract unless it changed):\n" + "\n".join(f"- {k}: {v}" for k, v in known.items())
+    if previous:
+        prompt += f'\nThe user is answering this from gate (context only, don\'t extract from it):\n"{previous}"'
+    return prompt
+
+
+def _result(data: Optional[Dict]) -> Optional[Dict]:
+    if not isinstance(data, dict):
+        return None
+
+    result = _normalize(data)
+    logger.info(
+        f"[EXTRACT] type={result['classification']['type']} ({result['classification']['confidence']:.2f}), "
+        f"name={result['name']}, commitment={bool(result['commitment'])}, "
+        f"facts={list(result['facts'])}, episodes={[e['type'] for e in result['episodes']]}"
+    )
+    return result
+
+
+def extract_turn(message: str, previous: str = None, known: Dict = None) -> Optional[Dict]:
+    """
+    Extract everything from one turn in a single LLM call.
+
+    Args:
+        message: The user's message
+        previous: Gate's message the user was answering, if any
+        known: What we already know (name, commitment, current step, goal)
+
+    Returns:
+        Normalized dict (see EXTRACTION_SCHEMA), or None if the call failed
+    """
+    return _result(llm_client.extract_structured(message, _prompt(previous, known), EXTRACTION_SCHEMA))
+
+
+async def extract_turn_async(message: str, previous: str = None, known: Dict = None) -> Optional[Dict]:
+    """extract_turn() on the async client, for the event-loop paths."""
+    return _result(await llm_client.extract_structured_async(message, _prompt(previous, known), EXTRACTION_SCHEMA))
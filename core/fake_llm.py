@@ -0,0 +1,204 @@
+"""
+Fake LLM Provider
+Offline, deterministic stand-in for the OpenAI chat completions API.
+
+Selected with LLM_PROVIDER=fake. FakeOpenAI / FakeAsyncOpenAI expose the
+same chat.completions.create() surface the code uses - plain and
+streaming responses with usage, including cached prompt tokens - and
+sleep for a latency drawn from FAKE_LLM_LATENCY:
+
+    fixed:<seconds>
+    uniform:<low>:<high>
+    lognormal:<median>:<sigma>
+
+Replies come from CANNED_REPLIES, picked by a hash of the last message so
+the same conversation always gets the same answers. Extraction prompts
+(the ones asking for JSON) get CANNED_EXTRACTION.
+"""
+
+import asyncio
+import hashlib
+import json
+import math
+import random
+import threading
+import time
+from types import SimpleNamespace
+from typing import Any, Callable, Dict, List
+
+from config import FAKE_LLM_LATENCY, FAKE_LLM_SEED
+
+CANNED_REPLIES = [
+    "what's actually stopping you",
+    "you said that last time. what's different now",
+    "ok. what's the smallest version of that you'd do today",
+    "and what did you do instead",
+    "that's the story. what's the pattern",
+    "when exactly. give me a time",
+    "good. what's next",
+    "why that one first",
+]
+
+CANNED_EXTRACTION = {
+    "classification": {"type": "information", "confidence": 0.8},
+    "name": None,
+    "commitment": None,
+    "deadline": None,
+    "facts": {"goal": None, "identity": {}, "context": {}, "resources": {}, "blockers": []},
+    "episodes": []
+}
+
+# Provider prompt caching: prefixes of at least this many tokens, in these increments
+CACHE_MIN_TOKENS = 1024
+CACHE_INCREMENT = 128
+
+# Share of the latency spent before the first streamed token
+TTFT_FRACTION = 0.4
+
+
+def parse_latency(spec: str, seed: int = 0) -> Callable[[], float]:
+    """Latency sampler (seconds) for a 'kind:params' spec."""
+    kind, _, params = spec.partition(":")
+    values = [float(v) for v in params.split(":") if v]
+    rng = random.Random(seed)
+    lock = threading.Lock()
+
+    if kind == "fixed":
+        return lambda: values[0]
+    if kind == "uniform":
+        low, high = values
+        sample = lambda: rng.uniform(low, high)  # noqa: E731
+    elif kind == "lognormal":
+        median, sigma = values
+        sample = lambda: rng.lognormvariate(math.log(median), sigma)  # noqa: E731
+    else:
+        raise ValueError(f"Unknown FAKE_LLM_LATENCY kind '{kind}' (fixed | uniform | lognormal)")
+
+    def locked() -> float:
+        with lock:
+            return sample()
+    return locked
+
+
+def _estimate_tokens(text: str) -> int:
+    return max(1, len(text) // 4)
+
+
+class _FakeCompletions:
+    """Shared request handling for the sync and async fakes."""
+
+    def __init__(self, latency: Callable[[], float]):
+        self.latency = latency
+        self.calls = 0
+        self._seen_prefixes = set()
+        self._lock = threading.Lock()
+
+    def _reply(self, messages: List[Dict]) -> str:
+        last = (messages[-1].get("content") or "") if messages else ""
+        if "Respond with valid JSON only" in last:
+            return json.dumps(CANNED_EXTRACTION)
+        digest = hashlib.sha256(last.encode("utf-8")).digest()
+        return CANNED_REPLIES[digest[0] % len(CANNED_REPLIES)]
+
+    def _usage(self, messages: List[Dict], reply: str) -> SimpleNamespace:
+        prompt_tokens = sum(_estimate_tokens(m.get("content") or "") + 4 for m in messages) + 3
+        cached = 0
+        if messages and messages[0].get("role") == "system":
+            prefix = messages[0].get("content") or ""
+            prefix_tokens = _estimate_tokens(prefix)
+            with self._lock:
+                seen = prefix in self._seen_prefixes
+                self._seen_prefixes.add(prefix)
+            if seen and prefix_tokens >= CACHE_MIN_TOKENS:
+                cached = prefix_tokens - prefix_tokens % CACHE_INCREMENT
+        return SimpleNamespace(
+            prompt_tokens=prompt_tokens,
+            completion_tokens=_estimate_tokens(reply),
+            total_tokens=prompt_tokens + _estimate_tokens(reply),
+            prompt_tokens_details=SimpleNamespace(cached_tokens=cached)
+        )
+
+    def _prepare(self, kwargs: Dict[str, Any]):
+        with self._lock:
+            self.calls += 1
+        messages = kwargs.get("messages") or []
+        reply = self._reply(messages)
+        return reply, self._usage(messages, reply), self.latency()
+
+    @staticmethod
+    def _completion(reply: str, usage: SimpleNamespace) -> SimpleNamespace:
+        return SimpleNamespace(
+            choices=[SimpleNamespace(message=SimpleNamespace(role="assistant", content=reply), finish_reason="stop")],
+            usage=usage
+        )
+
+    @staticmethod
+    def _chunks(reply: str, usage: SimpleNamespace, include_usage: bool) -> List[SimpleNamespace]:
+        words = reply.split(" ")
+        chunks = [
+            SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=word if i == 0 else " " + word))], usage=None)
+            for i, word in enumerate(words)
+        ]
+        if include_usage:
+            chunks.append(SimpleNamespace(choices=[], usage=usage))
+        return chunks
+
+
+class _SyncCompletions(_FakeCompletions):
+
+    def create(self, **kwargs) -> Any:
+        reply, usage, latency = self._prepare(kwargs)
+        if kwargs.get("stream"):
+            raise NotImplementedError("Fake sync streaming isn't used - stream through the async client")
+        time.sleep(latency)
+        return self._completion(reply, usage)
+
+
+class _FakeAsyncStream:
+    def __init__(self, chunks: List[SimpleNamespace], delay: float):
+        self._chunks = chunks
+        self._delay = delay
+        self.closed = False
+
+    def __aiter__(self):
+        return self._iterate()
+
+    async def _iterate(self):
+        for chunk in self._chunks:
+            if self.closed:
+                return
+            if chunk.choices:
+                await asyncio.sleep(self._delay)
+            yield chunk
+
+    async def close(self):
+        self.closed = True
+
+
+class _AsyncCompletions(_FakeCompletions):
+
+    async def create(self, **kwargs) -> Any:
+        reply, usage, latency = self._prepare(kwargs)
+        if not kwargs.get("stream"):
+            await asyncio.sleep(latency)
+            return self._completion(reply, usage)
+
+        include_usage = bool((kwargs.get("stream_options") or {}).get("include_usage"))
+        chunks = self._chunks(reply, usage, include_usage)
+        await asyncio.sleep(latency * TTFT_FRACTION)
+        token_chunks = sum(1 for chunk in chunks if chunk.choices) or 1
+        return _FakeAsyncStream(chunks, latency * (1 - TTFT_FRACTION) / token_chunks)
+
+
+class FakeOpenAI:
+    """Drop-in for openai.OpenAI as far as chat completions go."""
+
+    def __init__(self, latency: str = FAKE_LLM_LATENCY, seed: int = FAKE_LLM_SEED, **_):
+        self.chat = SimpleNamespace(completions=_SyncCompletions(parse_latency(latency, seed)))
+
+
+class FakeAsyncOpenAI:
+    """Drop-in for openai.AsyncOpenAI as far as chat completions go."""
+
+    def __init__(self, latency: str = FAKE_LLM_LATENCY, seed: int = FAKE_LLM_SEED, **_):
+        self.chat = SimpleNamespace(completions=_AsyncCompletions(parse_latency(latency, seed)))
@@ -0,0 +1,107 @@
+"""
+HTTP Transport
+The connection pools every outbound API client sends through.
+
+Each SDK object used to open its own pool with httpx defaults, which drop
+idle connections after 5 seconds - so under steady but not constant load
+most calls paid a fresh TCP + TLS handshake to api.openai.com. Instead
+there is one httpx client per process (one sync, one async), handed to
+the SDKs as their http_client: the reply, the extraction call and the next
+voice note share warm connections, idle ones are kept for
+HTTP_KEEPALIVE_EXPIRY_SECONDS, and HTTP_MAX_CONNECTIONS bounds how many
+requests a process has in flight across every service.
+
+A new client (ElevenLabs, say) should take its pool from here too:
+
+    client = async_http_client()
+    await client.post("https://api.elevenlabs.io/v1/text-to-speech/...", headers=..., json=...)
+
+HTTP2_ENABLED multiplexes concurrent requests over one connection per
+host; it needs the h2 package and falls back to HTTP/1.1 without it.
+"""
+
+import logging
+import threading
+from typing import TYPE_CHECKING, Dict, Union
+
+from config import (
+    HTTP_MAX_CONNECTIONS,
+    HTTP_MAX_KEEPALIVE_CONNECTIONS,
+    HTTP_KEEPALIVE_EXPIRY_SECONDS,
+    HTTP_CONNECT_TIMEOUT_SECONDS,
+    HTTP2_ENABLED,
+    LLM_DEADLINE_SECONDS,
+)
+
+if TYPE_CHECKING:
+    import httpx
+
+logger = logging.getLogger(__name__)
+
+# httpx is imported when the first pool is built, not on the bot's import path
+_clients: Dict[str, Union["httpx.Client", "httpx.AsyncClient"]] = {}
+_lock = threading.Lock()
+
+
+def _http2() -> bool:
+    if not HTTP2_ENABLED:
+        return False
+    try:
+        import h2  # noqa: F401
+    except ImportError:
+        logger.warning("[HTTP] HTTP2_ENABLED but the h2 package isn't installed - using HTTP/1.1")
+        return False
+    return True
+
+
+def _options() -> Dict:
+    import httpx
+
+    return {
+        "limits": httpx.Limits(
+            max_connections=HTTP_MAX_CONNECTIONS,
+            max_keepalive_connections=HTTP_MAX_KEEPALIVE_CONNECTIONS,
+            keepalive_expiry=HTTP_KEEPALIVE_EXPIRY_SECONDS
+        ),
+        # SDKs pass their own per-request timeouts; this is the fallback
+        "timeout": httpx.Timeout(LLM_DEADLINE_SECONDS, connect=HTTP_CONNECT_TIMEOUT_SECONDS),
+        "http2": _http2(),
+        "follow_redirects": True,
+    }
+
+
+def _shared(kind: str, factory):
+    with _lock:
+        client = _clients.get(kind)
+        if client is None or client.is_closed:
+            options = _options()
+            client = _clients[kind] = factory(**options)
+            logger.info(f"[HTTP] {kind} pool: {HTTP_MAX_CONNECTIONS} connections, "
+                        f"keep-alive {HTTP_KEEPALIVE_EXPIRY_SECONDS:.0f}s, http2={options['http2']}")
+        return client
+
+
+def http_client() -> "httpx.Client":
+    """The process-wide sync client (worker-thread calls)."""
+    import httpx
+
+    return _shared("sync", httpx.Client)
+
+
+def async_http_client() -> "httpx.AsyncClient":
+    """The process-wide async client. Its connections belong to the event loop that opened them."""
+    import httpx
+
+    return _shared("async", httpx.AsyncClient)
+
+
+async def close_pools():
+    """Close both pools (shutdown)."""
+    with _lock:
+        clients = list(_clients.items())
+        _clients.clear()
+    for kind, client in clients:
+        if kind == "async":
+            await client.aclose()
+        else:
+            client.close()
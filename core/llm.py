@@ -1,23 +1,140 @@
 """
 LLM Client Module
 Handles API calls to OpenAI.
+
+All completions go through complete() / acomplete(), which add what the
+SDK calls lack on their own: a deadline for the whole call, jittered
+exponential retries on 429 / 5xx / timeouts (honouring Retry-After), an
+optional hedged second request once the first is slower than the recent
+p95, and a circuit breaker that fails fast while the provider is down.
+Latency and retry/hedge/breaker counts go to core/metrics.py.
+
+The SDK clients are built on first use, not at import: the openai package
+alone takes most of a second to import, which every worker and test
+harness would otherwise pay before doing anything. They send through the
+shared connection pools in core/http.py.
 """
 
+import asyncio
 import json
 import logging
+import random
+import sys
+import threading
+import time
+from functools import cached_property
 from typing import Optional, Dict, List, Any
 
-from openai import OpenAI
-
 from config import (
     OPENAI_API_KEY,
+    LLM_PROVIDER,
     PRIMARY_MODEL,
     EXTRACTION_MODEL,
     MAX_INPUT_TOKENS,
+    LLM_DEADLINE_SECONDS,
+    LLM_MAX_RETRIES,
+    LLM_RETRY_BASE_SECONDS,
+    LLM_RETRY_MAX_SECONDS,
+    LLM_HEDGE_ENABLED,
+    LLM_HEDGE_DELAY_SECONDS,
+    LLM_BREAKER_FAILURES,
+    LLM_BREAKER_COOLDOWN_SECONDS,
 )
+from core.metrics import llm_metrics, cached_tokens_of
 
 logger = logging.getLogger(__name__)
 
+# Status codes worth retrying besides 5xx
+RETRYABLE_STATUS = {408, 409, 429}
+
+
+class CircuitOpenError(Exception):
+    """Raised without calling the provider while the circuit breaker is open."""
+
+
+class CircuitBreaker:
+    """
+    Consecutive-failure circuit breaker.
+
+    closed    - calls go through; `failure_threshold` failures in a row open it
+    open      - calls fail fast for `cooldown` seconds
+    half_open - one probe call goes through; success closes, failure re-opens
+    """
+
+    def __init__(self, failure_threshold: int = LLM_BREAKER_FAILURES, cooldown: float = LLM_BREAKER_COOLDOWN_SECONDS):
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self._probing = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            if self.opened_at is None:
+                return "closed"
+            if time.monotonic() - self.opened_at < self.cooldown:
+                return "open"
+            return "half_open"
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.opened_at is None:
+                return True
+            if time.monotonic() - self.opened_at < self.cooldown or self._probing:
+                return False
+            self._probing = True
+            return True
+
+    def record_success(self):
+        with self._lock:
+            if self.opened_at is not None:
+                logger.info("[LLM] Circuit closed - provider is answering again")
+            self.failures = 0
+            self.opened_at = None
+            self._probing = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self._probing or (self.opened_at is None and self.failures >= self.failure_threshold):
+                logger.warning(f"[LLM] Circuit open after {self.failures} consecutive failures - failing fast for {self.cooldown:.0f}s")
+                self.opened_at = time.monotonic()
+            self._probing = False
+
+    def release(self):
+        """An attempt ended without telling us anything about the provider."""
+        with self._lock:
+            self._probing = False
+
+
+def _is_openai_error(error: Exception, *names: str) -> bool:
+    """isinstance against openai exception classes by name, without importing the SDK for it."""
+    openai = sys.modules.get("openai")
+    # Not imported yet means no client has been built - the error can't be one of these
+    return openai is not None and isinstance(error, tuple(getattr(openai, name) for name in names))
+
+
+def _is_retryable(error: Exception) -> bool:
+    if isinstance(error, asyncio.TimeoutError) or _is_openai_error(error, "APIConnectionError"):
+        return True
+    if _is_openai_error(error, "APIStatusError"):
+        return error.status_code in RETRYABLE_STATUS or error.status_code >= 500
+    return False
+
+
+def _retry_delay(attempt: int, error: Exception) -> float:
+    """Retry-After when the provider sent one, else full-jitter exponential backoff."""
+    response = getattr(error, "response", None)
+    retry_after = response.headers.get("retry-after") if response is not None else None
+    if retry_after:
+        try:
+            return min(float(retry_after), LLM_RETRY_MAX_SECONDS)
+        except ValueError:
+            pass
+    return random.uniform(0, min(LLM_RETRY_MAX_SECONDS, LLM_RETRY_BASE_SECONDS * 2 ** attempt))
+
 
 class LLMClient:
     """
@@ -25,21 +142,185 @@ class LLMClient:
     """
 
     def __init__(self):
-        self.client = OpenAI(api_key=OPENAI_API_KEY)
+        if LLM_PROVIDER == "fake":
+            logger.warning("[LLM] Using the fake provider - replies are canned")
+        self.breaker = CircuitBreaker()
+
+    @cached_property
+    def client(self):
+        """Sync SDK client (worker threads), built on first use."""
+        if LLM_PROVIDER == "fake":
+            from core.fake_llm import FakeOpenAI
+            return FakeOpenAI()
+        from openai import OpenAI
+        from core.http import http_client
+        # Retries and timeouts are ours (complete/acomplete), not the SDK's
+        return OpenAI(api_key=OPENAI_API_KEY, max_retries=0, timeout=LLM_DEADLINE_SECONDS, http_client=http_client())
+
+    @cached_property
+    def async_client(self):
+        """Async SDK client for the event-loop path (bot handlers), built on first use."""
+        if LLM_PROVIDER == "fake":
+            from core.fake_llm import FakeAsyncOpenAI
+            return FakeAsyncOpenAI()
+        from openai import AsyncOpenAI
+        from core.http import async_http_client
+        return AsyncOpenAI(api_key=OPENAI_API_KEY, max_retries=0, timeout=LLM_DEADLINE_SECONDS, http_client=async_http_client())
+
+    def _attempt_failed(self, purpose: str, error: Exception, attempt: int, deadline_at: float) -> Optional[float]:
+        """Record a failed attempt; seconds to wait before retrying, or None to give up."""
+        retryable = _is_retryable(error)
+        if retryable:
+            self.breaker.record_failure()
+        elif _is_openai_error(error, "APIStatusError"):
+            # 400/401/... - the provider is up, the request is the problem
+            self.breaker.record_success()
+        else:
+            self.breaker.release()
+
+        if isinstance(error, asyncio.TimeoutError) or _is_openai_error(error, "APITimeoutError"):
+            llm_metrics.record_event(purpose, "timeout")
+
+        delay = _retry_delay(attempt, error)
+        if not retryable or attempt >= LLM_MAX_RETRIES or time.monotonic() + delay >= deadline_at:
+            llm_metrics.record_event(purpose, "failure")
+            return None
+
+        llm_metrics.record_event(purpose, "retry")
+        logger.warning(f"[LLM] {purpose} attempt {attempt + 1} failed ({type(error).__name__}: {error}), retrying in {delay:.2f}s")
+        return delay
 
-    def _build_system_content(
+    def _succeeded(self, purpose: str, response: Any, started: float, stream: bool):
+        self.breaker.record_success()
+        elapsed = time.perf_counter() - started
+        llm_metrics.record_latency(purpose, elapsed)
+        if not stream:
+            # Streams report usage on their last chunk - the caller records it
+            llm_metrics.record_usage(purpose, getattr(response, "usage", None), elapsed)
+
+    def _check_breaker(self, purpose: str):
+        if not self.breaker.allow():
+            llm_metrics.record_event(purpose, "breaker_open")
+            raise CircuitOpenError(f"LLM circuit open, not calling provider for {purpose}")
+
+    def complete(self, purpose: str, deadline: float = LLM_DEADLINE_SECONDS, **kwargs) -> Any:
+        """
+        chat.completions.create with deadline, retries and circuit breaker.
+
+        Args:
+            purpose: What the call is for ('reply', 'extraction', ...) - keys the metrics
+            deadline: Seconds for the whole call, retries included
+            **kwargs: Passed to chat.completions.create
+
+        Raises:
+            CircuitOpenError while the breaker is open, else the last attempt's error
+        """
+        started = time.perf_counter()
+        deadline_at = time.monotonic() + deadline
+        attempt = 0
+        while True:
+            self._check_breaker(purpose)
+            llm_metrics.record_event(purpose, "attempt")
+            try:
+                response = self.client.chat.completions.create(timeout=max(deadline_at - time.monotonic(), 0.1), **kwargs)
+            except Exception as e:
+                delay = self._attempt_failed(purpose, e, attempt, deadline_at)
+                if delay is None:
+                    raise
+                time.sleep(delay)
+                attempt += 1
+                continue
+            self._succeeded(purpose, response, started, kwargs.get("stream", False))
+            return response
+
+    async def acomplete(
+        self,
+        purpose: str,
+        deadline: float = LLM_DEADLINE_SECONDS,
+        hedge: bool = LLM_HEDGE_ENABLED,
+        **kwargs
+    ) -> Any:
+        """
+        Async complete(). With hedge=True (not for streams), an attempt still
+        running after the recent p95 latency for `purpose` gets a duplicate
+        request; whichever answers first wins and the other is cancelled.
+        """
+        stream = kwargs.get("stream", False)
+        started = time.perf_counter()
+        deadline_at = time.monotonic() + deadline
+        attempt = 0
+        while True:
+            self._check_breaker(purpose)
+            try:
+                response = await self._attempt_async(purpose, deadline_at, hedge and not stream, kwargs)
+            except Exception as e:
+                delay = self._attempt_failed(purpose, e, attempt, deadline_at)
+                if delay is None:
+                    raise
+                await asyncio.sleep(delay)
+                attempt += 1
+                continue
+            self._succeeded(purpose, response, started, stream)
+            return response
+
+    async def _attempt_async(self, purpose: str, deadline_at: float, hedge: bool, kwargs: Dict) -> Any:
+        def request() -> asyncio.Task:
+            llm_metrics.record_event(purpose, "attempt")
+            remaining = max(deadline_at - time.monotonic(), 0.1)
+            return asyncio.ensure_future(asyncio.wait_for(
+                self.async_client.chat.completions.create(timeout=remaining, **kwargs), remaining
+            ))
+
+        first = request()
+        tasks = [first]
+        try:
+            if not hedge:
+                return await first
+
+            delay = llm_metrics.recent_percentile(purpose, 0.95) or LLM_HEDGE_DELAY_SECONDS
+            done, _ = await asyncio.wait(tasks, timeout=min(delay, max(deadline_at - time.monotonic(), 0)))
+            if done or not self.breaker.allow():
+                return await first
+
+            llm_metrics.record_event(purpose, "hedge")
+            logger.debug(f"[LLM] Hedging {purpose} after {delay:.2f}s")
+            hedged = request()
+            tasks.append(hedged)
+            pending = set(tasks)
+            error = None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.cancelled():
+                        # Not by us (we only cancel on the way out); the other attempt may still answer
+                        continue
+                    if task.exception() is None:
+                        if task is hedged:
+                            llm_metrics.record_event(purpose, "hedge_win")
+                        return task.result()
+                    error = task.exception()
+            # Both cancelled: same as an unhedged call whose request was cancelled
+            raise error or asyncio.CancelledError()
+        finally:
+            # Loser of a hedge, or our caller gave up
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+
+    def _build_static_content(
         self,
         core_framework: str,
         security_rules: str,
         instance_persona: str,
         instance_definition: dict,
-        user_context: dict,
     ) -> str:
         """
-        Build system content as a single string.
+        Build the static system prefix: frameworks, instance and persona.
+
+        Byte-identical for every user of an instance (JSON keys sorted),
+        so the provider's prompt cache can reuse it across calls.
         """
-        # Static content - frameworks and persona
-        static_content = f"""
+        return f"""
 {core_framework}
 
 ---
@@ -51,7 +332,7 @@ class LLMClient:
 ## THIS INSTANCE
 
 ```json
-{json.dumps(instance_definition, indent=2)}
+{json.dumps(instance_definition, indent=2, sort_keys=True)}
 ```
 
 ---
@@ -61,11 +342,15 @@ class LLMClient:
 {instance_persona}
 """
 
-        # Dynamic content - user context
-        if user_context:
-            context_content = f"""
----
+    def _build_context_content(self, user_context: dict) -> Optional[str]:
+        """
+        Build the dynamic system suffix from user context, sent as a separate
+        message after the static prefix.
+        """
+        if not user_context:
+            return None
 
+        return f"""
 ## USER CONTEXT
 
 **Phase**: {user_context.get('phase', 'unknown')}
@@ -75,11 +360,8 @@ class LLMClient:
 **Pattern Flags**: {user_context.get('pattern_flags', {})}
 
 **User Facts**:
-{json.dumps(user_context.get('facts', {}), indent=2)}
+{json.dumps(user_context.get('facts', {}), indent=2, sort_keys=True)}
 """
-            return static_content + context_content
-
-        return static_content
 
     def _build_messages(self, recent_messages: List[Dict]) -> List[Dict]:
         """
@@ -124,22 +406,22 @@ class LLMClient:
         """
         model = model or PRIMARY_MODEL
 
-        # Build system content
-        system_content = self._build_system_content(
+        # Static prefix first (cacheable), then the per-user context
+        messages = [{"role": "system", "content": self._build_static_content(
             core_framework=core_framework,
             security_rules=security_rules,
             instance_persona=instance_persona,
             instance_definition=instance_definition,
-            user_context=user_context,
-        )
-
-        # Build messages with system prompt
-        messages = [{"role": "system", "content": system_content}]
+        )}]
+        context_content = self._build_context_content(user_context)
+        if context_content:
+            messages.append({"role": "system", "content": context_content})
         messages.extend(self._build_messages(recent_messages or []))
         messages.append({"role": "user", "content": user_message})
 
         try:
-            response = self.client.chat.completions.create(
+            response = self.complete(
+                "generate",
                 model=model,
                 max_tokens=1024,
                 messages=messages
@@ -149,6 +431,7 @@ class LLMClient:
             if hasattr(response, 'usage') and response.usage:
                 logger.info(
                     f"Tokens - Input: {response.usage.prompt_tokens}, "
+                    f"Cached: {cached_tokens_of(response.usage)}, "
                     f"Output: {response.usage.completion_tokens}"
                 )
 
@@ -158,6 +441,36 @@ class LLMClient:
             logger.error(f"LLM generation error: {e}")
             raise
 
+    def _extraction_messages(self, text: str, extraction_prompt: str, schema_description: str) -> List[Dict]:
+        full_prompt = f"""
+{extraction_prompt}
+
+Text to analyze:
+"{text}"
+
+Expected output schema:
+{schema_description}
+
+Respond with valid JSON only. No markdown, no explanation.
+"""
+        return [{"role": "user", "content": full_prompt}]
+
+    def _parse_extraction(self, response: Any) -> Optional[Dict]:
+        response_text = response.choices[0].message.content.strip()
+
+        # Clean potential markdown formatting
+        if response_text.startswith("```"):
+            response_text = response_text.split("```")[1]
+            if response_text.startswith("json"):
+                response_text = response_text[4:]
+            response_text = response_text.strip()
+
+        try:
+            return json.loads(response_text)
+        except json.JSONDecodeError as e:
+            logger.error(f"JSON parse error in extraction: {e}")
+            return None
+
     def extract_structured(
         self,
         text: str,
@@ -176,39 +489,33 @@ class LLMClient:
         Returns:
             Extracted data as dict, or None if extraction failed
         """
-        full_prompt = f"""
-{extraction_prompt}
-
-Text to analyze:
-"{text}"
-
-Expected output schema:
-{schema_description}
-
-Respond with valid JSON only. No markdown, no explanation.
-"""
-
         try:
-            response = self.client.chat.completions.create(
+            response = self.complete(
+                "extraction",
                 model=EXTRACTION_MODEL,
                 max_tokens=512,
-                messages=[{"role": "user", "content": full_prompt}]
+                messages=self._extraction_messages(text, extraction_prompt, schema_description)
             )
-
-            response_text = response.choices[0].message.content.strip()
-
-            # Clean potential markdown formatting
-            if response_text.startswith("```"):
-                response_text = response_text.split("```")[1]
-                if response_text.startswith("json"):
-                    response_text = response_text[4:]
-                response_text = response_text.strip()
-
-            return json.loads(response_text)
-
-        except json.JSONDecodeError as e:
-            logger.error(f"JSON parse error in extraction: {e}")
+            return self._parse_extraction(response)
+        except Exception as e:
+            logger.error(f"Extraction error: {e}")
             return None
+
+    async def extract_structured_async(
+        self,
+        text: str,
+        extraction_prompt: str,
+        schema_description: str
+    ) -> Optional[Dict]:
+        """extract_structured() on the async client - doesn't hold a thread while the model works."""
+        try:
+            response = await self.acomplete(
+                "extraction",
+                model=EXTRACTION_MODEL,
+                max_tokens=512,
+                messages=self._extraction_messages(text, extraction_prompt, schema_description)
+            )
+            return self._parse_extraction(response)
         except Exception as e:
             logger.error(f"Extraction error: {e}")
             return None
@@ -0,0 +1,347 @@
+"""
+Metrics Module
+In-process counters for LLM usage, read by the admin commands.
+
+Every completion reports its usage here: prompt, cached and completion
+tokens plus latency. That gives the provider prompt-cache hit rate and
+an estimate of what caching saved (input cost at the cached discount,
+and mean latency of calls that hit the cache vs those that didn't).
+
+Calls made through LLMClient's resilient wrapper also record their
+end-to-end latency in fixed-bucket histograms (for p50/p95/p99) and the
+retries, hedges, timeouts and circuit-breaker rejections along the way.
+
+Each user turn is traced (see core.tracing): the engine opens a turn
+with start_turn(), every completion made from that context (including
+tasks and threads spawned from it) is charged to it, and finish_turn()
+folds its per-stage timings, storage bytes and LLM calls into the
+per-stage histograms. prometheus() and export_json() render everything
+for scraping.
+"""
+
+import bisect
+import json
+import logging
+import threading
+from collections import Counter, deque
+from typing import Any, Deque, Dict, List, Optional, Sequence
+
+from config import INPUT_PRICE_PER_MTOK, CACHED_INPUT_PRICE_PER_MTOK, WORKER_ID
+from core import tracing
+from core.tracing import TurnTrace
+
+logger = logging.getLogger(__name__)
+
+
+# Histogram bucket upper bounds in milliseconds (last bucket is open-ended)
+LATENCY_BUCKETS_MS = (50, 100, 250, 500, 1000, 2000, 3000, 5000, 8000, 13000, 20000, 30000, 60000)
+
+# Turn stages range from microseconds (output filter) to the LLM call
+STAGE_BUCKETS_MS = (
+    0.1, 0.25, 0.5, 1, 2, 3, 5, 8, 13, 20, 30, 50, 80, 130, 200, 300, 500, 800,
+    1300, 2000, 3000, 5000, 8000, 13000, 20000, 30000, 60000
+)
+
+# Recent latencies kept per purpose for exact percentiles (hedge delay)
+RECENT_LATENCIES = 256
+
+
+class LatencyHistogram:
+    """Fixed-bucket latency histogram; percentiles interpolate within a bucket (clamped to the min/max seen)."""
+
+    __slots__ = ("bounds", "counts", "total", "sum_ms", "min_ms", "max_ms")
+
+    def __init__(self, bounds: Sequence[float] = LATENCY_BUCKETS_MS):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.total = 0
+        self.sum_ms = 0.0
+        self.min_ms = 0.0
+        self.max_ms = 0.0
+
+    def observe(self, ms: float):
+        self.counts[bisect.bisect_left(self.bounds, ms)] += 1
+        self.min_ms = min(self.min_ms, ms) if self.total else ms
+        self.total += 1
+        self.sum_ms += ms
+        self.max_ms = max(self.max_ms, ms)
+
+    def percentile(self, p: float) -> Optional[float]:
+        if not self.total:
+            return None
+        rank = p * self.total
+        seen = 0
+        for i, count in enumerate(self.counts):
+            if count and seen + count >= rank:
+                # Assume the bucket's samples are spread evenly across it
+                lower = max(self.bounds[i - 1] if i else 0.0, self.min_ms)
+                upper = min(self.bounds[i] if i < len(self.bounds) else self.max_ms, self.max_ms)
+                return lower + (upper - lower) * max(0.0, rank - seen) / count
+            seen += count
+        return self.max_ms
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "count": self.total,
+            "mean_ms": self.sum_ms / self.total if self.total else None,
+            "p50_ms": self.percentile(0.50),
+            "p95_ms": self.percentile(0.95),
+            "p99_ms": self.percentile(0.99),
+            "max_ms": self.max_ms if self.total else None,
+            "buckets": dict(zip([f"le_{b}" for b in self.bounds] + ["inf"], self.counts))
+        }
+
+    def prometheus(self, name: str, labels: str) -> List[str]:
+        """Exposition lines for a Prometheus histogram in seconds (cumulative buckets)."""
+        lines = []
+        seen = 0
+        for bound, count in zip(self.bounds, self.counts):
+            seen += count
+            lines.append(f'{name}_bucket{{{labels},le="{bound / 1000:g}"}} {seen}')
+        lines.append(f'{name}_bucket{{{labels},le="+Inf"}} {self.total}')
+        lines.append(f"{name}_sum{{{labels}}} {self.sum_ms / 1000:.6f}")
+        lines.append(f"{name}_count{{{labels}}} {self.total}")
+        return lines
+
+
+def _with_label(line: str, label: str) -> str:
+    """Add a label to one exposition line (comments are left alone)."""
+    if line.startswith("#"):
+        return line
+    name, _, value = line.partition(" ")
+    if "{" in name:
+        return name.replace("{", "{" + label + ",", 1) + " " + value
+    return f"{name}{{{label}}} {value}"
+
+
+def cached_tokens_of(usage: Any) -> int:
+    """usage.prompt_tokens_details.cached_tokens, or 0 when not reported."""
+    details = getattr(usage, "prompt_tokens_details", None)
+    return getattr(details, "cached_tokens", None) or 0
+
+
+class LLMMetrics:
+    """Thread-safe usage counters, per call purpose ('reply', 'extraction', ...)."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self._by_purpose: Dict[str, Dict[str, float]] = {}
+            self._turns = 0
+            self._turn_calls: Counter = Counter()
+            self._latency: Dict[str, LatencyHistogram] = {}
+            self._recent: Dict[str, Deque[float]] = {}
+            self._events: Dict[str, Counter] = {}
+            self._stages: Dict[str, LatencyHistogram] = {}
+            self._turn_io = {"bytes_read": 0, "bytes_written": 0}
+            self._turn_tokens = {"prompt": 0, "cached": 0, "completion": 0}
+
+    def record_usage(self, purpose: str, usage: Any, latency: float):
+        """
+        Record one completion.
+
+        Args:
+            purpose: What the call was for, e.g. 'reply'
+            usage: The response's `usage` object (None is ignored)
+            latency: Seconds the call took
+        """
+        trace = tracing.current()
+        if trace is not None:
+            trace.llm_calls[purpose] += 1
+
+        if usage is None:
+            return
+        prompt = getattr(usage, "prompt_tokens", 0) or 0
+        completion = getattr(usage, "completion_tokens", 0) or 0
+        cached = cached_tokens_of(usage)
+
+        if trace is not None:
+            trace.prompt_tokens += prompt
+            trace.cached_tokens += cached
+            trace.completion_tokens += completion
+
+        with self._lock:
+            stats = self._by_purpose.setdefault(purpose, {
+                "calls": 0, "cache_hits": 0,
+                "prompt_tokens": 0, "cached_tokens": 0, "completion_tokens": 0,
+                "hit_latency": 0.0, "miss_latency": 0.0
+            })
+            stats["calls"] += 1
+            stats["prompt_tokens"] += prompt
+            stats["cached_tokens"] += cached
+            stats["completion_tokens"] += completion
+            if cached:
+                stats["cache_hits"] += 1
+                stats["hit_latency"] += latency
+            else:
+                stats["miss_latency"] += latency
+
+        logger.debug(f"[METRICS] {purpose}: {prompt} prompt ({cached} cached), {completion} completion, {latency:.2f}s")
+
+    def record_latency(self, purpose: str, seconds: float):
+        """End-to-end latency of a successful call (retries and hedges included)."""
+        ms = seconds * 1000
+        with self._lock:
+            self._latency.setdefault(purpose, LatencyHistogram()).observe(ms)
+            self._recent.setdefault(purpose, deque(maxlen=RECENT_LATENCIES)).append(ms)
+
+    def record_event(self, purpose: str, event: str):
+        """Count an event: 'attempt', 'retry', 'timeout', 'hedge', 'hedge_win', 'breaker_open', 'failure', 'coalesced'."""
+        with self._lock:
+            self._events.setdefault(purpose, Counter())[event] += 1
+
+    def recent_percentile(self, purpose: str, p: float, min_samples: int = 20) -> Optional[float]:
+        """p-th percentile (seconds) of recent successful latencies, or None with too few samples."""
+        with self._lock:
+            recent: List[float] = sorted(self._recent.get(purpose, ()))
+        if len(recent) < min_samples:
+            return None
+        return recent[min(len(recent) - 1, int(p * len(recent)))] / 1000
+
+    def latency_snapshot(self) -> Dict[str, Dict[str, Any]]:
+        """Per-purpose latency histogram summary plus resilience event counters."""
+        with self._lock:
+            purposes = set(self._latency) | set(self._events)
+            return {
+                purpose: {
+                    **(self._latency[purpose].snapshot() if purpose in self._latency else LatencyHistogram().snapshot()),
+                    "events": dict(self._events.get(purpose, {}))
+                }
+                for purpose in sorted(purposes)
+            }
+
+    def start_turn(self) -> TurnTrace:
+        """Open a trace for a user turn in the current context (see core.tracing)."""
+        return tracing.start_turn()
+
+    def finish_turn(self, trace: TurnTrace, user_id: str = None):
+        """Close a turn opened with start_turn() and fold it into the per-turn and per-stage stats."""
+        tracing.end_turn(trace)
+        with self._lock:
+            self._turns += 1
+            self._turn_calls.update(trace.llm_calls)
+            for name, seconds in trace.stages.items():
+                self._stages.setdefault(name, LatencyHistogram(STAGE_BUCKETS_MS)).observe(seconds * 1000)
+            self._turn_io["bytes_read"] += trace.bytes_read
+            self._turn_io["bytes_written"] += trace.bytes_written
+            self._turn_tokens["prompt"] += trace.prompt_tokens
+            self._turn_tokens["cached"] += trace.cached_tokens
+            self._turn_tokens["completion"] += trace.completion_tokens
+
+        calls = ", ".join(f"{purpose}={count}" for purpose, count in sorted(trace.llm_calls.items())) or "none"
+        reply = f", reply {trace.stages['reply'] * 1000:.0f}ms" if "reply" in trace.stages else ""
+        logger.info(
+            f"[METRICS] Turn{f' for {user_id}' if user_id else ''}: {sum(trace.llm_calls.values())} LLM calls ({calls}){reply}, "
+            f"{trace.bytes_read} bytes read / {trace.bytes_written} written"
+        )
+
+    def turn_snapshot(self) -> Dict[str, Any]:
+        """Turns counted so far and mean LLM calls per turn, overall and by purpose."""
+        with self._lock:
+            turns = self._turns
+            calls = dict(self._turn_calls)
+        return {
+            "turns": turns,
+            "calls_per_turn": sum(calls.values()) / turns if turns else 0.0,
+            "by_purpose": {purpose: count / turns for purpose, count in calls.items()} if turns else {}
+        }
+
+    def perf_snapshot(self) -> Dict[str, Any]:
+        """Per-stage latency histograms plus mean storage bytes and tokens per turn."""
+        with self._lock:
+            turns = self._turns
+            stages = {name: histogram.snapshot() for name, histogram in self._stages.items()}
+            io = dict(self._turn_io)
+            tokens = dict(self._turn_tokens)
+        per_turn = {f"{key}_per_turn": value / turns if turns else 0.0 for key, value in io.items()}
+        per_turn.update({f"{key}_tokens_per_turn": value / turns if turns else 0.0 for key, value in tokens.items()})
+        return {"turns": turns, "stages": stages, **io, **per_turn}
+
+    def export_json(self) -> str:
+        """Every snapshot in one JSON document (the stats endpoint / textfile)."""
+        return json.dumps({
+            "usage": self.snapshot(),
+            "latency": self.latency_snapshot(),
+            "turns": self.turn_snapshot(),
+            "perf": self.perf_snapshot()
+        }, indent=2, sort_keys=True)
+
+    def prometheus(self) -> str:
+        """Everything in the Prometheus text exposition format."""
+        usage = self.snapshot()
+        with self._lock:
+            stages = list(self._stages.items())
+            latency = list(self._latency.items())
+            events = {purpose: dict(counter) for purpose, counter in self._events.items()}
+            turns = self._turns
+            turn_calls = dict(self._turn_calls)
+            io = dict(self._turn_io)
+            tokens = dict(self._turn_tokens)
+
+            lines = [
+                "# HELP gate_turn_stage_seconds Time spent in each stage of a user turn.",
+                "# TYPE gate_turn_stage_seconds histogram"
+            ]
+            for name, histogram in stages:
+                lines.extend(histogram.prometheus("gate_turn_stage_seconds", f'stage="{name}"'))
+            lines += [
+                "# HELP gate_llm_call_seconds End-to-end LLM call latency (retries and hedges included).",
+                "# TYPE gate_llm_call_seconds histogram"
+            ]
+            for purpose, histogram in latency:
+                lines.extend(histogram.prometheus("gate_llm_call_seconds", f'purpose="{purpose}"'))
+
+        lines += [
+            "# HELP gate_turns_total User turns finished.",
+            "# TYPE gate_turns_total counter",
+            f"gate_turns_total {turns}",
+            "# HELP gate_turn_llm_calls_total LLM calls made from user turns.",
+            "# TYPE gate_turn_llm_calls_total counter"
+        ]
+        lines += [f'gate_turn_llm_calls_total{{purpose="{purpose}"}} {count}' for purpose, count in sorted(turn_calls.items())]
+        lines += [
+            "# HELP gate_turn_storage_bytes_total Storage bytes read and written by user turns.",
+            "# TYPE gate_turn_storage_bytes_total counter",
+            f'gate_turn_storage_bytes_total{{direction="read"}} {io["bytes_read"]}',
+            f'gate_turn_storage_bytes_total{{direction="written"}} {io["bytes_written"]}',
+            "# HELP gate_turn_llm_tokens_total LLM tokens used by user turns.",
+            "# TYPE gate_turn_llm_tokens_total counter"
+        ]
+        lines += [f'gate_turn_llm_tokens_total{{kind="{kind}"}} {count}' for kind, count in tokens.items()]
+        lines += [
+            "# HELP gate_llm_tokens_total LLM tokens by call purpose.",
+            "# TYPE gate_llm_tokens_total counter"
+        ]
+        for purpose, stats in sorted(usage.items()):
+            for kind in ("prompt", "cached", "completion"):
+                lines.append(f'gate_llm_tokens_total{{purpose="{purpose}",kind="{kind}"}} {stats[f"{kind}_tokens"]}')
+        lines += [
+            "# HELP gate_llm_events_total Retries, timeouts, hedges and circuit-breaker rejections.",
+            "# TYPE gate_llm_events_total counter"
+        ]
+        for purpose, counter in sorted(events.items()):
+            lines += [f'gate_llm_events_total{{purpose="{purpose}",event="{event}"}} {count}' for event, count in sorted(counter.items())]
+
+        if WORKER_ID is not None:
+            # Webhook workers export one file each; the label keeps their series apart
+            lines = [_with_label(line, f'worker="{WORKER_ID}"') for line in lines]
+        return "\n".join(lines) + "\n"
+
+    def snapshot(self) -> Dict[str, Dict[str, Any]]:
+        """Per-purpose totals plus derived hit rate, savings and latencies."""
+        with self._lock:
+            by_purpose = {purpose: dict(stats) for purpose, stats in self._by_purpose.items()}
+
+        for stats in by_purpose.values():
+            misses = stats["calls"] - stats["cache_hits"]
+            stats["cached_ratio"] = stats["cached_tokens"] / stats["prompt_tokens"] if stats["prompt_tokens"] else 0.0
+            stats["saved_usd"] = stats["cached_tokens"] * (INPUT_PRICE_PER_MTOK - CACHED_INPUT_PRICE_PER_MTOK) / 1e6
+            stats["hit_latency_ms"] = 1000 * stats.pop("hit_latency") / stats["cache_hits"] if stats["cache_hits"] else None
+            stats["miss_latency_ms"] = 1000 * stats.pop("miss_latency") / misses if misses else None
+        return by_purpose
+
+
+llm_metrics = LLMMetrics()
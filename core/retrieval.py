@@ -0,0 +1,213 @@
+"""
+Knowledge Retrieval
+BM25 over the framework markdown in knowledge/.
+
+Files are chunked by heading (long sections split on paragraphs), then an
+inverted index is built with the BM25 weight of every (term, chunk) pair
+precomputed, so a query is just a sum over a few posting lists. The index
+is persisted as JSON and rebuilt only when a source file's mtime or size
+changes (or files are added/removed).
+"""
+
+import heapq
+import logging
+import math
+import re
+from collections import Counter
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from config import (
+    KNOWLEDGE_DIR,
+    KNOWLEDGE_INDEX_PATH,
+    KNOWLEDGE_CHUNK_MAX_CHARS,
+    KNOWLEDGE_MIN_SCORE,
+)
+from memory.storage import atomic_write_json, read_json
+
+logger = logging.getLogger(__name__)
+
+INDEX_VERSION = 1
+
+# BM25 parameters
+K1 = 1.2
+B = 0.75
+
+_HEADING_RE = re.compile(r"^(#{1,6})\s+(.*?)\s*#*\s*$")
+_WORD_RE = re.compile(r"[a-z0-9]+")
+
+STOPWORDS = frozenset("""
+a about above after again against all am an and any are as at be because been before being
+below between both but by can could did do does doing down during each few for from further
+had has have having he her here hers herself him himself his how i if in into is it its itself
+just me more most my myself no nor not now of off on once only or other our ours ourselves out
+over own same she should so some such than that the their theirs them themselves then there
+these they this those through to too under until up very was we were what when where which
+while who whom why will with would you your yours yourself yourselves s t don im ive id its
+""".split())
+
+
+def _stem(word: str) -> str:
+    """Crude suffix stripping - only has to be consistent between index and query."""
+    for suffix in ("ing", "ed", "es", "s"):
+        if word.endswith(suffix) and len(word) - len(suffix) >= 3:
+            return word[:-len(suffix)]
+    return word
+
+
+def tokenize(text: str) -> List[str]:
+    return [_stem(w) for w in _WORD_RE.findall(text.lower()) if w not in STOPWORDS]
+
+
+def chunk_markdown(text: str, source: str, max_chars: int = KNOWLEDGE_CHUNK_MAX_CHARS) -> List[Dict]:
+    """
+    Split a markdown document into chunks, one per heading.
+
+    Each chunk carries its heading path ("Doc > Section > Subsection") so a
+    retrieved chunk still says what it's about. Sections longer than
+    max_chars are split on blank lines; sections with no body are skipped.
+    """
+    chunks = []
+    path: List[Tuple[int, str]] = []
+    body: List[str] = []
+
+    def flush():
+        section = "\n".join(body).strip().strip("-").strip()
+        if not section:
+            return
+        heading = " > ".join(title for _, title in path) or Path(source).stem
+        part = []
+        size = 0
+        for paragraph in re.split(r"\n\s*\n", section):
+            paragraph = paragraph.strip()
+            if not paragraph or paragraph == "---":
+                continue
+            if part and size + len(paragraph) > max_chars:
+                chunks.append({"source": source, "heading": heading, "text": "\n\n".join(part)})
+                part, size = [], 0
+            part.append(paragraph)
+            size += len(paragraph) + 2
+        if part:
+            chunks.append({"source": source, "heading": heading, "text": "\n\n".join(part)})
+
+    for line in text.splitlines():
+        match = _HEADING_RE.match(line)
+        if match:
+            flush()
+            body = []
+            level = len(match.group(1))
+            path = [(lvl, title) for lvl, title in path if lvl < level]
+            path.append((level, match.group(2).strip("*_ ")))
+        else:
+            body.append(line)
+    flush()
+
+    return chunks
+
+
+class KnowledgeIndex:
+    """
+    Persisted BM25 index over a directory of markdown files.
+
+    Usage:
+        knowledge_index.load()
+        for score, chunk in knowledge_index.search("i keep procrastinating", k=3):
+            ...
+    """
+
+    def __init__(self, knowledge_dir: Path, index_path: Path):
+        self.knowledge_dir = Path(knowledge_dir)
+        self.index_path = Path(index_path)
+        self.chunks: List[Dict] = []
+        self.postings: Dict[str, Tuple[List[int], List[float]]] = {}
+        self._loaded = False
+
+    @property
+    def loaded(self) -> bool:
+        return self._loaded
+
+    def _sources(self) -> Dict[str, List[int]]:
+        """{filename: [mtime_ns, size]} for every markdown file in the corpus."""
+        if not self.knowledge_dir.is_dir():
+            return {}
+        sources = {}
+        for path in sorted(self.knowledge_dir.glob("*.md")):
+            stat = path.stat()
+            sources[path.name] = [stat.st_mtime_ns, stat.st_size]
+        return sources
+
+    def load(self):
+        """Load the persisted index, rebuilding it first if the corpus changed."""
+        sources = self._sources()
+        data = read_json(self.index_path, dict)
+
+        if data.get("version") == INDEX_VERSION and data.get("sources") == sources:
+            self.chunks = data["chunks"]
+            self.postings = {term: (ids, weights) for term, (ids, weights) in data["postings"].items()}
+            logger.info(f"[RETRIEVAL] Loaded index: {len(self.chunks)} chunks, {len(self.postings)} terms")
+        else:
+            self.build(sources)
+        self._loaded = True
+
+    def build(self, sources: Optional[Dict[str, List[int]]] = None):
+        """Chunk the corpus, compute BM25 weights and persist the index."""
+        sources = self._sources() if sources is None else sources
+
+        chunks = []
+        for name in sources:
+            text = (self.knowledge_dir / name).read_text(encoding="utf-8")
+            chunks.extend(chunk_markdown(text, name))
+
+        # Heading is indexed with the body - it's usually the best summary of the chunk
+        term_counts = [Counter(tokenize(f"{chunk['heading']}\n{chunk['text']}")) for chunk in chunks]
+        lengths = [sum(counts.values()) for counts in term_counts]
+        avg_length = (sum(lengths) / len(lengths)) if lengths else 1.0
+
+        doc_freq: Counter = Counter()
+        for counts in term_counts:
+            doc_freq.update(counts.keys())
+
+        n = len(chunks)
+        postings: Dict[str, Tuple[List[int], List[float]]] = {}
+        for chunk_id, counts in enumerate(term_counts):
+            norm = K1 * (1 - B + B * lengths[chunk_id] / avg_length)
+            for term, tf in counts.items():
+                idf = math.log(1 + (n - doc_freq[term] + 0.5) / (doc_freq[term] + 0.5))
+                ids, weights = postings.setdefault(term, ([], []))
+                ids.append(chunk_id)
+                weights.append(round(idf * tf * (K1 + 1) / (tf + norm), 4))
+
+        self.chunks = chunks
+        self.postings = postings
+
+        try:
+            self.index_path.parent.mkdir(parents=True, exist_ok=True)
+            atomic_write_json(self.index_path, {
+                "version": INDEX_VERSION,
+                "sources": sources,
+                "chunks": chunks,
+                "postings": postings,
+            }, indent=None)
+        except (OSError, TypeError) as e:
+            logger.error(f"[RETRIEVAL] Could not persist index to {self.index_path}: {e}")
+
+        logger.info(f"[RETRIEVAL] Built index: {len(sources)} files, {n} chunks, {len(postings)} terms")
+
+    def search(self, query: str, k: int = 3, min_score: float = KNOWLEDGE_MIN_SCORE) -> List[Tuple[float, Dict]]:
+        """Top-k (score, chunk) pairs for query, best first, scoring at least min_score."""
+        if not self._loaded:
+            self.load()
+
+        scores: Dict[int, float] = {}
+        for term in set(tokenize(query)):
+            posting = self.postings.get(term)
+            if posting is None:
+                continue
+            for chunk_id, weight in zip(*posting):
+                scores[chunk_id] = scores.get(chunk_id, 0.0) + weight
+
+        best = heapq.nlargest(k, scores.items(), key=lambda item: item[1])
+        return [(score, self.chunks[chunk_id]) for chunk_id, score in best if score >= min_score]
+
+
+knowledge_index = KnowledgeIndex(KNOWLEDGE_DIR, KNOWLEDGE_INDEX_PATH)
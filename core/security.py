@@ -3,9 +3,13 @@ Security Module
 Multi-layer defense against prompt injection and data leakage.
 """
 
+import atexit
 import re
+import threading
+import time
 import unicodedata
-from datetime import datetime, timedelta
+from collections import deque
+from pathlib import Path
 from typing import Tuple, Optional, Dict
 import json
 
@@ -16,7 +20,12 @@ from config import (
     MAX_SUSPICIOUS_ATTEMPTS,
     BLOCK_DURATION_MINUTES,
     ADMIN_USER_ID,
+    RATE_LIMIT_STATE_PATH,
+    RATE_LIMIT_OVERRIDES_PATH,
+    RATE_LIMIT_SNAPSHOT_SECONDS,
+    WORKER_ID,
 )
+from memory.storage import atomic_write_json, read_json
 
 
 import logging
@@ -24,6 +33,31 @@ import logging
 logger = logging.getLogger(__name__)
 
 
+def _fold_case(pattern: str) -> str:
+    """
+    Pattern for matching already-lowercased text without re.IGNORECASE.
+    Only patterns with uppercase literals need the (slower) inline flag.
+    """
+    return f"(?i:{pattern})" if re.search(r'(?<!\\)[A-Z]', pattern) else pattern
+
+
+def _compile_any(patterns: list) -> re.Pattern:
+    """
+    One non-capturing alternation of patterns, for lowercased text.
+    Capturing or named groups would stop sre from optimising the
+    alternation, so this only answers "does anything match".
+    """
+    return re.compile("|".join(f"(?:{_fold_case(pattern)})" for pattern in patterns))
+
+
+def _first_match(compiled: list, text: str) -> Optional[int]:
+    """Index of the first pattern (in list order) that matches."""
+    for i, pattern in enumerate(compiled):
+        if pattern.search(text):
+            return i
+    return None
+
+
 class InputSanitizer:
     """Layer 1: Input sanitization and injection detection."""
 
@@ -90,21 +124,47 @@ class InputSanitizer:
             '0': 'o', '1': 'i', '3': 'e', '4': 'a', 
             '5': 's', '7': 't', '@': 'a', '$': 's'
         }
+
+        self.compile()
+
+    def compile(self):
+        """Build the compiled scanner; call again after changing the pattern lists."""
+        compile_all = lambda patterns: [re.compile(p, re.IGNORECASE) for p in patterns]
+        self._disagreement = compile_all(self.DISAGREEMENT_PATTERNS)
+        self._dangerous = compile_all(self.dangerous_patterns)
+        self._obfuscation = compile_all(self.obfuscation_patterns)
+
+        # Single pass over the normalized text: most messages match nothing
+        self._any_flag_re = _compile_any(
+            self.DISAGREEMENT_PATTERNS + self.dangerous_patterns + self.obfuscation_patterns
+        )
+
+        # Redaction: prefilter, then one sub over all patterns; the numbered
+        # group that matched says which redaction type to use
+        self._any_sensitive_re = _compile_any([p for p, _ in self.sensitive_patterns])
+        self._sensitive_re = re.compile(
+            "|".join(f"({pattern})" for pattern, _ in self.sensitive_patterns),
+            re.IGNORECASE
+        )
+        group = 1
+        self._sensitive_groups = {}
+        for i, (pattern, _) in enumerate(self.sensitive_patterns):
+            self._sensitive_groups[group] = i
+            group += re.compile(pattern).groups + 1
+
+        # Zero-width characters dropped, leetspeak mapped, in one translate
+        table = {ord(c): None for c in '\u200b\u200c\u200d\ufeff'}
+        table.update({ord(leet): char for leet, char in self.leet_map.items()})
+        self._normalize_table = table
     
     def normalize_text(self, text: str) -> str:
         """Normalize Unicode and common obfuscations."""
-        # Unicode normalization (handles homoglyphs)
-        text = unicodedata.normalize('NFKC', text)
-        
-        # Remove zero-width characters
-        text = re.sub(r'[\u200b\u200c\u200d\ufeff]', '', text)
-        
-        # Leetspeak normalization for detection
-        normalized = text.lower()
-        for leet, char in self.leet_map.items():
-            normalized = normalized.replace(leet, char)
-        
-        return normalized
+        # Unicode normalization (handles homoglyphs); ASCII is already NFKC
+        if not text.isascii():
+            text = unicodedata.normalize('NFKC', text)
+
+        # Lowercase, then strip zero-width characters and undo leetspeak
+        return text.lower().translate(self._normalize_table)
     
     def detect_injection(self, text: str) -> Tuple[bool, Optional[str]]:
         """
@@ -113,21 +173,27 @@ class InputSanitizer:
         """
         normalized = self.normalize_text(text)
 
-        # Check for disagreement patterns FIRST - these are NOT suspicious
-        for pattern in self.DISAGREEMENT_PATTERNS:
-            if re.search(pattern, normalized, re.IGNORECASE):
-                logger.debug(f"[SECURITY] Disagreement pattern matched: {pattern} - NOT suspicious")
-                return False, None
+        if not self._any_flag_re.search(normalized):
+            return False, None
 
-        for pattern in self.dangerous_patterns:
-            if re.search(pattern, normalized, re.IGNORECASE):
-                logger.info(f"[SECURITY] Dangerous pattern matched: {pattern}")
-                return True, pattern
-
-        for pattern in self.obfuscation_patterns:
-            if re.search(pattern, normalized, re.IGNORECASE):
-                logger.info(f"[SECURITY] Obfuscation pattern matched: {pattern}")
-                return True, f"obfuscation:{pattern}"
+        # Something matched - find out what, with the original precedence
+        # Check for disagreement patterns FIRST - these are NOT suspicious
+        i = _first_match(self._disagreement, normalized)
+        if i is not None:
+            logger.debug(f"[SECURITY] Disagreement pattern matched: {self.DISAGREEMENT_PATTERNS[i]} - NOT suspicious")
+            return False, None
+
+        i = _first_match(self._dangerous, normalized)
+        if i is not None:
+            pattern = self.dangerous_patterns[i]
+            logger.info(f"[SECURITY] Dangerous pattern matched: {pattern}")
+            return True, pattern
+
+        i = _first_match(self._obfuscation, normalized)
+        if i is not None:
+            pattern = self.obfuscation_patterns[i]
+            logger.info(f"[SECURITY] Obfuscation pattern matched: {pattern}")
+            return True, f"obfuscation:{pattern}"
 
         return False, None
     
@@ -136,14 +202,19 @@ class InputSanitizer:
         Redact sensitive information from text.
         Returns: (redacted_text, list of redaction types)
         """
-        redactions = []
-        redacted = text
-        
-        for pattern, redaction_type in self.sensitive_patterns:
-            if re.search(pattern, redacted, re.IGNORECASE):
-                redacted = re.sub(pattern, f'[REDACTED_{redaction_type}]', redacted, flags=re.IGNORECASE)
-                redactions.append(redaction_type)
-        
+        if not self._any_sensitive_re.search(text.lower()):
+            return text, []
+
+        matched = set()
+
+        def replace(match: re.Match) -> str:
+            index = self._sensitive_groups[match.lastindex]
+            matched.add(index)
+            return f'[REDACTED_{self.sensitive_patterns[index][1]}]'
+
+        redacted = self._sensitive_re.sub(replace, text)
+        redactions = [self.sensitive_patterns[i][1] for i in sorted(matched)]
+
         return redacted, redactions
     
     def sanitize(self, text: str) -> Dict:
@@ -194,6 +265,8 @@ class OutputFilter:
             r'\[REDACTED',  # Don't leak redaction markers
         ]
         
+        self._leak_re = _compile_any(self.leak_patterns)
+
         self.replacement = "That's not how this works."
     
     def filter(self, response: str) -> Tuple[str, bool]:
@@ -201,31 +274,160 @@ class OutputFilter:
         Filter response for potential leakage.
         Returns: (filtered_response, was_filtered)
         """
-        for pattern in self.leak_patterns:
-            if re.search(pattern, response, re.IGNORECASE):
-                return self.replacement, True
+        if self._leak_re.search(response.lower()):
+            return self.replacement, True
         
         return response, False
 
 
+class StreamingOutputFilter:
+    """
+    OutputFilter for a reply that arrives in pieces.
+
+    Each feed() only scans the newly arrived text (plus an overlap for
+    patterns straddling chunks), and the last HOLDBACK characters are
+    never released until the next chunk clears them, so a leak is caught
+    before any of it is shown.
+    """
+
+    HOLDBACK = 32
+
+    def __init__(self, output_filter: OutputFilter):
+        self.output_filter = output_filter
+        self.text = ""
+        self.leaked = False
+        self._scanned = 0
+
+    def feed(self, delta: str) -> str:
+        """Add a chunk. Returns the prefix that is safe to show so far."""
+        if self.leaked:
+            return ""
+        self.text += delta
+        start = max(0, self._scanned - self.HOLDBACK)
+        if self.output_filter._leak_re.search(self.text.lower(), start):
+            self.leaked = True
+            return ""
+        self._scanned = len(self.text)
+        return self.text[:max(0, len(self.text) - self.HOLDBACK)]
+
+
+class _Buckets:
+    """Fixed-bucket counter: `size` buckets of `width` seconds, as a ring."""
+
+    __slots__ = ("width", "counts", "slot", "total")
+
+    def __init__(self, size: int, width: float, now: float):
+        self.width = width
+        self.counts = [0] * size
+        self.slot = int(now // width)
+        self.total = 0
+
+    def advance(self, now: float):
+        """Zero the buckets that have rotated out since the last call."""
+        slot = int(now // self.width)
+        gap = slot - self.slot
+        if gap <= 0:
+            return
+        if self.total:
+            size = len(self.counts)
+            if gap >= size:
+                self.counts = [0] * size
+                self.total = 0
+            else:
+                for s in range(self.slot + 1, slot + 1):
+                    i = s % size
+                    self.total -= self.counts[i]
+                    self.counts[i] = 0
+        self.slot = slot
+
+    def add(self, now: float):
+        self.advance(now)
+        self.counts[self.slot % len(self.counts)] += 1
+        self.total += 1
+
+    def ordered(self) -> list:
+        """Counts oldest -> newest (for snapshots)."""
+        size = len(self.counts)
+        return [self.counts[(self.slot - k) % size] for k in range(size - 1, -1, -1)]
+
+    @classmethod
+    def restore(cls, ordered: list, width: float, saved_at: float, now: float) -> "_Buckets":
+        """Rebuild from ordered() taken at monotonic time `saved_at`, then catch up to now."""
+        buckets = cls(len(ordered), width, saved_at)
+        size = len(ordered)
+        for k, count in enumerate(ordered):
+            buckets.counts[(buckets.slot - (size - 1 - k)) % size] = count
+        buckets.total = sum(ordered)
+        buckets.advance(now)
+        return buckets
+
+
+class _UserRate:
+    """Rate limiter state for one user."""
+
+    __slots__ = ("minute", "hour", "blocked_until", "suspicious", "last_seen")
+
+    def __init__(self, now: float):
+        self.minute = _Buckets(6, 10.0, now)    # last minute, 10s buckets
+        self.hour = _Buckets(12, 300.0, now)    # last hour, 5min buckets
+        self.blocked_until = 0.0                # time.monotonic() deadline
+        self.suspicious = 0
+        self.last_seen = now
+
+
 class RateLimiter:
-    """Layer 3: Rate limiting to prevent abuse."""
+    """
+    Layer 3: Rate limiting to prevent abuse.
 
-    def __init__(self):
-        self.user_requests: Dict[str, list] = {}
-        self.user_blocks: Dict[str, datetime] = {}
-        self.suspicious_counts: Dict[str, int] = {}
+    Per-user fixed-bucket counters on time.monotonic(), so a check is O(1)
+    and memory per user is bounded. Idle users are evicted, and counters,
+    blocks, suspicious counts and custom limits are snapshotted to
+    `state_path` so a restart doesn't reset them.
+
+    With several worker processes each one only counts the users routed to
+    it, but custom limits are set from the admin's worker and have to reach
+    all of them: with `limits_path` they live in that shared file instead,
+    re-read whenever it changes.
+    """
+
+    # Users with suspicious strikes but no traffic are forgotten after this
+    SUSPICIOUS_IDLE_SECONDS = 24 * 3600
+
+    # How often the shared limits file is checked for changes
+    LIMITS_REFRESH_SECONDS = 1.0
+
+    def __init__(
+        self,
+        state_path: Path = None,
+        snapshot_seconds: float = RATE_LIMIT_SNAPSHOT_SECONDS,
+        limits_path: Path = None
+    ):
+        self.state_path = state_path
+        self.snapshot_seconds = snapshot_seconds
+        self.limits_path = limits_path
+        self._lock = threading.Lock()
+        self._users: Dict[str, _UserRate] = {}
         # Per-user rate limits: {user_id: {"per_minute": X, "per_hour": Y}}
         self.user_limits: Dict[str, Dict[str, int]] = {}
+        self._limits_version = None
+        self._limits_checked = 0.0
+        self._last_maintenance = time.monotonic()
+        self._dirty = False
+        self.load()
+        self._refresh_limits(force=True)
 
     def set_user_limit(self, user_id: str, per_minute: int = None, per_hour: int = None):
         """Set custom rate limits for a specific user."""
+        self._refresh_limits(force=True)
         if user_id not in self.user_limits:
             self.user_limits[user_id] = {}
         if per_minute is not None:
             self.user_limits[user_id]["per_minute"] = per_minute
         if per_hour is not None:
             self.user_limits[user_id]["per_hour"] = per_hour
+        self._dirty = True
+        self.save()
+        self._save_limits()
 
     def get_user_limits(self, user_id: str) -> Tuple[int, int]:
         """Get rate limits for a user (custom or default)."""
@@ -233,6 +435,8 @@ class RateLimiter:
         if user_id == ADMIN_USER_ID:
             return 9999, 99999
 
+        self._refresh_limits()
+
         user_lim = self.user_limits.get(user_id, {})
         per_min = user_lim.get("per_minute", MAX_MESSAGES_PER_MINUTE)
         per_hr = user_lim.get("per_hour", MAX_MESSAGES_PER_HOUR)
@@ -240,56 +444,84 @@ class RateLimiter:
 
     def remove_user_limit(self, user_id: str):
         """Remove custom limits for a user (revert to defaults)."""
+        self._refresh_limits(force=True)
         if user_id in self.user_limits:
             del self.user_limits[user_id]
+            self._dirty = True
+            self.save()
+            self._save_limits()
 
-    def _cleanup_old_requests(self, user_id: str):
-        """Remove requests older than 1 hour."""
-        if user_id not in self.user_requests:
+    def _refresh_limits(self, force: bool = False):
+        """Pick up limits another worker wrote to limits_path (cheap stat, at most once a second)."""
+        if self.limits_path is None:
+            return
+        now = time.monotonic()
+        if not force and now - self._limits_checked < self.LIMITS_REFRESH_SECONDS:
             return
+        self._limits_checked = now
+        try:
+            stat = self.limits_path.stat()
+        except FileNotFoundError:
+            return
+        version = (stat.st_mtime_ns, stat.st_size)
+        if version != self._limits_version:
+            self.user_limits = read_json(self.limits_path, dict)
+            self._limits_version = version
 
-        cutoff = datetime.now() - timedelta(hours=1)
-        self.user_requests[user_id] = [
-            ts for ts in self.user_requests[user_id] if ts > cutoff
-        ]
+    def _save_limits(self):
+        if self.limits_path is None:
+            return
+        try:
+            self.limits_path.parent.mkdir(parents=True, exist_ok=True)
+            atomic_write_json(self.limits_path, self.user_limits)
+            stat = self.limits_path.stat()
+            self._limits_version = (stat.st_mtime_ns, stat.st_size)
+        except OSError as e:
+            logger.error(f"[SECURITY] Failed to save rate limit overrides: {e}")
+
+    def _user(self, user_id: str, now: float) -> _UserRate:
+        user = self._users.get(user_id)
+        if user is None:
+            user = self._users[user_id] = _UserRate(now)
+        user.last_seen = now
+        return user
 
     def check_rate_limit(self, user_id: str) -> Tuple[bool, Optional[str]]:
         """
         Check if user is within rate limits.
         Returns: (allowed, block_reason)
         """
-        now = datetime.now()
-
-        # Check if user is blocked
-        if user_id in self.user_blocks:
-            if now < self.user_blocks[user_id]:
-                remaining = (self.user_blocks[user_id] - now).seconds // 60
-                return False, f"Blocked for {remaining} more minutes"
-            else:
-                del self.user_blocks[user_id]
-                self.suspicious_counts[user_id] = 0
-
-        # Initialize if needed
-        if user_id not in self.user_requests:
-            self.user_requests[user_id] = []
-
-        self._cleanup_old_requests(user_id)
+        now = time.monotonic()
+        self._maybe_maintain(now)
 
         # Get limits for this user
         max_per_minute, max_per_hour = self.get_user_limits(user_id)
 
-        # Check per-minute limit
-        minute_ago = now - timedelta(minutes=1)
-        recent_minute = [ts for ts in self.user_requests[user_id] if ts > minute_ago]
-        if len(recent_minute) >= max_per_minute:
-            return False, "Too many messages. Slow down."
+        with self._lock:
+            user = self._user(user_id, now)
+
+            # Check if user is blocked
+            if user.blocked_until:
+                if now < user.blocked_until:
+                    remaining = int(user.blocked_until - now) // 60
+                    return False, f"Blocked for {remaining} more minutes"
+                user.blocked_until = 0.0
+                user.suspicious = 0
+
+            # Check per-minute limit
+            user.minute.advance(now)
+            if user.minute.total >= max_per_minute:
+                return False, "Too many messages. Slow down."
 
-        # Check per-hour limit
-        if len(self.user_requests[user_id]) >= max_per_hour:
-            return False, "Hourly limit reached. Try again later."
+            # Check per-hour limit
+            user.hour.advance(now)
+            if user.hour.total >= max_per_hour:
+                return False, "Hourly limit reached. Try again later."
 
-        # Record this request
-        self.user_requests[user_id].append(now)
+            # Record this request
+            user.minute.add(now)
+            user.hour.add(now)
+            self._dirty = True
 
         return True, None
 
@@ -297,16 +529,127 @@ class RateLimiter:
         """
         Record a suspicious attempt. Returns True if user should be blocked.
         """
-        if user_id not in self.suspicious_counts:
-            self.suspicious_counts[user_id] = 0
+        now = time.monotonic()
+        with self._lock:
+            user = self._user(user_id, now)
+            user.suspicious += 1
+            self._dirty = True
+            blocked = user.suspicious >= MAX_SUSPICIOUS_ATTEMPTS
+            if blocked:
+                user.blocked_until = now + BLOCK_DURATION_MINUTES * 60
 
-        self.suspicious_counts[user_id] += 1
+        if blocked:
+            self.save()
+        return blocked
+
+    def __len__(self) -> int:
+        return len(self._users)
+
+    # ---- eviction / persistence -----------------------------------------
 
-        if self.suspicious_counts[user_id] >= MAX_SUSPICIOUS_ATTEMPTS:
-            self.user_blocks[user_id] = datetime.now() + timedelta(minutes=BLOCK_DURATION_MINUTES)
-            return True
+    def _maybe_maintain(self, now: float):
+        if now - self._last_maintenance < self.snapshot_seconds:
+            return
+        self._last_maintenance = now
+        self.evict_idle(now)
+        self.save()
+
+    def evict_idle(self, now: float = None) -> int:
+        """Drop users with nothing left to remember. Returns how many."""
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            idle = []
+            for user_id, user in self._users.items():
+                if user.blocked_until > now:
+                    continue
+                user.minute.advance(now)
+                user.hour.advance(now)
+                if user.hour.total or user.minute.total:
+                    continue
+                if user.suspicious and now - user.last_seen < self.SUSPICIOUS_IDLE_SECONDS:
+                    continue
+                idle.append(user_id)
+            for user_id in idle:
+                del self._users[user_id]
+            if idle:
+                self._dirty = True
+        return len(idle)
+
+    def snapshot(self) -> Dict:
+        """Serializable state; monotonic deadlines become remaining seconds."""
+        now = time.monotonic()
+        with self._lock:
+            users = {}
+            for user_id, user in self._users.items():
+                user.minute.advance(now)
+                user.hour.advance(now)
+                users[user_id] = {
+                    "minute": user.minute.ordered(),
+                    "hour": user.hour.ordered(),
+                    "blocked_for": max(0.0, user.blocked_until - now) if user.blocked_until else 0.0,
+                    "suspicious": user.suspicious
+                }
+            return {
+                "saved_at": time.time(),
+                "user_limits": dict(self.user_limits),
+                "users": users
+            }
+
+    def save(self):
+        """Snapshot to state_path if anything changed since the last save."""
+        if self.state_path is None or not self._dirty:
+            return
+        self._dirty = False
+        try:
+            atomic_write_json(self.state_path, self.snapshot(), indent=None)
+        except Exception as e:
+            self._dirty = True
+            logger.error(f"[SECURITY] Failed to save rate limiter state: {e}")
+
+    def load(self):
+        if self.state_path is None or not self.state_path.exists():
+            return
+        data = read_json(self.state_path, lambda: {})
+        if not data:
+            return
 
-        return False
+        now = time.monotonic()
+        # Wall-clock time since the snapshot, replayed on the monotonic clock
+        saved_at = now - max(0.0, time.time() - data.get("saved_at", time.time()))
+        with self._lock:
+            self.user_limits = data.get("user_limits", {})
+            for user_id, saved in data.get("users", {}).items():
+                user = _UserRate(now)
+                user.minute = _Buckets.restore(saved["minute"], user.minute.width, saved_at, now)
+                user.hour = _Buckets.restore(saved["hour"], user.hour.width, saved_at, now)
+                if saved.get("blocked_for"):
+                    user.blocked_until = saved_at + saved["blocked_for"]
+                user.suspicious = saved.get("suspicious", 0)
+                self._users[user_id] = user
+
+
+class EscalationWindow:
+    """Suspicion flags for a user's last N messages, with a running count."""
+
+    __slots__ = ("flags", "count")
+
+    def __init__(self, size: int, flags=()):
+        self.flags = deque(maxlen=size)
+        self.count = 0
+        for flag in flags:
+            self.push(flag)
+
+    def push(self, flag: bool):
+        """Record the next message's verdict, dropping the oldest one."""
+        if len(self.flags) == self.flags.maxlen:
+            self.count -= self.flags[0]
+        self.flags.append(bool(flag))
+        self.count += bool(flag)
+
+    def count_with(self, flag: bool) -> int:
+        """Red flags in the window if a message with this verdict came next."""
+        oldest = self.flags[0] if len(self.flags) == self.flags.maxlen else False
+        return self.count - oldest + bool(flag)
 
 
 class ConversationMonitor:
@@ -314,15 +657,17 @@ class ConversationMonitor:
     
     def __init__(self):
         self.manipulation_threshold = 3  # Red flags in last 10 messages
+        self.window_size = 10
     
     def check_escalation(self, recent_messages: list, sanitizer: InputSanitizer) -> Tuple[bool, int]:
         """
         Check for gradual manipulation attempts across conversation.
+        Rescans every message; check_window() is the incremental version.
         Returns: (is_escalating, red_flag_count)
         """
         red_flags = 0
         
-        for msg in recent_messages[-10:]:
+        for msg in recent_messages[-self.window_size:]:
             if msg.get('role') == 'user':
                 suspicious, _ = sanitizer.detect_injection(msg.get('content', ''))
                 if suspicious:
@@ -330,17 +675,43 @@ class ConversationMonitor:
         
         return red_flags >= self.manipulation_threshold, red_flags
 
+    def new_window(self, flags=()) -> EscalationWindow:
+        """Window seeded with the verdicts of prior messages, oldest first."""
+        return EscalationWindow(self.window_size, flags)
+
+    def check_window(self, window: EscalationWindow, suspicious: bool) -> Tuple[bool, int]:
+        """
+        Same check as check_escalation for a new message, in O(1).
+        The window itself is advanced when the message is stored.
+        Returns: (is_escalating, red_flag_count)
+        """
+        red_flags = window.count_with(suspicious)
+        return red_flags >= self.manipulation_threshold, red_flags
+
 
 # Global instances
 sanitizer = InputSanitizer()
 output_filter = OutputFilter()
-rate_limiter = RateLimiter()
+# Webhook workers share /limit overrides through their own file
+rate_limiter = RateLimiter(
+    RATE_LIMIT_STATE_PATH,
+    limits_path=RATE_LIMIT_OVERRIDES_PATH if WORKER_ID is not None else None
+)
+atexit.register(rate_limiter.save)
 conversation_monitor = ConversationMonitor()
 
 
-def process_input(user_id: str, text: str, recent_messages: list = None) -> Dict:
+def process_input(
+    user_id: str,
+    text: str,
+    recent_messages: list = None,
+    escalation: EscalationWindow = None
+) -> Dict:
     """
     Full security pipeline for user input.
+
+    Pass the user's EscalationWindow to check escalation from stored
+    verdicts; recent_messages (rescanned every call) is the fallback.
     Returns dict with processed input and security status.
     """
     # Rate limiting
@@ -367,14 +738,17 @@ def process_input(user_id: str, text: str, recent_messages: list = None) -> Dict
         result['warning'] = True
     
     # Conversation-level check
-    if recent_messages:
+    escalating = False
+    if escalation is not None:
+        escalating, count = conversation_monitor.check_window(escalation, result['suspicious'])
+    elif recent_messages:
         escalating, count = conversation_monitor.check_escalation(
             recent_messages + [{'role': 'user', 'content': text}],
             sanitizer
         )
-        if escalating:
-            result['escalation_detected'] = True
-            result['red_flag_count'] = count
+    if escalating:
+        result['escalation_detected'] = True
+        result['red_flag_count'] = count
     
     result['allowed'] = True
     return result
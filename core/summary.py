@@ -0,0 +1,107 @@
+"""
+Summary Module
+Rolling summary of the conversation that has aged out of the history window.
+
+The agent sees the last SESSION_HISTORY_WINDOW messages. Everything
+before them lives on as a compact summary in the user's state:
+
+    state["summary"] = {"text": "...", "through": <id of the last message folded in>, "updated": "..."}
+
+Once SUMMARY_BATCH_MESSAGES more messages have aged out, the engine
+folds them in after a reply (in the background, like extraction): one
+call on the extraction model with the previous summary and only the new
+messages, so the call stays small however long the conversation gets.
+The summary goes into the prompt ahead of the recent turns, capped at
+MAX_SUMMARY_TOKENS - prompt size stays flat for users with thousands of
+messages, and what they said months ago isn't simply gone.
+"""
+
+import logging
+from typing import Dict, List, Optional, Tuple
+
+from config import (
+    EXTRACTION_MODEL,
+    SESSION_HISTORY_WINDOW,
+    SUMMARY_BATCH_MESSAGES,
+    SUMMARY_MAX_FOLD_MESSAGES,
+    SUMMARY_BACKLOG_MESSAGES,
+    MAX_SUMMARY_TOKENS,
+)
+from core.llm import llm_client
+
+logger = logging.getLogger(__name__)
+
+SUMMARY_PROMPT = f"""
+You keep a running summary of a goal-focused coaching conversation between
+a user ("them") and a coach ("gate"). You get the summary so far and the
+messages that came after it. Return the updated summary - nothing else.
+
+Keep what a coach would need weeks later: their goal and why it matters,
+what they committed to and whether they did it, the steps done so far,
+patterns (excuses, avoidance, what actually worked), the real constraint,
+and anything personal they shared that matters. Drop small talk.
+Newer information wins over older. Plain terse notes, third person,
+under {MAX_SUMMARY_TOKENS * 3 // 4} words.
+"""
+
+
+def pending_span(summary: Dict, message_count: int) -> Optional[Tuple[int, int]]:
+    """(first id, last id) of the messages to fold in now, or None if it isn't time yet."""
+    aged_out = message_count - SESSION_HISTORY_WINDOW
+    # A user who predates summaries starts SUMMARY_BACKLOG_MESSAGES back, not at message 1
+    through = summary.get("through", max(0, aged_out - SUMMARY_BACKLOG_MESSAGES))
+    if aged_out - through < SUMMARY_BATCH_MESSAGES:
+        return None
+    return through + 1, min(aged_out, through + SUMMARY_MAX_FOLD_MESSAGES)
+
+
+def _messages(previous: Optional[str], messages: List[Dict]) -> List[Dict]:
+    transcript = "\n".join(
+        f"{'them' if m.get('role') == 'user' else 'gate'}: {m.get('content', '')}"
+        for m in messages
+    )
+    return [
+        {"role": "system", "content": SUMMARY_PROMPT},
+        {"role": "user", "content": f"Summary so far:\n{previous or '(none yet)'}\n\nNew messages:\n{transcript}"}
+    ]
+
+
+def _text(response) -> Optional[str]:
+    text = (response.choices[0].message.content or "").strip()
+    return text or None
+
+
+def fold(previous: Optional[str], messages: List[Dict]) -> Optional[str]:
+    """
+    The summary with `messages` folded in, or None if the call failed.
+
+    Args:
+        previous: Summary so far (None for the first one)
+        messages: The next messages after it, oldest first
+    """
+    try:
+        response = llm_client.complete(
+            "summary",
+            model=EXTRACTION_MODEL,
+            max_tokens=MAX_SUMMARY_TOKENS,
+            messages=_messages(previous, messages)
+        )
+        return _text(response)
+    except Exception as e:
+        logger.error(f"[SUMMARY] Fold failed: {e}")
+        return None
+
+
+async def fold_async(previous: Optional[str], messages: List[Dict]) -> Optional[str]:
+    """fold() on the async client, for the event-loop paths."""
+    try:
+        response = await llm_client.acomplete(
+            "summary",
+            model=EXTRACTION_MODEL,
+            max_tokens=MAX_SUMMARY_TOKENS,
+            messages=_messages(previous, messages)
+        )
+        return _text(response)
+    except Exception as e:
+        logger.error(f"[SUMMARY] Fold failed: {e}")
+        return None
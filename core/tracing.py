@@ -0,0 +1,94 @@
+"""
+Tracing Module
+Per-turn trace: time spent in each stage, storage bytes and LLM usage.
+
+The engine opens a trace with start_turn() and the code underneath reports
+into whatever trace is current - stage() times a block, add_io() counts
+bytes read/written by the storage layer, and core.metrics adds LLM calls
+and tokens. The trace lives in a ContextVar, so worker threads started
+with asyncio.to_thread / copy_context and tasks spawned from the turn
+report into the same trace. Outside a turn every call is a no-op.
+
+core.metrics aggregates finished traces into per-stage histograms.
+"""
+
+import time
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Iterator, Optional
+
+
+class TurnTrace:
+    """Everything measured for one user turn."""
+
+    __slots__ = (
+        "started", "stages", "bytes_read", "bytes_written",
+        "llm_calls", "prompt_tokens", "cached_tokens", "completion_tokens", "token"
+    )
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        # Seconds per stage; a stage entered more than once is summed
+        self.stages: Dict[str, float] = {}
+        self.bytes_read = 0
+        self.bytes_written = 0
+        self.llm_calls: Counter = Counter()
+        self.prompt_tokens = 0
+        self.cached_tokens = 0
+        self.completion_tokens = 0
+        self.token = None
+
+    def add_stage(self, name: str, seconds: float):
+        self.stages[name] = self.stages.get(name, 0.0) + seconds
+
+    def mark(self, name: str):
+        """Record the time since the turn started as stage `name` (e.g. 'reply')."""
+        self.add_stage(name, time.perf_counter() - self.started)
+
+
+_current: ContextVar[Optional[TurnTrace]] = ContextVar("turn_trace", default=None)
+
+
+def start_turn() -> TurnTrace:
+    """Open a trace for a user turn in the current context."""
+    trace = TurnTrace()
+    trace.token = _current.set(trace)
+    return trace
+
+
+def end_turn(trace: TurnTrace):
+    """Stop reporting into `trace` in the current context (the thread or task that started it, or a copy)."""
+    if _current.get() is not trace:
+        return
+    try:
+        _current.reset(trace.token)
+    except (ValueError, RuntimeError):
+        # A copied context (worker thread, background task), or the token was already used there
+        _current.set(None)
+
+
+def current() -> Optional[TurnTrace]:
+    return _current.get()
+
+
+@contextmanager
+def stage(name: str) -> Iterator[None]:
+    """Time the block as stage `name` of the current turn."""
+    trace = _current.get()
+    if trace is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        trace.add_stage(name, time.perf_counter() - started)
+
+
+def add_io(read: int = 0, written: int = 0):
+    """Charge storage bytes to the current turn."""
+    trace = _current.get()
+    if trace is not None:
+        trace.bytes_read += read
+        trace.bytes_written += written
@@ -0,0 +1,173 @@
+"""
+Transcription Module
+Whisper transcription for voice notes, entirely in memory.
+
+The audio is downloaded into a bytearray and uploaded from there through
+the async OpenAI client - nothing touches disk and the event loop never
+blocks. A semaphore bounds how many uploads run at once, and transcripts
+are cached by Telegram's file_unique_id (TTL + LRU), so a retried update
+or the same voice note forwarded again isn't transcribed twice. Requests
+for a file that is already being transcribed wait for that call instead
+of starting another. The SDK client is built on the first transcription.
+"""
+
+import asyncio
+import logging
+import threading
+import time
+from collections import OrderedDict
+from functools import cached_property
+from typing import Awaitable, Callable, Dict, Optional
+
+from config import (
+    OPENAI_API_KEY,
+    TRANSCRIPTION_MODEL,
+    TRANSCRIPTION_CONCURRENCY,
+    TRANSCRIPTION_TIMEOUT_SECONDS,
+    TRANSCRIPTION_CACHE_MAX_ENTRIES,
+    TRANSCRIPTION_CACHE_TTL_SECONDS,
+)
+from core.metrics import llm_metrics
+
+logger = logging.getLogger(__name__)
+
+
+class Transcriber:
+    """
+    Async Whisper client with bounded concurrency and a transcript cache.
+
+    Usage:
+        text = await transcriber.transcribe(voice.file_unique_id, download)
+    where download() returns the audio bytes (only called on a cache miss).
+    """
+
+    def __init__(
+        self,
+        api_key: Optional[str] = OPENAI_API_KEY,
+        concurrency: int = TRANSCRIPTION_CONCURRENCY,
+        max_entries: int = TRANSCRIPTION_CACHE_MAX_ENTRIES,
+        ttl: float = TRANSCRIPTION_CACHE_TTL_SECONDS
+    ):
+        self.api_key = api_key
+        self.concurrency = concurrency
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._cache: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.api_key)
+
+    @cached_property
+    def client(self):
+        from openai import AsyncOpenAI
+        from core.http import async_http_client
+        # Same pool as the chat client - both talk to api.openai.com
+        return AsyncOpenAI(api_key=self.api_key, http_client=async_http_client())
+
+    def _cached(self, key: str) -> Optional[str]:
+        with self._lock:
+            entry = self._cache.get(key)
+            if entry is None:
+                return None
+            expires, text = entry
+            if expires < time.monotonic():
+                del self._cache[key]
+                return None
+            self._cache.move_to_end(key)
+            return text
+
+    def _store(self, key: str, text: str):
+        with self._lock:
+            self._cache[key] = (time.monotonic() + self.ttl, text)
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.max_entries:
+                self._cache.popitem(last=False)
+
+    async def transcribe(
+        self,
+        file_unique_id: str,
+        download: Callable[[], Awaitable[bytes]],
+        filename: str = "voice.ogg"
+    ) -> str:
+        """
+        Transcript for a voice note, from the cache when we've seen it.
+
+        Args:
+            file_unique_id: Telegram's stable id for the file (same across forwards)
+            download: Coroutine function returning the audio bytes
+            filename: Name sent with the upload; Whisper uses the extension for the format
+
+        Raises:
+            Whatever the download or the API call raised, or asyncio.TimeoutError
+        """
+        cached = self._cached(file_unique_id)
+        if cached is not None:
+            self.hits += 1
+            logger.info(f"[VOICE] Transcript cache hit for {file_unique_id}")
+            return cached
+
+        # Same file already in flight (e.g. a retried update) - share its result
+        pending = self._inflight.get(file_unique_id)
+        if pending is not None:
+            self.hits += 1
+            return await asyncio.shield(pending)
+
+        self.misses += 1
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[file_unique_id] = future
+        try:
+            text = await self._transcribe(download, filename)
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            # Nobody else may be waiting; don't let the loop warn about it
+            future.exception()
+            raise
+        else:
+            self._store(file_unique_id, text)
+            future.set_result(text)
+            return text
+        finally:
+            self._inflight.pop(file_unique_id, None)
+
+    async def _transcribe(self, download: Callable[[], Awaitable[bytes]], filename: str) -> str:
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.concurrency)
+
+        # Download inside the semaphore too, so at most `concurrency` notes are held in memory
+        async with self._semaphore:
+            audio = bytes(await download())
+            started = time.perf_counter()
+            transcript = await asyncio.wait_for(
+                self.client.audio.transcriptions.create(
+                    model=TRANSCRIPTION_MODEL,
+                    file=(filename, audio)
+                ),
+                timeout=TRANSCRIPTION_TIMEOUT_SECONDS
+            )
+            llm_metrics.record_latency("transcription", time.perf_counter() - started)
+
+        logger.info(f"[VOICE] Transcribed {len(audio)} bytes in {time.perf_counter() - started:.1f}s")
+        return transcript.text
+
+    def stats(self) -> Dict:
+        with self._lock:
+            entries = len(self._cache)
+        lookups = self.hits + self.misses
+        return {
+            "entries": entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0
+        }
+
+
+transcriber = Transcriber()
@@ -0,0 +1,24 @@
+"""
+Worker Affinity
+Which worker process owns a user when the bot runs as several webhook
+workers (see webhook.py).
+
+A user always hashes to the same worker, so everything kept in process
+memory per user - session cache, rate-limit counters, turn locks - has a
+single owner and their messages are handled in order. CRC32 rather than
+hash(): it has to agree across processes and restarts.
+"""
+
+import zlib
+
+from config import WEBHOOK_WORKERS, WORKER_ID
+
+
+def worker_for(user_id, workers: int = WEBHOOK_WORKERS) -> int:
+    """Index of the worker that owns user_id."""
+    return zlib.crc32(str(user_id).encode("utf-8")) % max(1, workers)
+
+
+def owns(user_id) -> bool:
+    """True if this process handles user_id (always, outside webhook workers)."""
+    return WORKER_ID is None or worker_for(user_id) == WORKER_ID
@@ -0,0 +1,106 @@
+"""
+Mailbox - Per-User Turn Queue
+
+Incoming messages go into a FIFO per user, drained by one task per user,
+so a user's turns run strictly one after another and in arrival order -
+no two turns read and rewrite the same history/state at once.
+
+With coalescing on, the drain takes everything waiting (up to
+COALESCE_MAX_MESSAGES) as one batch: messages sent while the previous
+reply was being generated get a single reply instead of one LLM call
+each. COALESCE_WINDOW_SECONDS additionally waits for a burst to go quiet
+before starting a turn. Merged messages are counted as 'coalesced' reply
+events in core.metrics - each one is a reply (and extraction) call saved.
+"""
+
+import asyncio
+import logging
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Tuple
+
+from config import COALESCE_MESSAGES, COALESCE_WINDOW_SECONDS, COALESCE_MAX_MESSAGES
+from core.metrics import llm_metrics
+
+logger = logging.getLogger(__name__)
+
+
+class Mailbox:
+    """
+    Usage:
+        mailbox = Mailbox(handle)          # async handle(user_id, [item, ...])
+        await mailbox.submit(user_id, item)
+
+    submit() returns once the batch containing the item has been handled
+    (raising what the handler raised, or CancelledError if the drain was
+    cancelled first).
+    """
+
+    def __init__(
+        self,
+        handle: Callable[[str, List[Any]], Awaitable[None]],
+        coalesce: bool = COALESCE_MESSAGES,
+        window: float = COALESCE_WINDOW_SECONDS,
+        max_batch: int = COALESCE_MAX_MESSAGES
+    ):
+        self.handle = handle
+        self.coalesce = coalesce
+        self.window = window
+        self.max_batch = max(1, max_batch)
+        self._boxes: Dict[str, Deque[Tuple[Any, asyncio.Future]]] = {}
+        self._drainers: Dict[str, asyncio.Task] = {}
+
+    def __len__(self) -> int:
+        """Messages waiting, across all users."""
+        return sum(len(box) for box in self._boxes.values())
+
+    async def submit(self, user_id: str, item: Any):
+        user_id = str(user_id)
+        done = asyncio.get_running_loop().create_future()
+        self._boxes.setdefault(user_id, deque()).append((item, done))
+        if user_id not in self._drainers:
+            self._drainers[user_id] = asyncio.create_task(self._drain(user_id))
+        await done
+
+    async def _drain(self, user_id: str):
+        box = self._boxes[user_id]
+        try:
+            while box:
+                if self.coalesce and self.window > 0:
+                    # Wait for the burst to go quiet (or fill a batch)
+                    waiting = -1
+                    while waiting != len(box) and len(box) < self.max_batch:
+                        waiting = len(box)
+                        await asyncio.sleep(self.window)
+
+                size = min(len(box), self.max_batch) if self.coalesce else 1
+                batch = [box.popleft() for _ in range(size)]
+                if size > 1:
+                    logger.info(f"[MAILBOX] Coalesced {size} messages for {user_id}")
+                    for _ in range(size - 1):
+                        llm_metrics.record_event("reply", "coalesced")
+
+                try:
+                    await self.handle(user_id, [item for item, _ in batch])
+                except Exception as e:
+                    for _, done in batch:
+                        if not done.done():
+                            done.set_exception(e)
+                except BaseException:
+                    # Cancelled (shutdown) - don't leave the submitters waiting
+                    for _, done in batch:
+                        if not done.done():
+                            done.cancel()
+                    raise
+                else:
+                    for _, done in batch:
+                        if not done.done():
+                            done.set_result(None)
+        finally:
+            # Only non-empty if the drain was cancelled; those messages won't be handled
+            while box:
+                _, done = box.popleft()
+                if not done.done():
+                    done.cancel()
+            # No await between the last `while box` check and here, so nothing can slip in
+            del self._drainers[user_id]
+            del self._boxes[user_id]
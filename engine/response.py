@@ -4,17 +4,39 @@ Response Engine - Elite Coach
 Receive message → detect completion → call agent → save history → return response
 """
 
+import asyncio
 import logging
 import re
-from typing import Dict, Any
-
-from core.security import process_input, process_output
+import threading
+import time
+from contextlib import aclosing
+from contextvars import copy_context
+from datetime import datetime
+from typing import Awaitable, Callable, Dict, Any, List, Optional, Union
+
+from config import REENGAGEMENT_ENABLED, EXTRACTION_ENABLED, SUMMARY_ENABLED, SESSION_HISTORY_WINDOW
+from core.security import process_input, process_output, output_filter, StreamingOutputFilter
 from core.agent import gate_agent
-from memory.state import load_state, save_state
-from memory.history import append_message, get_recent_messages
+from core.extraction import extract_turn, extract_turn_async
+from core.summary import pending_span, fold, fold_async
+from core.metrics import llm_metrics
+from core.tracing import TurnTrace, stage, end_turn
+from memory.episodic import add_episode
+from memory.facts import merge_facts
+from memory.archive import load_archived
+from memory.history import get_recent_messages
+from memory.scheduled import REENGAGEMENT_PROMPTS, schedule_reengagement, mark_sent
+from memory.session import session_cache, UserSession
+from memory.storage import async_user_lock
 
 logger = logging.getLogger(__name__)
 
+# Which re-engagement follows a delivered one while the user stays quiet
+NEXT_REENGAGEMENT = {
+    "soft_ping": "pattern_callout",
+    "pattern_callout": "direct_question"
+}
+
 
 class ResponseEngine:
     """
@@ -28,12 +50,25 @@ class ResponseEngine:
     6. Extract name if present
     7. Save history
     8. Return response
+    9. Extract facts/episodes in one call, in the background
+    10. Fold messages that aged out of the history window into the
+        rolling summary (core.summary), in the background
+
+    Each turn is traced (core.tracing): the steps run inside stage()
+    timers and the trace is closed once the background work is done.
     """
 
+    def __init__(self):
+        # Background extraction/summary tasks (kept referenced until they finish)
+        self._background = set()
+        # Users with a summary fold in flight - one at a time per user
+        self._summarizing = set()
+        self._summarizing_lock = threading.Lock()
+
     def process_message(
         self,
         user_id: str,
-        message: str,
+        message: Union[str, List[str]],
         username: str = None
     ) -> Dict[str, Any]:
         """
@@ -41,30 +76,179 @@ class ResponseEngine:
 
         Args:
             user_id: Unique user identifier
-            message: The user's message
+            message: The user's message, or a burst of them to answer with one reply
             username: Optional username from platform
 
         Returns:
             Dict with 'response' and 'phase'
         """
-        # 1. Security check
-        recent = get_recent_messages(user_id, count=5)
-        security_result = process_input(
-            user_id,
-            message,
-            [{"role": "user", "content": m["content"]} for m in recent]
-        )
-
-        if not security_result['allowed']:
+        trace = llm_metrics.start_turn()
+        handed_off = False
+        try:
+            turn = self._prepare_turn(user_id, message, username)
+            if "response" in turn:
+                return turn
+
+            # 7. Get response from agent
+            with stage("agent"):
+                response = gate_agent.respond(turn["history"], turn["user_state"])
+
+            result = self._finish_turn(user_id, turn["message"], response)
+            trace.mark("reply")
+
+            # 14. Extraction and summary upkeep in a background thread - the caller has its reply
+            if EXTRACTION_ENABLED or SUMMARY_ENABLED:
+                context = copy_context()
+                threading.Thread(
+                    target=context.run, args=(self._after_reply, user_id, turn, trace),
+                    name=f"after-reply-{user_id}", daemon=True
+                ).start()
+                handed_off = True
+            return result
+        finally:
+            if handed_off:
+                # The thread closes the trace; just detach it from this one
+                end_turn(trace)
+            else:
+                llm_metrics.finish_turn(trace, user_id)
+
+    async def process_message_async(
+        self,
+        user_id: str,
+        message: Union[str, List[str]],
+        username: str = None
+    ) -> Dict[str, Any]:
+        """
+        Async version of process_message for the Telegram handlers.
+
+        File I/O runs in worker threads and the LLM call awaits the async
+        client, so one slow reply doesn't stall every other chat.
+        """
+        trace = llm_metrics.start_turn()
+        handed_off = False
+        try:
+            # One turn at a time per user, so overlapping messages can't interleave state updates
+            async with async_user_lock(user_id):
+                trace.mark("lock_wait")
+                turn = await asyncio.to_thread(self._prepare_turn, user_id, message, username)
+                if "response" in turn:
+                    return turn
+
+                # 7. Get response from agent
+                with stage("agent"):
+                    response = await gate_agent.respond_async(turn["history"], turn["user_state"])
+
+                result = await asyncio.to_thread(self._finish_turn, user_id, turn["message"], response)
+            trace.mark("reply")
+            handed_off = self._spawn_after_reply(user_id, turn, trace)
+            return result
+        finally:
+            if not handed_off:
+                llm_metrics.finish_turn(trace, user_id)
+
+    async def process_message_stream(
+        self,
+        user_id: str,
+        message: Union[str, List[str]],
+        username: str = None,
+        on_partial: Optional[Callable[[str], Awaitable[None]]] = None
+    ) -> Dict[str, Any]:
+        """
+        process_message_async with the reply streamed.
+
+        on_partial is awaited with the growing reply text (already passed
+        through the output filter) as tokens arrive. The returned result is
+        the same as process_message_async's, plus 'ttft_ms' - time to first
+        token - when the model produced any output.
+        """
+        trace = llm_metrics.start_turn()
+        handed_off = False
+        try:
+            async with async_user_lock(user_id):
+                trace.mark("lock_wait")
+                turn = await asyncio.to_thread(self._prepare_turn, user_id, message, username)
+                if "response" in turn:
+                    return turn
+
+                # 7. Stream the response from the agent
+                stream_filter = StreamingOutputFilter(output_filter)
+                started = time.perf_counter()
+                ttft_ms = None
+                try:
+                    # aclosing: stopping early closes the stream (and records its usage) right here, inside the turn
+                    async with aclosing(gate_agent.respond_stream(turn["history"], turn["user_state"])) as deltas:
+                        async for delta in deltas:
+                            if ttft_ms is None:
+                                ttft_ms = (time.perf_counter() - started) * 1000
+                                trace.add_stage("ttft", ttft_ms / 1000)
+                            visible = stream_filter.feed(delta)
+                            if stream_filter.leaked:
+                                logger.warning(f"[ENGINE] Output filter tripped mid-stream for {user_id}")
+                                break
+                            if visible and on_partial:
+                                with stage("partial_send"):
+                                    await on_partial(gate_agent._clean(visible))
+                except Exception as e:
+                    logger.error(f"[ENGINE] Stream error: {e}")
+
+                response = gate_agent._clean(stream_filter.text)
+                total_ms = (time.perf_counter() - started) * 1000
+                trace.add_stage("agent", total_ms / 1000)
+                logger.info(
+                    f"[ENGINE] Streamed reply for {user_id}: "
+                    f"ttft {f'{ttft_ms:.0f}ms' if ttft_ms is not None else 'n/a'}, total {total_ms:.0f}ms"
+                )
+
+                result = await asyncio.to_thread(self._finish_turn, user_id, turn["message"], response)
+                if ttft_ms is not None:
+                    result['ttft_ms'] = round(ttft_ms)
+            trace.mark("reply")
+            handed_off = self._spawn_after_reply(user_id, turn, trace)
+            return result
+        finally:
+            if not handed_off:
+                llm_metrics.finish_turn(trace, user_id)
+
+    def _prepare_turn(self, user_id: str, message: Union[str, List[str]], username: str = None) -> Dict[str, Any]:
+        """
+        Steps 1-6: everything before the LLM call.
+
+        Returns either a final result (has 'response') when security blocks
+        the message, or the turn context for the agent call.
+        """
+        with stage("session_load"):
+            session = session_cache.get(user_id)
+        with session.lock:
+            return self._prepare_session_turn(session, message, username)
+
+    def _prepare_session_turn(self, session: UserSession, message: Union[str, List[str]], username: str = None) -> Dict[str, Any]:
+        user_id = session.user_id
+
+        # 1. Security check (escalation from the stored per-message verdicts), then
+        # 4. save to history - message by message, so each one of a coalesced burst
+        # is screened with the ones before it already counted
+        accepted = []
+        security_result = None
+        for text in ([message] if isinstance(message, str) else message):
+            with stage("security"):
+                security_result = process_input(user_id, text, escalation=session.escalation)
+            if not security_result['allowed']:
+                continue
+            with stage("append_user"):
+                session_cache.append_message(session, "user", security_result['text'], {"suspicious": security_result['suspicious']})
+            accepted.append(security_result['text'])
+
+        if not accepted:
             return {
                 'response': security_result['reason'],
                 'phase': 'blocked'
             }
 
-        message = security_result['text']
+        message = "\n".join(accepted)
+        session_cache.record_activity(session)
 
-        # 2. Load or initialize state
-        state = load_state(user_id)
+        # 2. Load or initialize state (cached in the session)
+        state = session.state
         if "user" not in state:
             state["user"] = {}
         if "coaching" not in state:
@@ -92,22 +276,33 @@ class ResponseEngine:
             state["coaching"]["awaiting_completion"] = False
             state["coaching"]["current_step"] = None
 
-        # 4. Save user message to history
-        append_message(user_id, "user", message)
-
         # 5. Get conversation history for agent
-        history = self._get_history(user_id)
+        with stage("history"):
+            history = self._get_history(session)
 
         # 6. Build user state for agent context
         user_state = {
             "name": state["user"].get("name"),
             "commitment": state["user"].get("commitment"),
             "deadline": state["user"].get("deadline"),
-            "coaching": state.get("coaching", {})
+            "coaching": state.get("coaching", {}),
+            "summary": (state.get("summary") or {}).get("text")
         }
 
-        # 7. Get response from agent
-        response = gate_agent.respond(history, user_state)
+        return {
+            "message": message,
+            "history": history,
+            "user_state": user_state
+        }
+
+    def _finish_turn(self, user_id: str, message: str, response: str) -> Dict[str, Any]:
+        """Steps 8-12: everything after the LLM call."""
+        session = session_cache.get(user_id)
+        with session.lock:
+            return self._finish_session_turn(session, message, response)
+
+    def _finish_session_turn(self, session: UserSession, message: str, response: str) -> Dict[str, Any]:
+        state = session.state
 
         # 8. Extract name if user provided it
         extracted_name = self._extract_name(message)
@@ -121,22 +316,259 @@ class ResponseEngine:
             state["coaching"]["awaiting_completion"] = True
 
         # 10. Save assistant response to history
-        append_message(user_id, "assistant", response)
+        with stage("append_assistant"):
+            session_cache.append_message(session, "assistant", response)
 
-        # 11. Save updated state
-        save_state(user_id, state)
+        # 11. Save updated state (write-behind, coalesced by the session cache)
+        session_cache.mark_dirty(session, "state")
 
-        # 12. Security filter on output
-        response = process_output(response)
+        # 12. Re-arm the re-engagement ping (replaces any pending one)
+        if REENGAGEMENT_ENABLED:
+            with stage("schedule"):
+                self._schedule_next(session, "soft_ping")
+
+        # 13. Security filter on output
+        with stage("output_filter"):
+            response = process_output(response)
 
         return {
             'response': response,
             'phase': 'coaching'
         }
 
-    def _get_history(self, user_id: str) -> list:
+    def _spawn_after_reply(self, user_id: str, turn: Dict[str, Any], trace: TurnTrace):
+        """
+        Step 14 for the async paths: extraction and summary upkeep as a
+        background task, off the reply's critical path. Returns whether the
+        task took over the trace (it closes it when done).
+        """
+        if not EXTRACTION_ENABLED and not SUMMARY_ENABLED:
+            return False
+        task = asyncio.create_task(self._after_reply_async(user_id, turn, trace), name=f"after-reply-{user_id}")
+        self._background.add(task)
+        task.add_done_callback(self._background.discard)
+        return True
+
+    async def settle(self, user_id: str):
+        """Wait for the user's background extraction/summary work (e.g. before deleting their data)."""
+        tasks = [task for task in self._background if task.get_name() == f"after-reply-{user_id}"]
+        if tasks:
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def _after_reply_async(self, user_id: str, turn: Dict[str, Any], trace: TurnTrace):
+        """Combined extraction and summary upkeep for a finished turn, then close the turn's trace."""
+        try:
+            if EXTRACTION_ENABLED:
+                try:
+                    # Awaits the async client - a worker thread is only needed for the writes
+                    with stage("extraction"):
+                        extracted = await extract_turn_async(*self._extraction_inputs(turn))
+                    if extracted:
+                        await asyncio.to_thread(self._store_extraction, user_id, turn, extracted)
+                except Exception as e:
+                    logger.error(f"[ENGINE] Extraction failed for {user_id}: {e}")
+            if SUMMARY_ENABLED:
+                await self._update_summary_async(user_id)
+        finally:
+            llm_metrics.finish_turn(trace, user_id)
+
+    def _after_reply(self, user_id: str, turn: Dict[str, Any], trace: TurnTrace):
+        """Sync version of _after_reply_async, run in its own thread."""
+        try:
+            if EXTRACTION_ENABLED:
+                try:
+                    with stage("extraction"):
+                        extracted = extract_turn(*self._extraction_inputs(turn))
+                    if extracted:
+                        self._store_extraction(user_id, turn, extracted)
+                except Exception as e:
+                    logger.error(f"[ENGINE] Extraction failed for {user_id}: {e}")
+            if SUMMARY_ENABLED:
+                self._update_summary(user_id)
+        finally:
+            llm_metrics.finish_turn(trace, user_id)
+
+    def _summary_backlog(self, user_id: str) -> Optional[tuple]:
+        """
+        (previous summary text, messages to fold in, last id of the span) when a fold is due, else None.
+        The messages are empty only when the span is gone from both the live log and the archive.
+        """
+        session = session_cache.get(user_id)
+        with session.lock:
+            summary = session.state.get("summary") or {}
+            span = pending_span(summary, session.message_count)
+            count = session.message_count
+        if span is None:
+            return None
+        first, last = span
+        # The span ends SESSION_HISTORY_WINDOW messages back, so this tail read stays small
+        with stage("summary_load"):
+            live = get_recent_messages(user_id, count=count - first + 1)
+            # A log without ids (older storage) is numbered by position: the tail ends at message `count`
+            base = count - len(live) + 1
+            live = [m if m.get("id") else {"id": base + i, **m} for i, m in enumerate(live)]
+            live_first = live[0]["id"] if live else count + 1
+            archived = []
+            if live_first > first:
+                # The start of the span has moved to the archive (memory.archive)
+                archived = [m for m in load_archived(user_id, since=first) if m.get("id", 0) < live_first]
+        messages = [m for m in archived + live if first <= m["id"] <= last]
+        if not messages and live_first <= last:
+            # Live history reaches into the span but none of it matched - don't skip what we can't see
+            logger.warning(f"[SUMMARY] {user_id}: messages {first}-{last} not found, not advancing")
+            return None
+        return summary.get("text"), messages, last
+
+    def _store_summary(self, user_id: str, text: Optional[str], through: int):
+        session = session_cache.get(user_id)
+        with session.lock:
+            if (session.state.get("summary") or {}).get("through", 0) >= through:
+                return
+            session.state["summary"] = {
+                "text": text,
+                "through": through,
+                "updated": datetime.now().isoformat()
+            }
+            session_cache.mark_dirty(session, "state")
+        logger.info(f"[SUMMARY] {user_id}: folded in through message {through} ({len(text or '')} chars)")
+
+    def _claim_summary(self, user_id: str) -> bool:
+        with self._summarizing_lock:
+            if user_id in self._summarizing:
+                return False
+            self._summarizing.add(user_id)
+            return True
+
+    def _release_summary(self, user_id: str):
+        with self._summarizing_lock:
+            self._summarizing.discard(user_id)
+
+    async def _update_summary_async(self, user_id: str):
+        """Fold aged-out messages into the user's summary if enough have piled up."""
+        if not self._claim_summary(user_id):
+            return
+        try:
+            backlog = await asyncio.to_thread(self._summary_backlog, user_id)
+            if backlog is None:
+                return
+            previous, messages, last = backlog
+            if not messages:
+                # Nothing left to read for this span - move past it so folding carries on
+                await asyncio.to_thread(self._store_summary, user_id, previous, last)
+                return
+            with stage("summary"):
+                text = await fold_async(previous, messages)
+            if text:
+                await asyncio.to_thread(self._store_summary, user_id, text, last)
+        except Exception as e:
+            logger.error(f"[ENGINE] Summary update failed for {user_id}: {e}")
+        finally:
+            self._release_summary(user_id)
+
+    def _update_summary(self, user_id: str):
+        """Sync version of _update_summary_async."""
+        if not self._claim_summary(user_id):
+            return
+        try:
+            backlog = self._summary_backlog(user_id)
+            if backlog is None:
+                return
+            previous, messages, last = backlog
+            if not messages:
+                # Nothing left to read for this span - move past it so folding carries on
+                self._store_summary(user_id, previous, last)
+                return
+            with stage("summary"):
+                text = fold(previous, messages)
+            if text:
+                self._store_summary(user_id, text, last)
+        except Exception as e:
+            logger.error(f"[ENGINE] Summary update failed for {user_id}: {e}")
+        finally:
+            self._release_summary(user_id)
+
+    def _extraction_inputs(self, turn: Dict[str, Any]) -> tuple:
+        """(message, previous gate message, what we already know) for extract_turn."""
+        history = turn["history"]
+        user_state = turn["user_state"]
+        coaching = user_state.get("coaching", {})
+
+        # Gate's message just before this turn's user message(s)
+        i = len(history) - 1
+        while i >= 0 and history[i]["role"] == "user":
+            i -= 1
+        previous = history[i]["content"] if i >= 0 and history[i]["role"] == "assistant" else None
+        return turn["message"], previous, {
+            "name": user_state.get("name"),
+            "commitment": user_state.get("commitment"),
+            "goal": coaching.get("goal"),
+            "current step": coaching.get("current_step")
+        }
+
+    @stage("extraction_store")
+    def _store_extraction(self, user_id: str, turn: Dict[str, Any], extracted: Dict[str, Any]):
+        current_step = turn["user_state"].get("coaching", {}).get("current_step")
+
+        # Name/commitment feed the agent's context; the session owns state
+        session = session_cache.get(user_id)
+        with session.lock:
+            user = session.state.setdefault("user", {})
+            for key in ("name", "commitment", "deadline"):
+                if extracted[key]:
+                    user[key] = extracted[key]
+            coaching_state = session.state.setdefault("coaching", {})
+            coaching_state["last_message_type"] = extracted["classification"]
+            if extracted["facts"].get("goal") and not coaching_state.get("goal"):
+                coaching_state["goal"] = extracted["facts"]["goal"]
+            session_cache.mark_dirty(session, "state")
+
+        facts = dict(extracted["facts"])
+        if extracted["commitment"]:
+            facts["commitments"] = [extracted["commitment"]]
+        if facts:
+            merge_facts(user_id, facts)
+
+        for episode in extracted["episodes"]:
+            add_episode(
+                user_id,
+                episode["type"],
+                episode["summary"],
+                significance=episode["significance"],
+                context={"step": current_step},
+                user_message=turn["message"]
+            )
+
+    def _schedule_next(self, session: UserSession, trigger_type: str):
+        try:
+            # Availability inference reads activity from storage, so write ours first
+            session_cache.flush(session.user_id)
+            schedule_reengagement(session.user_id, trigger_type)
+        except Exception as e:
+            logger.error(f"Failed to schedule {trigger_type} for {session.user_id}: {e}")
+
+    async def generate_reengagement_async(self, user_id: str, scheduled: Dict) -> str:
+        """Write the text for a due scheduled message."""
+        session = await asyncio.to_thread(session_cache.get, user_id)
+        with session.lock:
+            history = self._get_history(session)
+            user = {**session.state.get("user", {}), "summary": (session.state.get("summary") or {}).get("text")}
+        prompt = REENGAGEMENT_PROMPTS.get(scheduled.get("type"), REENGAGEMENT_PROMPTS["soft_ping"])
+        text = await gate_agent.reengage_async(history, prompt, user)
+        return process_output(text)
+
+    def record_reengagement(self, user_id: str, scheduled: Dict, text: str):
+        """After delivery: log it to history, mark it sent and queue the follow-up."""
+        session = session_cache.get(user_id)
+        with session.lock:
+            session_cache.append_message(session, "assistant", text, {"scheduled": scheduled.get("type")})
+            mark_sent(user_id, scheduled["id"], text)
+            next_type = NEXT_REENGAGEMENT.get(scheduled.get("type"))
+            if next_type:
+                self._schedule_next(session, next_type)
+
+    def _get_history(self, session: UserSession) -> list:
         """Get conversation history formatted for agent."""
-        recent = get_recent_messages(user_id, count=20)
+        recent = session.recent_messages(SESSION_HISTORY_WINDOW)
         return [{"role": m["role"], "content": m["content"]} for m in recent]
 
     def _detect_completion(self, message: str) -> bool:
@@ -0,0 +1,343 @@
+"""
+History Archive
+Cold storage for old conversation history and inactive users.
+
+Live storage (memory.backends) keeps a hot tail. Once a user's log holds
+ARCHIVE_BATCH_MESSAGES more than HISTORY_HOT_MESSAGES, everything but the
+tail moves into gzipped JSONL segments, one per month of the messages'
+timestamps, and the text log is rotated alongside:
+
+    ARCHIVE_DIR/<user_id>/messages-2025-03.jsonl.gz
+    ARCHIVE_DIR/<user_id>/history-2025-06.txt.gz    (text log, by month archived)
+    ARCHIVE_DIR/<user_id>/archive.json              (manifest: last archived id)
+
+Segments are only appended to (a gzip file may hold several members) and
+messages keep their ids, so the live log carries on numbering where it
+was and summaries (core.summary) still line up. A crash between writing
+a segment and trimming the live log only means a message is archived
+twice; readers keep one copy per id.
+
+Users idle for ARCHIVE_EVICT_IDLE_DAYS with nothing scheduled are
+evicted: all of their messages go to segments, their documents (state,
+facts, episodes, activity) to documents.json.gz, and they are removed
+from live storage. The session cache calls rehydrate() when it loads a
+user, which brings the documents and the last HISTORY_HOT_MESSAGES back
+from the newest segments - read cost stays bounded however old the user is.
+
+run() is one pass over every user this process owns; bot.py schedules it
+every ARCHIVE_INTERVAL_HOURS when ARCHIVE_ENABLED, and
+
+    python -m memory.archive [--user ID]
+
+runs one by hand.
+"""
+
+import argparse
+import contextlib
+import gzip
+import json
+import logging
+import os
+import shutil
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from config import (
+    ARCHIVE_DIR,
+    HISTORY_HOT_MESSAGES,
+    ARCHIVE_BATCH_MESSAGES,
+    ARCHIVE_EVICT_IDLE_DAYS,
+)
+from core.tracing import add_io
+from memory.backends import get_backend
+from memory.backends.migrate import DOCUMENT_KINDS
+from memory.storage import atomic_write_json, read_json, user_lock
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_FILE = "archive.json"
+DOCUMENTS_FILE = "documents.json.gz"
+SEGMENT_PREFIX = "messages-"
+SEGMENT_SUFFIX = ".jsonl.gz"
+
+
+def archive_dir(user_id: str) -> Path:
+    return ARCHIVE_DIR / str(user_id)
+
+
+def is_evicted(user_id: str) -> bool:
+    return (archive_dir(user_id) / DOCUMENTS_FILE).exists()
+
+
+def _manifest(user_id: str) -> Dict:
+    return read_json(archive_dir(user_id) / MANIFEST_FILE, lambda: {"through": 0, "segments": {}})
+
+
+def _append_gzip(path: Path, data: bytes):
+    """Append one gzip member and fsync - the file stays a valid gzip stream throughout."""
+    with open(path, "ab") as raw:
+        with gzip.GzipFile(fileobj=raw, mode="ab") as f:
+            f.write(data)
+        raw.flush()
+        os.fsync(raw.fileno())
+    add_io(written=len(data))
+
+
+def _write_segments(user_id: str, messages: List[Dict]):
+    """Append messages (oldest first) past the manifest's `through` to their monthly segments."""
+    manifest = _manifest(user_id)
+    fresh = [m for m in messages if m.get("id", 0) > manifest["through"]]
+    if not fresh:
+        return
+
+    by_month: Dict[str, List[Dict]] = {}
+    for message in fresh:
+        month = (message.get("timestamp") or "")[:7] or "undated"
+        by_month.setdefault(month, []).append(message)
+
+    directory = archive_dir(user_id)
+    directory.mkdir(parents=True, exist_ok=True)
+    for month, batch in by_month.items():
+        data = b"".join((json.dumps(m, ensure_ascii=False) + "\n").encode("utf-8") for m in batch)
+        _append_gzip(directory / f"{SEGMENT_PREFIX}{month}{SEGMENT_SUFFIX}", data)
+        manifest["segments"][month] = manifest["segments"].get(month, 0) + len(batch)
+
+    manifest["through"] = max(manifest["through"], fresh[-1].get("id", 0))
+    atomic_write_json(directory / MANIFEST_FILE, manifest)
+
+
+def _archive(user_id: str, messages: List[Dict]) -> bool:
+    """
+    Write messages to their segments and check every one of them is there.
+    Only after True may they be removed from live storage.
+    """
+    if not messages:
+        return True
+    if not all(m.get("id") for m in messages):
+        # Without ids they can't be deduped or found again - leave them live
+        logger.error(f"[ARCHIVE] {user_id}: history has messages without ids, not archiving")
+        return False
+    _write_segments(user_id, messages)
+    archived = {m.get("id") for m in load_archived(user_id, since=min(m["id"] for m in messages))}
+    missing = [m["id"] for m in messages if m["id"] not in archived]
+    if missing:
+        logger.error(f"[ARCHIVE] {user_id}: {len(missing)} messages missing from segments after writing, not archiving")
+        return False
+    return True
+
+
+def _rotate_text_log(user_id: str):
+    data = get_backend().take_text_log(user_id)
+    if data:
+        directory = archive_dir(user_id)
+        directory.mkdir(parents=True, exist_ok=True)
+        _append_gzip(directory / f"history-{datetime.now():%Y-%m}.txt.gz", data)
+
+
+def _read_segment(path: Path) -> List[Dict]:
+    messages = []
+    with gzip.open(path, "rb") as f:
+        for line in f:
+            add_io(read=len(line))
+            try:
+                messages.append(json.loads(line))
+            except json.JSONDecodeError as e:
+                logger.error(f"[ARCHIVE] Skipping corrupt line in {path}: {e}")
+    return messages
+
+
+def _segments(user_id: str) -> List[Path]:
+    """Segment files, oldest month first (undated messages predate timestamps, so they come first)."""
+    directory = archive_dir(user_id)
+    if not directory.is_dir():
+        return []
+    return sorted(
+        directory.glob(f"{SEGMENT_PREFIX}*{SEGMENT_SUFFIX}"),
+        key=lambda path: (not path.name.startswith(f"{SEGMENT_PREFIX}undated"), path.name)
+    )
+
+
+def load_archived(user_id: str, last: Optional[int] = None, since: Optional[int] = None) -> List[Dict]:
+    """
+    Archived messages in id order, one copy each.
+
+    Args:
+        last: Only the newest `last` messages - reads segments newest-first
+              and stops once it has them
+        since: Only messages with id >= since - stops at the segment that
+               reaches back to it
+    """
+    by_id: Dict[int, Dict] = {}
+    for path in reversed(_segments(user_id)):
+        for message in _read_segment(path):
+            by_id.setdefault(message.get("id", 0), message)
+        if last is not None and len(by_id) >= last:
+            break
+        if since is not None and by_id and min(by_id) <= since:
+            break
+    messages = [by_id[key] for key in sorted(by_id) if since is None or key >= since]
+    return messages[-last:] if last is not None else messages
+
+
+def compact_user(user_id: str, keep: int = HISTORY_HOT_MESSAGES) -> int:
+    """
+    Move all but the last `keep` messages to the archive.
+    Returns how many left live storage.
+    """
+    from memory.session import session_cache
+
+    backend = get_backend()
+    session = session_cache.peek(user_id)
+    # The session lock keeps this user's turns (and text log appends) out until we're done
+    with (session.lock if session is not None else contextlib.nullcontext()), user_lock(user_id):
+        messages = backend.load_messages(user_id)
+        if len(messages) <= keep:
+            return 0
+        old, hot = messages[:len(messages) - keep], messages[len(messages) - keep:]
+        if not _archive(user_id, old):
+            return 0
+        _rotate_text_log(user_id)
+        backend.replace_messages(user_id, hot)
+        if session is not None:
+            # The log was rewritten under the session's cached index (byte size)
+            session.history_index.update(backend.message_index(user_id))
+    logger.info(f"[ARCHIVE] {user_id}: archived {len(old)} messages, {len(hot)} kept live")
+    return len(old)
+
+
+def evict_user(user_id: str) -> bool:
+    """Move an idle user out of live storage entirely. False if they're active or have something scheduled."""
+    from memory.session import session_cache
+
+    backend = get_backend()
+    with user_lock(user_id):
+        # Checked under the lock: a session load for this user waits for it (see SessionCache.get)
+        if session_cache.active(user_id):
+            return False
+        scheduled = backend.load_document(user_id, "scheduled", lambda: {})
+        if scheduled.get("pending"):
+            return False
+
+        documents = {}
+        for kind in DOCUMENT_KINDS:
+            data = backend.load_document(user_id, kind, lambda: None)
+            if data is not None:
+                documents[kind] = data
+
+        if not _archive(user_id, backend.load_messages(user_id)):
+            return False
+        _rotate_text_log(user_id)
+
+        directory = archive_dir(user_id)
+        directory.mkdir(parents=True, exist_ok=True)
+        payload = json.dumps(documents, ensure_ascii=False).encode("utf-8")
+        tmp = directory / (DOCUMENTS_FILE + ".tmp")
+        with open(tmp, "wb") as raw:
+            with gzip.GzipFile(fileobj=raw, mode="wb") as f:
+                f.write(payload)
+            raw.flush()
+            os.fsync(raw.fileno())
+        os.replace(tmp, directory / DOCUMENTS_FILE)
+        add_io(written=len(payload))
+
+        backend.clear_user(user_id)
+    logger.info(f"[ARCHIVE] {user_id}: evicted to cold storage")
+    return True
+
+
+def rehydrate(user_id: str) -> bool:
+    """Bring an evicted user back into live storage (documents + hot tail). False if they weren't evicted."""
+    if not is_evicted(user_id):
+        return False
+
+    backend = get_backend()
+    with user_lock(user_id):
+        path = archive_dir(user_id) / DOCUMENTS_FILE
+        if not path.exists():
+            return False
+        with gzip.open(path, "rb") as f:
+            raw = f.read()
+        add_io(read=len(raw))
+        documents = json.loads(raw)
+
+        for kind, data in documents.items():
+            backend.save_document(user_id, kind, data)
+            if kind == "scheduled":
+                backend.index_pending(user_id, data.get("pending", []))
+        backend.replace_messages(user_id, load_archived(user_id, last=HISTORY_HOT_MESSAGES))
+        path.unlink()
+    logger.info(f"[ARCHIVE] {user_id}: rehydrated from cold storage")
+    return True
+
+
+def clear_user(user_id: str):
+    """Delete everything archived for a user (/clear)."""
+    shutil.rmtree(archive_dir(user_id), ignore_errors=True)
+
+
+def _idle_since(user_id: str) -> Optional[datetime]:
+    """Timestamp of the user's last message, if any."""
+    last = get_backend().recent_messages(user_id, 1)
+    if not last or not last[0].get("timestamp"):
+        return None
+    try:
+        return datetime.fromisoformat(last[0]["timestamp"])
+    except ValueError:
+        return None
+
+
+def run(
+    keep: int = HISTORY_HOT_MESSAGES,
+    batch: int = ARCHIVE_BATCH_MESSAGES,
+    evict_idle_days: int = ARCHIVE_EVICT_IDLE_DAYS
+) -> Dict:
+    """One archive pass over every user this process owns. Returns counts."""
+    from core.workers import owns
+
+    backend = get_backend()
+    cutoff = datetime.now() - timedelta(days=evict_idle_days) if evict_idle_days > 0 else None
+    started = time.perf_counter()
+    stats = {"users": 0, "archived_messages": 0, "compacted": 0, "evicted": 0, "failed": 0}
+
+    for user_id in backend.list_users():
+        if not owns(user_id):
+            continue
+        stats["users"] += 1
+        try:
+            last_active = _idle_since(user_id)
+            if cutoff is not None and last_active is not None and last_active < cutoff:
+                if evict_user(user_id):
+                    stats["evicted"] += 1
+                    continue
+            if backend.message_index(user_id)["count"] - _manifest(user_id)["through"] >= keep + batch:
+                archived = compact_user(user_id, keep)
+                if archived:
+                    stats["compacted"] += 1
+                    stats["archived_messages"] += archived
+        except Exception as e:
+            stats["failed"] += 1
+            logger.error(f"[ARCHIVE] {user_id}: {e}")
+
+    stats["seconds"] = round(time.perf_counter() - started, 2)
+    logger.info(f"[ARCHIVE] Pass done: {stats}")
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Archive old history and evict idle users.")
+    parser.add_argument("--user", help="Only this user (compacts regardless of batch size)")
+    parser.add_argument("--keep", type=int, default=HISTORY_HOT_MESSAGES)
+    parser.add_argument("--evict-idle-days", type=int, default=ARCHIVE_EVICT_IDLE_DAYS)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+    if args.user:
+        compact_user(args.user, args.keep)
+    else:
+        run(keep=args.keep, evict_idle_days=args.evict_idle_days)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,46 @@
+"""
+Storage backends for memory/.
+
+STORAGE_BACKEND=json (default) keeps the data/users/<id>/ file tree;
+STORAGE_BACKEND=sqlite stores everything in one WAL-mode database at
+SQLITE_PATH. Migrate with: python -m memory.backends.migrate
+"""
+
+import threading
+from typing import Optional
+
+from config import DATA_DIR, STORAGE_BACKEND, SQLITE_PATH
+from memory.backends.base import StorageBackend
+from memory import storage
+
+_backend: Optional[StorageBackend] = None
+_backend_lock = threading.Lock()
+
+
+def create_backend(kind: str = None) -> StorageBackend:
+    """Build a backend by name ('json' or 'sqlite')."""
+    kind = (kind or STORAGE_BACKEND).lower()
+    if kind == "json":
+        from memory.backends.json_files import JsonFileBackend
+        return JsonFileBackend(DATA_DIR)
+    if kind == "sqlite":
+        from memory.backends.sqlite import SqliteBackend
+        return SqliteBackend(SQLITE_PATH)
+    raise ValueError(f"Unknown STORAGE_BACKEND: {kind}")
+
+
+def get_backend() -> StorageBackend:
+    """The process-wide backend, created on first use."""
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                set_backend(create_backend())
+    return _backend
+
+
+def set_backend(backend: StorageBackend):
+    """Swap the active backend (benchmarks, migration)."""
+    global _backend
+    _backend = backend
+    storage.set_lock_root(backend.lock_root)
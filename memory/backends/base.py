@@ -0,0 +1,100 @@
+"""
+Storage Backend Interface
+What memory/state, history, facts, episodic and scheduled need from storage.
+
+Per-user data comes in two shapes:
+- documents: small JSON blobs replaced whole (state, facts, episodic,
+  activity, scheduled)
+- the message log: append-only, read from the tail
+Pending scheduled messages are also indexed by send time so due messages
+can be found without touching every user.
+"""
+
+from abc import ABC, abstractmethod
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+
+class StorageBackend(ABC):
+
+    name = "base"
+
+    # Directory for memory.storage.user_lock's per-user lock files. None means
+    # thread locks only: individual writes are still transactional, but
+    # read-modify-write helpers then assume one process serves each user.
+    lock_root: Optional[Path] = None
+
+    # ---- documents -------------------------------------------------------
+
+    @abstractmethod
+    def load_document(self, user_id: str, kind: str, default: Callable[[], Any]) -> Any:
+        """Load a user's document, or default() if there is none."""
+
+    @abstractmethod
+    def save_document(self, user_id: str, kind: str, data: Any):
+        """Replace a user's document. Raises on failure."""
+
+    # ---- message log -----------------------------------------------------
+
+    @abstractmethod
+    def append_message(self, user_id: str, message: Dict, index: Optional[Dict] = None) -> Dict:
+        """
+        Append a message (without 'id') and return it with its id assigned.
+
+        `index` is a caller-held dict from message_index(); the backend may
+        use it to skip lookups and updates it in place.
+        """
+
+    @abstractmethod
+    def message_index(self, user_id: str) -> Dict:
+        """Small dict describing the log; always has 'count'."""
+
+    @abstractmethod
+    def recent_messages(self, user_id: str, count: int) -> List[Dict]:
+        """Last `count` messages in chronological order."""
+
+    @abstractmethod
+    def load_messages(self, user_id: str) -> List[Dict]:
+        """The whole log in chronological order."""
+
+    @abstractmethod
+    def replace_messages(self, user_id: str, messages: List[Dict]):
+        """
+        Rewrite the whole log (bulk edits, migration and archiving only).
+        Messages keep their ids; appends continue after the last one.
+        """
+
+    @abstractmethod
+    def clear_messages(self, user_id: str):
+        """Delete the log (and the text log, if any)."""
+
+    def append_text_log(self, user_id: str, text: str):
+        """Human-readable transcript. Optional - default is no text log."""
+
+    def take_text_log(self, user_id: str) -> bytes:
+        """Remove the text log and return what it held (for memory.archive)."""
+        return b""
+
+    # ---- scheduled messages ----------------------------------------------
+
+    @abstractmethod
+    def index_pending(self, user_id: str, pending: List[Dict]):
+        """Record the user's current pending scheduled messages (replaces previous)."""
+
+    @abstractmethod
+    def due_pending(self, now: datetime) -> List[Tuple[str, Dict]]:
+        """(user_id, message) for every pending message with send_at <= now."""
+
+    # ---- users -----------------------------------------------------------
+
+    @abstractmethod
+    def list_users(self) -> List[str]:
+        """Every user id with stored data."""
+
+    @abstractmethod
+    def clear_user(self, user_id: str):
+        """Delete everything stored for a user."""
+
+    def close(self):
+        """Release connections/handles."""
@@ -0,0 +1,368 @@
+"""
+JSON File Backend
+The original data/users/<id>/ tree: one JSON file per document plus the
+append-only history log.
+
+History is JSONL (history.jsonl, one message per line) with a tiny
+sidecar index (history.idx) holding the message count and the byte size
+the index was written at. Appends are O(1) and recent-message reads only
+touch the tail of the file. Legacy history.json files are migrated (and
+logs migrated before messages had ids are numbered) the first time a
+user's history is touched. The count is the last message id:
+once older messages have been archived (memory.archive) the log starts
+past id 1.
+
+Pending scheduled messages are mirrored into a global ScheduleIndex
+(schedule_index.jsonl in the data dir) so due polling doesn't walk every
+user directory. The index is built from the existing scheduled.json
+files the first time it's needed.
+"""
+
+import json
+import logging
+import os
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from memory.backends.base import StorageBackend
+from memory.backends.schedule_index import ScheduleIndex
+from core.tracing import add_io
+from memory.storage import atomic_write_bytes, atomic_write_json, read_json, user_lock, LOCK_FILE
+
+logger = logging.getLogger(__name__)
+
+HISTORY_FILE = "history.jsonl"
+INDEX_FILE = "history.idx"
+LEGACY_FILE = "history.json"
+TEXT_LOG_FILE = "history.txt"
+SCHEDULE_INDEX_FILE = "schedule_index.jsonl"
+
+# Bytes read per step when scanning backwards for the tail
+TAIL_BLOCK_SIZE = 8192
+
+
+def _encode(message: Dict) -> bytes:
+    return (json.dumps(message, ensure_ascii=False) + "\n").encode("utf-8")
+
+
+def _decode_lines(lines: List[bytes], user_id: str) -> List[Dict]:
+    messages = []
+    for line in lines:
+        if not line.strip():
+            continue
+        try:
+            messages.append(json.loads(line))
+        except json.JSONDecodeError as e:
+            logger.error(f"Skipping corrupt history line for {user_id}: {e}")
+    return messages
+
+
+def _has_id(line: bytes) -> bool:
+    try:
+        return bool(json.loads(line).get("id"))
+    except (ValueError, AttributeError):
+        return True  # corrupt line; _decode_lines reports it
+
+
+def _first_id(line: bytes) -> int:
+    try:
+        return int(json.loads(line).get("id") or 1)
+    except (ValueError, TypeError, AttributeError):
+        return 1
+
+
+class JsonFileBackend(StorageBackend):
+
+    name = "json"
+
+    def __init__(self, data_dir: Path):
+        self.data_dir = Path(data_dir)
+        self.lock_root = self.data_dir
+        self._schedule_index: Optional[ScheduleIndex] = None
+        self._ids_checked = set()
+
+    def user_dir(self, user_id: str) -> Path:
+        """Get or create user data directory."""
+        user_dir = self.data_dir / str(user_id)
+        user_dir.mkdir(parents=True, exist_ok=True)
+        return user_dir
+
+    # ---- documents -------------------------------------------------------
+
+    def load_document(self, user_id: str, kind: str, default: Callable[[], Any]) -> Any:
+        return read_json(self.user_dir(user_id) / f"{kind}.json", default)
+
+    def save_document(self, user_id: str, kind: str, data: Any):
+        with user_lock(user_id):
+            atomic_write_json(self.user_dir(user_id) / f"{kind}.json", data)
+
+    # ---- history index ---------------------------------------------------
+
+    def _write_index(self, user_dir: Path, count: int, size: int):
+        # Plain write is enough: a torn or stale index fails the size check and is rebuilt
+        payload = json.dumps({"count": count, "size": size})
+        with open(user_dir / INDEX_FILE, 'w', encoding='utf-8') as f:
+            f.write(payload)
+        add_io(written=len(payload))
+
+    def _rebuild_index(self, user_dir: Path) -> Dict:
+        """
+        Recount the log and rewrite the index.
+        Drops a torn trailing line left by a crash mid-append.
+        """
+        history_file = user_dir / HISTORY_FILE
+        count = 0
+        good_size = 0
+
+        if history_file.exists():
+            with open(history_file, 'rb') as f:
+                for line in f:
+                    if not line.endswith(b"\n"):
+                        break
+                    good_size += len(line)
+                    if line.strip():
+                        if count == 0:
+                            # Archived messages came before the first line
+                            count = _first_id(line) - 1
+                        count += 1
+
+            add_io(read=good_size)
+            if good_size != history_file.stat().st_size:
+                logger.warning(f"Truncating torn history tail in {user_dir.name}")
+                with open(history_file, 'r+b') as f:
+                    f.truncate(good_size)
+
+        self._write_index(user_dir, count, good_size)
+        return {"count": count, "size": good_size}
+
+    def _migrate_legacy(self, user_dir: Path):
+        """Convert a legacy history.json into the JSONL log (first touch only)."""
+        legacy_file = user_dir / LEGACY_FILE
+        history_file = user_dir / HISTORY_FILE
+
+        if not legacy_file.exists() or history_file.exists():
+            return
+
+        with user_lock(user_dir.name):
+            if not legacy_file.exists() or history_file.exists():
+                return
+
+            try:
+                with open(legacy_file, 'rb') as f:
+                    raw = f.read()
+                add_io(read=len(raw))
+                history = json.loads(raw)
+            except (json.JSONDecodeError, IOError) as e:
+                logger.error(f"Error migrating history for {user_dir.name}: {e}")
+                return
+
+            atomic_write_bytes(history_file, b"".join(_encode({"id": i, **message}) for i, message in enumerate(history, 1)))
+            self._write_index(user_dir, len(history), history_file.stat().st_size)
+
+            # Keep the original around rather than deleting user data
+            legacy_file.rename(user_dir / (LEGACY_FILE + ".migrated"))
+            logger.info(f"Migrated {len(history)} messages to JSONL for {user_dir.name}")
+
+    def _backfill_ids(self, user_dir: Path):
+        """
+        Number messages that have no id - logs migrated from history.json
+        before migration assigned ids. Checked once per user per process.
+        """
+        if user_dir.name in self._ids_checked:
+            return
+        history_file = user_dir / HISTORY_FILE
+
+        with user_lock(user_dir.name):
+            try:
+                with open(history_file, 'rb') as f:
+                    first = f.readline()
+            except FileNotFoundError:
+                first = b""
+            if not first.strip() or _has_id(first):
+                self._ids_checked.add(user_dir.name)
+                return
+
+            with open(history_file, 'rb') as f:
+                lines = f.readlines()
+            add_io(read=sum(len(line) for line in lines))
+            messages = _decode_lines([line for line in lines if line.endswith(b"\n")], user_dir.name)
+            last_id = 0
+            for i, message in enumerate(messages):
+                # Migrated messages come first; later appends already carry count + 1
+                last_id = message.get("id") or last_id + 1
+                messages[i] = {"id": last_id, **message}
+            atomic_write_bytes(history_file, b"".join(_encode(message) for message in messages))
+            self._write_index(user_dir, last_id, history_file.stat().st_size)
+            self._ids_checked.add(user_dir.name)
+            logger.info(f"Numbered {len(messages)} history messages for {user_dir.name}")
+
+    def _upgrade(self, user_dir: Path):
+        """Bring an older on-disk log up to the current format (first touch only)."""
+        self._migrate_legacy(user_dir)
+        self._backfill_ids(user_dir)
+
+    def _load_index(self, user_dir: Path) -> Dict:
+        """Read the sidecar index, rebuilding it if it is missing or stale."""
+        with user_lock(user_dir.name):
+            self._upgrade(user_dir)
+
+            history_file = user_dir / HISTORY_FILE
+            size = history_file.stat().st_size if history_file.exists() else 0
+
+            try:
+                with open(user_dir / INDEX_FILE, 'rb') as f:
+                    raw = f.read()
+                add_io(read=len(raw))
+                index = json.loads(raw)
+                if index.get("size") == size:
+                    return index
+            except (FileNotFoundError, json.JSONDecodeError, IOError):
+                pass
+
+            return self._rebuild_index(user_dir)
+
+    def _read_tail(self, user_dir: Path, count: int) -> List[bytes]:
+        """Read the last `count` lines by scanning backwards from the end of the log."""
+        history_file = user_dir / HISTORY_FILE
+        if count <= 0 or not history_file.exists():
+            return []
+
+        with open(history_file, 'rb') as f:
+            f.seek(0, os.SEEK_END)
+            position = f.tell()
+            buffer = b""
+
+            # count + 1 newlines guarantees `count` complete lines
+            while position > 0 and buffer.count(b"\n") <= count:
+                step = min(TAIL_BLOCK_SIZE, position)
+                position -= step
+                f.seek(position)
+                buffer = f.read(step) + buffer
+        add_io(read=len(buffer))
+
+        lines = buffer.split(b"\n")
+        if position > 0:
+            # First piece is a partial line
+            lines = lines[1:]
+        lines = [line for line in lines if line.strip()]
+        return lines[-count:]
+
+    # ---- message log -----------------------------------------------------
+
+    def message_index(self, user_id: str) -> Dict:
+        return dict(self._load_index(self.user_dir(user_id)))
+
+    def append_message(self, user_id: str, message: Dict, index: Optional[Dict] = None) -> Dict:
+        with user_lock(user_id):
+            user_dir = self.user_dir(user_id)
+            history_file = user_dir / HISTORY_FILE
+
+            # A caller-held index is trusted while the log size still matches
+            size = history_file.stat().st_size if history_file.exists() else 0
+            if index is None:
+                index = self._load_index(user_dir)
+            elif index.get("size") != size:
+                index.update(self._load_index(user_dir))
+
+            message = {"id": index["count"] + 1, **message}
+            line = _encode(message)
+            with open(history_file, 'ab') as f:
+                f.write(line)
+            add_io(written=len(line))
+            index["count"] += 1
+            index["size"] += len(line)
+            self._write_index(user_dir, index["count"], index["size"])
+            return message
+
+    def recent_messages(self, user_id: str, count: int) -> List[Dict]:
+        user_dir = self.user_dir(user_id)
+        self._upgrade(user_dir)
+        return _decode_lines(self._read_tail(user_dir, count), user_id)
+
+    def load_messages(self, user_id: str) -> List[Dict]:
+        user_dir = self.user_dir(user_id)
+        self._upgrade(user_dir)
+        history_file = user_dir / HISTORY_FILE
+
+        if not history_file.exists():
+            return []
+        with open(history_file, 'rb') as f:
+            lines = f.readlines()
+        add_io(read=sum(len(line) for line in lines))
+        return _decode_lines(lines, user_id)
+
+    def replace_messages(self, user_id: str, messages: List[Dict]):
+        with user_lock(user_id):
+            user_dir = self.user_dir(user_id)
+            history_file = user_dir / HISTORY_FILE
+            atomic_write_bytes(history_file, b"".join(_encode(message) for message in messages))
+            count = (messages[-1].get("id") or len(messages)) if messages else 0
+            self._write_index(user_dir, count, history_file.stat().st_size)
+
+    def clear_messages(self, user_id: str):
+        with user_lock(user_id):
+            user_dir = self.user_dir(user_id)
+            for name in (HISTORY_FILE, INDEX_FILE, LEGACY_FILE, LEGACY_FILE + ".migrated", TEXT_LOG_FILE):
+                history_file = user_dir / name
+                if history_file.exists():
+                    history_file.unlink()
+
+    def append_text_log(self, user_id: str, text: str):
+        with open(self.user_dir(user_id) / TEXT_LOG_FILE, 'a', encoding='utf-8') as f:
+            f.write(text)
+        add_io(written=len(text))
+
+    def take_text_log(self, user_id: str) -> bytes:
+        with user_lock(user_id):
+            text_log = self.user_dir(user_id) / TEXT_LOG_FILE
+            try:
+                with open(text_log, 'rb') as f:
+                    data = f.read()
+            except FileNotFoundError:
+                return b""
+            add_io(read=len(data))
+            text_log.unlink()
+            return data
+
+    # ---- scheduled messages ----------------------------------------------
+
+    @property
+    def schedule_index(self) -> ScheduleIndex:
+        if self._schedule_index is None:
+            self._schedule_index = ScheduleIndex(
+                self.data_dir / SCHEDULE_INDEX_FILE,
+                bootstrap=self._scan_pending
+            )
+        return self._schedule_index
+
+    def _scan_pending(self):
+        """Every user's pending list, read from scheduled.json (index bootstrap)."""
+        for user_id in self.list_users():
+            scheduled_file = self.data_dir / user_id / "scheduled.json"
+            if not scheduled_file.exists():
+                continue
+            scheduled = read_json(scheduled_file, lambda: {"pending": []})
+            if scheduled.get("pending"):
+                yield user_id, scheduled["pending"]
+
+    def index_pending(self, user_id: str, pending: List[Dict]):
+        self.schedule_index.replace_user(user_id, pending)
+
+    def due_pending(self, now: datetime) -> List[Tuple[str, Dict]]:
+        return self.schedule_index.due(now)
+
+    # ---- users -----------------------------------------------------------
+
+    def list_users(self) -> List[str]:
+        if not self.data_dir.exists():
+            return []
+        return [p.name for p in self.data_dir.iterdir() if p.is_dir()]
+
+    def clear_user(self, user_id: str):
+        with user_lock(user_id):
+            user_dir = self.user_dir(user_id)
+            for file in user_dir.iterdir():
+                if file.name != LOCK_FILE and file.is_file():
+                    file.unlink()
+            self.schedule_index.replace_user(user_id, [])
@@ -0,0 +1,122 @@
+"""
+One-shot migration from the JSON file tree to SQLite.
+
+    python -m memory.backends.migrate [--data-dir data/users] [--sqlite data/gate.db]
+
+Copies every user's documents, full message history and pending
+schedules. Re-running replaces each user's rows, so an interrupted run
+can simply be started again. The JSON tree is read straight from the
+files and left untouched: legacy history.json is not converted, missing
+message ids are not written back, and unreadable files are skipped
+rather than quarantined. Switch with STORAGE_BACKEND=sqlite once it
+finishes.
+"""
+
+import argparse
+import json
+import logging
+import time
+from pathlib import Path
+from typing import Dict, List
+
+from config import DATA_DIR, SQLITE_PATH
+from memory.backends.json_files import JsonFileBackend, HISTORY_FILE, LEGACY_FILE, _decode_lines
+from memory.backends.sqlite import SqliteBackend
+
+logger = logging.getLogger(__name__)
+
+DOCUMENT_KINDS = ("state", "facts", "episodic", "activity", "scheduled")
+
+
+def _read_document(path: Path):
+    """A document as stored, or None if it's missing or unreadable (left where it is)."""
+    try:
+        with open(path, 'rb') as f:
+            return json.loads(f.read())
+    except FileNotFoundError:
+        return None
+    except (json.JSONDecodeError, OSError) as e:
+        logger.error(f"Skipping unreadable {path}: {e}")
+        return None
+
+
+def read_messages(user_dir: Path) -> List[Dict]:
+    """
+    A user's history straight from the files: history.jsonl, or a legacy
+    history.json nobody has touched yet. Messages without an id (migrated
+    from history.json before ids were assigned) get their position.
+    """
+    history_file = user_dir / HISTORY_FILE
+    if history_file.exists():
+        with open(history_file, 'rb') as f:
+            # A torn last line (crash mid-append) has no newline yet
+            messages = _decode_lines([line for line in f if line.endswith(b"\n")], user_dir.name)
+    else:
+        messages = _read_document(user_dir / LEGACY_FILE) or []
+
+    last_id = 0
+    for i, message in enumerate(messages):
+        last_id = message.get("id") or last_id + 1
+        messages[i] = {"id": last_id, **message}
+    return messages
+
+
+def migrate_user(source: JsonFileBackend, target: SqliteBackend, user_id: str) -> int:
+    """Copy one user. Returns the number of messages copied."""
+    user_dir = source.data_dir / user_id
+
+    for kind in DOCUMENT_KINDS:
+        data = _read_document(user_dir / f"{kind}.json")
+        if data is None:
+            continue
+        target.save_document(user_id, kind, data)
+        if kind == "scheduled":
+            target.index_pending(user_id, data.get("pending", []))
+
+    messages = read_messages(user_dir)
+    target.replace_messages(user_id, messages)
+    return len(messages)
+
+
+def migrate(data_dir: Path, sqlite_path: Path) -> dict:
+    source = JsonFileBackend(data_dir)
+    target = SqliteBackend(sqlite_path)
+    users = source.list_users()
+
+    start = time.perf_counter()
+    messages = 0
+    failed = []
+    for i, user_id in enumerate(users, 1):
+        try:
+            messages += migrate_user(source, target, user_id)
+        except Exception as e:
+            logger.error(f"Failed to migrate {user_id}: {e}")
+            failed.append(user_id)
+        if i % 1000 == 0:
+            logger.info(f"Migrated {i}/{len(users)} users")
+
+    target.close()
+    return {
+        "users": len(users) - len(failed),
+        "messages": messages,
+        "failed": failed,
+        "seconds": round(time.perf_counter() - start, 2)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Migrate data/users/*.json to SQLite")
+    parser.add_argument("--data-dir", type=Path, default=DATA_DIR)
+    parser.add_argument("--sqlite", type=Path, default=SQLITE_PATH)
+    args = parser.parse_args()
+
+    logging.basicConfig(format='%(asctime)s - %(levelname)s - %(message)s', level=logging.INFO)
+    result = migrate(args.data_dir, args.sqlite)
+    logger.info(
+        f"Done: {result['users']} users, {result['messages']} messages in {result['seconds']}s"
+        + (f", {len(result['failed'])} failed: {result['failed']}" if result['failed'] else "")
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,210 @@
+"""
+Schedule Index
+Global time-ordered index of pending scheduled messages for the JSON
+file backend, so polling for due messages doesn't open every user's
+scheduled.json.
+
+In memory it is a min-heap of (send_at, user_id, message_id) plus the
+live pending set per user; superseded heap entries are skipped lazily.
+On disk it is one append-only journal (one line per index_pending call,
+last line per user wins) that is compacted once it grows well past the
+live set. Other processes appending to the journal are picked up by
+tailing it before each query; the first line carries a generation id so
+a reader notices when another process has compacted it.
+"""
+
+import heapq
+import json
+import logging
+import os
+import threading
+import uuid
+from datetime import datetime
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List, Tuple
+
+from core.tracing import add_io
+from memory.storage import atomic_write_bytes
+
+try:
+    import fcntl
+except ImportError:  # Windows: single-process only
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+# Compact when the journal has this many more lines than live users
+COMPACT_SLACK = 1000
+
+
+class ScheduleIndex:
+
+    def __init__(self, path: Path, bootstrap: Callable[[], Iterable[Tuple[str, List[Dict]]]] = None):
+        """
+        Args:
+            path: Journal file
+            bootstrap: Yields (user_id, pending) for every user; used once to
+                build the journal when it doesn't exist yet
+        """
+        self.path = Path(path)
+        self._lock = threading.RLock()
+        self._heap: List[Tuple[str, str, int]] = []
+        self._pending: Dict[str, Dict[int, Dict]] = {}
+        self._lines = 0
+        self._offset = 0
+        self._generation = None
+
+        with self._lock:
+            if self.path.exists():
+                self._reload()
+            else:
+                for user_id, pending in (bootstrap() if bootstrap else ()):
+                    self._apply(user_id, pending)
+                self._compact()
+
+    # ---- journal ---------------------------------------------------------
+
+    def _file_lock(self, f):
+        if fcntl is not None:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+
+    def _reload(self):
+        """Rebuild in-memory state from the whole journal."""
+        self._heap = []
+        self._pending = {}
+        self._lines = 0
+        self._offset = 0
+        self._generation = None
+        self._tail()
+        heapq.heapify(self._heap)
+
+    def _tail(self):
+        """Apply lines appended since we last looked (ours or another process's)."""
+        try:
+            with open(self.path, 'rb') as f:
+                header = f.readline()
+                try:
+                    generation = json.loads(header)["generation"]
+                except (json.JSONDecodeError, KeyError, TypeError):
+                    generation = None
+                if self._offset == 0:
+                    # First read; a journal without a header is read from the top
+                    self._generation = generation
+                    self._offset = len(header) if generation else 0
+                elif generation != self._generation:
+                    # Compacted by another process - start over
+                    self._reload()
+                    return
+                f.seek(self._offset)
+                data = f.read()
+        except FileNotFoundError:
+            return
+        add_io(read=len(data))
+
+        # Only consume complete lines
+        end = data.rfind(b"\n") + 1
+        for line in data[:end].splitlines():
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError as e:
+                logger.error(f"Skipping corrupt schedule index line: {e}")
+                continue
+            self._apply(record["u"], record["p"])
+            self._lines += 1
+        self._offset += end
+
+    def _open_locked(self):
+        """
+        The journal opened for append under the exclusive file lock. Retries if
+        another process compacted it while we waited - the lock would be on the
+        replaced file, and anything written there is lost.
+        """
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        while True:
+            f = open(self.path, 'ab')
+            self._file_lock(f)
+            try:
+                if fcntl is None or os.fstat(f.fileno()).st_ino == os.stat(self.path).st_ino:
+                    return f
+            except FileNotFoundError:
+                pass
+            f.close()
+
+    def _append(self, user_id: str, pending: List[Dict]):
+        line = (json.dumps({"u": user_id, "p": pending}, ensure_ascii=False) + "\n").encode("utf-8")
+        with self._open_locked() as f:
+            f.write(line)
+            f.flush()
+        add_io(written=len(line))
+
+    def _compact(self):
+        """Rewrite the journal as one line per user with pending messages."""
+        # Held until the new file is in place, so no other process appends to the old one
+        with self._open_locked():
+            self._tail()
+            self._generation = uuid.uuid4().hex
+            header = (json.dumps({"generation": self._generation}) + "\n").encode("utf-8")
+            payload = header + b"".join(
+                (json.dumps({"u": user_id, "p": list(pending.values())}, ensure_ascii=False) + "\n").encode("utf-8")
+                for user_id, pending in self._pending.items()
+            )
+            atomic_write_bytes(self.path, payload)
+            self._offset = len(payload)
+            self._lines = len(self._pending)
+
+    # ---- in-memory index -------------------------------------------------
+
+    def _apply(self, user_id: str, pending: List[Dict]):
+        if pending:
+            self._pending[user_id] = {msg["id"]: msg for msg in pending}
+            for msg in pending:
+                heapq.heappush(self._heap, (msg["send_at"], user_id, msg["id"]))
+        else:
+            self._pending.pop(user_id, None)
+
+    def _is_live(self, entry: Tuple[str, str, int]) -> bool:
+        send_at, user_id, message_id = entry
+        msg = self._pending.get(user_id, {}).get(message_id)
+        return msg is not None and msg["send_at"] == send_at
+
+    # ---- public API ------------------------------------------------------
+
+    def replace_user(self, user_id: str, pending: List[Dict]):
+        """Set a user's pending messages (empty list clears them)."""
+        user_id = str(user_id)
+        with self._lock:
+            self._tail()
+            if not pending and user_id not in self._pending:
+                return
+            # Applied by reading it back, in journal order with other writers
+            self._append(user_id, pending)
+            self._tail()
+            if self._lines > 2 * len(self._pending) + COMPACT_SLACK:
+                self._compact()
+                self._heap = [entry for entry in self._heap if self._is_live(entry)]
+                heapq.heapify(self._heap)
+
+    def due(self, now: datetime) -> List[Tuple[str, Dict]]:
+        """
+        (user_id, message) for every pending message with send_at <= now.
+        Messages stay indexed until the user's pending list changes.
+        """
+        cutoff = now.isoformat()
+        with self._lock:
+            self._tail()
+            due = []
+            live = set()
+            while self._heap and self._heap[0][0] <= cutoff:
+                entry = heapq.heappop(self._heap)
+                # Re-indexing an unchanged message pushes a duplicate entry
+                if entry not in live and self._is_live(entry):
+                    live.add(entry)
+                    due.append((entry[1], self._pending[entry[1]][entry[2]]))
+            for entry in live:
+                heapq.heappush(self._heap, entry)
+            return due
+
+    def __len__(self) -> int:
+        return sum(len(p) for p in self._pending.values())
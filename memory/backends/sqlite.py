@@ -0,0 +1,253 @@
+"""
+SQLite Backend
+All users in one WAL-mode database instead of six files per user.
+
+Tables:
+- users:     one row per user (user_id, created_at)
+- documents: state / facts / episodic / activity / scheduled as JSON, keyed (user_id, kind)
+- messages:  the conversation log, primary key (user_id, id)
+- schedules: pending scheduled messages, indexed on send_at
+
+Each thread gets its own connection. There is no plain-text transcript in
+this backend; the messages table is the readable log. Storage bytes
+reported to the turn trace are payload sizes, not page I/O.
+"""
+
+import json
+import logging
+import sqlite3
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from core.tracing import add_io
+from memory.backends.base import StorageBackend
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS users (
+    user_id     TEXT PRIMARY KEY,
+    created_at  TEXT NOT NULL
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS documents (
+    user_id     TEXT NOT NULL,
+    kind        TEXT NOT NULL,
+    data        TEXT NOT NULL,
+    updated_at  TEXT NOT NULL,
+    PRIMARY KEY (user_id, kind)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS messages (
+    user_id     TEXT NOT NULL,
+    id          INTEGER NOT NULL,
+    role        TEXT NOT NULL,
+    content     TEXT NOT NULL,
+    timestamp   TEXT NOT NULL,
+    metadata    TEXT NOT NULL DEFAULT '{}',
+    PRIMARY KEY (user_id, id)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS schedules (
+    user_id     TEXT NOT NULL,
+    id          INTEGER NOT NULL,
+    send_at     TEXT NOT NULL,
+    payload     TEXT NOT NULL,
+    PRIMARY KEY (user_id, id)
+) WITHOUT ROWID;
+
+CREATE INDEX IF NOT EXISTS idx_schedules_send_at ON schedules (send_at);
+"""
+
+
+def _row_to_message(row) -> Dict:
+    add_io(read=len(row[2]) + len(row[4] or ""))
+    return {
+        "id": row[0],
+        "role": row[1],
+        "content": row[2],
+        "timestamp": row[3],
+        "metadata": json.loads(row[4]) if row[4] else {}
+    }
+
+
+class SqliteBackend(StorageBackend):
+
+    name = "sqlite"
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._local = threading.local()
+        self._connections = []
+        self._connections_lock = threading.Lock()
+        self._conn().executescript(SCHEMA)
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            # Autocommit mode; transactions are opened explicitly
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA foreign_keys=OFF")
+            self._local.conn = conn
+            with self._connections_lock:
+                self._connections.append(conn)
+        return conn
+
+    @contextmanager
+    def _transaction(self):
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+
+    def _touch_user(self, conn: sqlite3.Connection, user_id: str):
+        conn.execute(
+            "INSERT OR IGNORE INTO users (user_id, created_at) VALUES (?, ?)",
+            (user_id, datetime.now().isoformat())
+        )
+
+    # ---- documents -------------------------------------------------------
+
+    def load_document(self, user_id: str, kind: str, default: Callable[[], Any]) -> Any:
+        row = self._conn().execute(
+            "SELECT data FROM documents WHERE user_id = ? AND kind = ?",
+            (str(user_id), kind)
+        ).fetchone()
+        if row is None:
+            return default()
+        add_io(read=len(row[0]))
+        try:
+            return json.loads(row[0])
+        except json.JSONDecodeError as e:
+            logger.error(f"Corrupt {kind} document for {user_id}: {e}")
+            return default()
+
+    def save_document(self, user_id: str, kind: str, data: Any):
+        payload = json.dumps(data, ensure_ascii=False)
+        with self._transaction() as conn:
+            self._touch_user(conn, str(user_id))
+            conn.execute(
+                "INSERT INTO documents (user_id, kind, data, updated_at) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT (user_id, kind) DO UPDATE SET data = excluded.data, updated_at = excluded.updated_at",
+                (str(user_id), kind, payload, datetime.now().isoformat())
+            )
+        add_io(written=len(payload))
+
+    # ---- message log -----------------------------------------------------
+
+    def message_index(self, user_id: str) -> Dict:
+        row = self._conn().execute(
+            "SELECT COALESCE(MAX(id), 0) FROM messages WHERE user_id = ?",
+            (str(user_id),)
+        ).fetchone()
+        return {"count": row[0]}
+
+    def append_message(self, user_id: str, message: Dict, index: Optional[Dict] = None) -> Dict:
+        user_id = str(user_id)
+        with self._transaction() as conn:
+            self._touch_user(conn, user_id)
+            # MAX(id) is a single seek on the (user_id, id) primary key
+            next_id = conn.execute(
+                "SELECT COALESCE(MAX(id), 0) + 1 FROM messages WHERE user_id = ?",
+                (user_id,)
+            ).fetchone()[0]
+            metadata = json.dumps(message.get("metadata") or {}, ensure_ascii=False)
+            conn.execute(
+                "INSERT INTO messages (user_id, id, role, content, timestamp, metadata) VALUES (?, ?, ?, ?, ?, ?)",
+                (
+                    user_id, next_id, message["role"], message["content"],
+                    message.get("timestamp") or datetime.now().isoformat(),
+                    metadata
+                )
+            )
+        add_io(written=len(message["content"]) + len(metadata))
+        if index is not None:
+            index["count"] = next_id
+        return {"id": next_id, **message}
+
+    def recent_messages(self, user_id: str, count: int) -> List[Dict]:
+        rows = self._conn().execute(
+            "SELECT id, role, content, timestamp, metadata FROM messages "
+            "WHERE user_id = ? ORDER BY id DESC LIMIT ?",
+            (str(user_id), count)
+        ).fetchall()
+        return [_row_to_message(row) for row in reversed(rows)]
+
+    def load_messages(self, user_id: str) -> List[Dict]:
+        rows = self._conn().execute(
+            "SELECT id, role, content, timestamp, metadata FROM messages "
+            "WHERE user_id = ? ORDER BY id",
+            (str(user_id),)
+        ).fetchall()
+        return [_row_to_message(row) for row in rows]
+
+    def replace_messages(self, user_id: str, messages: List[Dict]):
+        user_id = str(user_id)
+        with self._transaction() as conn:
+            self._touch_user(conn, user_id)
+            conn.execute("DELETE FROM messages WHERE user_id = ?", (user_id,))
+            conn.executemany(
+                "INSERT OR REPLACE INTO messages (user_id, id, role, content, timestamp, metadata) VALUES (?, ?, ?, ?, ?, ?)",
+                [
+                    (
+                        user_id, m.get("id") or i, m["role"], m["content"],
+                        m.get("timestamp") or datetime.now().isoformat(),
+                        json.dumps(m.get("metadata") or {}, ensure_ascii=False)
+                    )
+                    for i, m in enumerate(messages, 1)
+                ]
+            )
+
+    def clear_messages(self, user_id: str):
+        with self._transaction() as conn:
+            conn.execute("DELETE FROM messages WHERE user_id = ?", (str(user_id),))
+
+    # ---- scheduled messages ----------------------------------------------
+
+    def index_pending(self, user_id: str, pending: List[Dict]):
+        user_id = str(user_id)
+        with self._transaction() as conn:
+            conn.execute("DELETE FROM schedules WHERE user_id = ?", (user_id,))
+            conn.executemany(
+                "INSERT INTO schedules (user_id, id, send_at, payload) VALUES (?, ?, ?, ?)",
+                [(user_id, m["id"], m["send_at"], json.dumps(m, ensure_ascii=False)) for m in pending]
+            )
+
+    def due_pending(self, now: datetime) -> List[Tuple[str, Dict]]:
+        # ISO timestamps sort lexically, so this is a range scan on idx_schedules_send_at
+        rows = self._conn().execute(
+            "SELECT user_id, payload FROM schedules WHERE send_at <= ? ORDER BY send_at",
+            (now.isoformat(),)
+        ).fetchall()
+        return [(user_id, json.loads(payload)) for user_id, payload in rows]
+
+    # ---- users -----------------------------------------------------------
+
+    def list_users(self) -> List[str]:
+        return [row[0] for row in self._conn().execute("SELECT user_id FROM users")]
+
+    def clear_user(self, user_id: str):
+        user_id = str(user_id)
+        with self._transaction() as conn:
+            for table in ("documents", "messages", "schedules", "users"):
+                conn.execute(f"DELETE FROM {table} WHERE user_id = ?", (user_id,))
+
+    def close(self):
+        with self._connections_lock:
+            for conn in self._connections:
+                try:
+                    conn.close()
+                except sqlite3.Error:
+                    pass
+            self._connections = []
+        self._local = threading.local()
@@ -3,51 +3,32 @@ Episodic Memory Module
 Stores and retrieves significant moments (breakthroughs, commitments, completions).
 """
 
-import json
 import logging
 from datetime import datetime
-from pathlib import Path
 from typing import Dict, List, Optional
 
-from config import DATA_DIR
+from memory.backends import get_backend
+from memory.storage import with_user_lock
 
 logger = logging.getLogger(__name__)
 
 
-def get_user_dir(user_id: str) -> Path:
-    """Get or create user data directory."""
-    user_dir = DATA_DIR / str(user_id)
-    user_dir.mkdir(parents=True, exist_ok=True)
-    return user_dir
-
-
 def load_episodic(user_id: str) -> List[Dict]:
     """Load episodic memories from episodic.json."""
-    episodic_file = get_user_dir(user_id) / "episodic.json"
-    
-    if episodic_file.exists():
-        try:
-            with open(episodic_file, 'r', encoding='utf-8') as f:
-                return json.load(f)
-        except (json.JSONDecodeError, IOError) as e:
-            logger.error(f"Error loading episodic for {user_id}: {e}")
-    
-    return []
+    return get_backend().load_document(user_id, "episodic", list)
 
 
 def save_episodic(user_id: str, episodes: List[Dict]) -> bool:
     """Save episodic memories to episodic.json."""
-    episodic_file = get_user_dir(user_id) / "episodic.json"
-    
     try:
-        with open(episodic_file, 'w', encoding='utf-8') as f:
-            json.dump(episodes, f, indent=2, ensure_ascii=False)
+        get_backend().save_document(user_id, "episodic", episodes)
         return True
-    except IOError as e:
+    except Exception as e:
         logger.error(f"Error saving episodic for {user_id}: {e}")
         return False
 
 
+@with_user_lock
 def add_episode(
     user_id: str,
     episode_type: str,
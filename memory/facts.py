@@ -3,35 +3,22 @@ Facts Storage Module
 Handles long-term facts about the user extracted from conversation.
 """
 
-import json
 import logging
 from datetime import datetime
-from pathlib import Path
 from typing import Dict, Optional, List
 
-from config import DATA_DIR
+from memory.backends import get_backend
+from memory.storage import with_user_lock
 
 logger = logging.getLogger(__name__)
 
 
-def get_user_dir(user_id: str) -> Path:
-    """Get or create user data directory."""
-    user_dir = DATA_DIR / str(user_id)
-    user_dir.mkdir(parents=True, exist_ok=True)
-    return user_dir
-
-
 def load_facts(user_id: str) -> Dict:
     """Load user facts from facts.json."""
-    facts_file = get_user_dir(user_id) / "facts.json"
-    
-    if facts_file.exists():
-        try:
-            with open(facts_file, 'r', encoding='utf-8') as f:
-                return json.load(f)
-        except (json.JSONDecodeError, IOError) as e:
-            logger.error(f"Error loading facts for {user_id}: {e}")
-    
+    return get_backend().load_document(user_id, "facts", lambda: _default_facts(user_id))
+
+
+def _default_facts(user_id: str) -> Dict:
     # Default facts structure
     return {
         "user_id": user_id,
@@ -49,18 +36,17 @@ def load_facts(user_id: str) -> Dict:
 
 def save_facts(user_id: str, facts: Dict) -> bool:
     """Save user facts to facts.json."""
-    facts_file = get_user_dir(user_id) / "facts.json"
     facts["updated_at"] = datetime.now().isoformat()
     
     try:
-        with open(facts_file, 'w', encoding='utf-8') as f:
-            json.dump(facts, f, indent=2, ensure_ascii=False)
+        get_backend().save_document(user_id, "facts", facts)
         return True
-    except IOError as e:
+    except Exception as e:
         logger.error(f"Error saving facts for {user_id}: {e}")
         return False
 
 
+@with_user_lock
 def merge_facts(user_id: str, new_facts: Dict) -> Dict:
     """
     Merge new facts with existing facts.
@@ -92,6 +78,7 @@ def merge_facts(user_id: str, new_facts: Dict) -> Dict:
     return current
 
 
+@with_user_lock
 def set_goal(user_id: str, goal: str) -> Dict:
     """Set the user's primary goal."""
     facts = load_facts(user_id)
@@ -100,6 +87,7 @@ def set_goal(user_id: str, goal: str) -> Dict:
     return facts
 
 
+@with_user_lock
 def add_pinned(user_id: str, content: str, source: str = "user") -> Dict:
     """
     Add a pinned fact (user-saved via /save).
@@ -127,6 +115,7 @@ def add_pinned(user_id: str, content: str, source: str = "user") -> Dict:
     return pinned_item
 
 
+@with_user_lock
 def remove_pinned(user_id: str, pin_id: int) -> bool:
     """Remove a pinned fact by ID."""
     facts = load_facts(user_id)
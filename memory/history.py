@@ -1,49 +1,52 @@
 """
 Conversation History Module
 Handles full conversation storage and recent message retrieval.
+
+Messages live in the active storage backend (memory.backends): an
+append-only JSONL log per user by default, or the messages table with
+STORAGE_BACKEND=sqlite. Appends are O(1) and recent-message reads only
+touch the tail of the log.
 """
 
-import json
 import logging
 from datetime import datetime
-from pathlib import Path
+from functools import lru_cache
 from typing import Dict, List, Optional
 
-from config import DATA_DIR, RECENT_MESSAGES_COUNT
+import pytz
+
+from config import RECENT_MESSAGES_COUNT
+from memory.backends import get_backend
 
 logger = logging.getLogger(__name__)
 
 
-def get_user_dir(user_id: str) -> Path:
-    """Get or create user data directory."""
-    user_dir = DATA_DIR / str(user_id)
-    user_dir.mkdir(parents=True, exist_ok=True)
-    return user_dir
+@lru_cache(maxsize=256)
+def _timezone(name: str):
+    """pytz zone for a state's timezone name (raises for unknown names, which aren't cached)."""
+    return pytz.timezone(name)
+
+
+def get_history_index(user_id: str) -> Dict:
+    """Current log index ({"count", ...}), for callers that cache it (see memory.session)."""
+    return get_backend().message_index(user_id)
 
 
 def load_history(user_id: str) -> List[Dict]:
-    """Load full conversation history from history.json."""
-    history_file = get_user_dir(user_id) / "history.json"
-    
-    if history_file.exists():
-        try:
-            with open(history_file, 'r', encoding='utf-8') as f:
-                return json.load(f)
-        except (json.JSONDecodeError, IOError) as e:
-            logger.error(f"Error loading history for {user_id}: {e}")
-    
-    return []
+    """Load full conversation history."""
+    try:
+        return get_backend().load_messages(user_id)
+    except Exception as e:
+        logger.error(f"Error loading history for {user_id}: {e}")
+        return []
 
 
 def save_history(user_id: str, history: List[Dict]) -> bool:
-    """Save conversation history to history.json."""
-    history_file = get_user_dir(user_id) / "history.json"
-    
+    """Rewrite the whole history log. Only needed for bulk edits - use append_message per message."""
     try:
-        with open(history_file, 'w', encoding='utf-8') as f:
-            json.dump(history, f, indent=2, ensure_ascii=False)
+        get_backend().replace_messages(user_id, history)
         return True
-    except IOError as e:
+    except Exception as e:
         logger.error(f"Error saving history for {user_id}: {e}")
         return False
 
@@ -52,7 +55,9 @@ def append_message(
     user_id: str,
     role: str,
     content: str,
-    metadata: Optional[Dict] = None
+    metadata: Optional[Dict] = None,
+    state: Optional[Dict] = None,
+    index: Optional[Dict] = None
 ) -> Dict:
     """
     Append a message to conversation history.
@@ -62,25 +67,27 @@ def append_message(
         role: 'user' or 'assistant'
         content: Message content
         metadata: Optional metadata (e.g., voice=True, scheduled=True)
+        state: Caller's copy of the user state, saves a state read for the text log
+        index: Caller-held history index from get_history_index(), updated in place.
+            Lets cached users skip the index read.
     
     Returns:
         The appended message dict
     """
-    history = load_history(user_id)
-    
     message = {
-        "id": len(history) + 1,
         "role": role,
         "content": content,
         "timestamp": datetime.now().isoformat(),
         "metadata": metadata or {}
     }
     
-    history.append(message)
-    save_history(user_id, history)
+    try:
+        message = get_backend().append_message(user_id, message, index=index)
+    except Exception as e:
+        logger.error(f"Error appending history for {user_id}: {e}")
     
     # Also append to human-readable text file
-    append_to_text_log(user_id, role, content, metadata)
+    append_to_text_log(user_id, role, content, metadata, state=state)
     
     return message
 
@@ -89,16 +96,15 @@ def append_to_text_log(
     user_id: str,
     role: str,
     content: str,
-    metadata: Optional[Dict] = None
+    metadata: Optional[Dict] = None,
+    state: Optional[Dict] = None
 ):
     """Append to human-readable text log with user context."""
     from memory.state import load_state
-    import pytz
-
-    log_file = get_user_dir(user_id) / "history.txt"
 
     # Get user state for timezone and username
-    state = load_state(user_id)
+    if state is None:
+        state = load_state(user_id)
     username = state.get("username", "unknown")
     user_tz_str = state.get("timezone")
 
@@ -106,7 +112,7 @@ def append_to_text_log(
     now = datetime.now()
     if user_tz_str:
         try:
-            user_tz = pytz.timezone(user_tz_str)
+            user_tz = _timezone(user_tz_str)
             now = datetime.now(pytz.UTC).astimezone(user_tz)
             tz_abbrev = now.strftime("%Z")
         except Exception:
@@ -131,8 +137,7 @@ def append_to_text_log(
     header = f"[user_id: {user_id} | @{username} | {timestamp} {tz_abbrev}]"
 
     try:
-        with open(log_file, 'a', encoding='utf-8') as f:
-            f.write(f"{header}\n{prefix}: {indicator_str}{content}\n\n")
+        get_backend().append_text_log(user_id, f"{header}\n{prefix}: {indicator_str}{content}\n\n")
     except IOError as e:
         logger.error(f"Error appending to text log for {user_id}: {e}")
 
@@ -149,10 +154,13 @@ def get_recent_messages(user_id: str, count: int = None) -> List[Dict]:
         List of recent messages in chronological order
     """
     count = count or RECENT_MESSAGES_COUNT
-    history = load_history(user_id)
     
-    # Return last N messages
-    return history[-count:] if len(history) >= count else history
+    # Return last N messages (reads only the tail of the log)
+    try:
+        return get_backend().recent_messages(user_id, count)
+    except Exception as e:
+        logger.error(f"Error reading recent history for {user_id}: {e}")
+        return []
 
 
 def get_messages_for_api(user_id: str, count: int = None) -> List[Dict]:
@@ -171,24 +179,24 @@ def get_last_message(user_id: str, role: str = None) -> Optional[Dict]:
     """
     Get the last message, optionally filtered by role.
     """
-    history = load_history(user_id)
-    
-    if not history:
-        return None
+    if not role:
+        recent = get_recent_messages(user_id, count=1)
+        return recent[-1] if recent else None
     
-    if role:
-        for msg in reversed(history):
-            if msg["role"] == role:
-                return msg
-        return None
+    # Usually within the last few lines; fall back to a full scan
+    for msg in reversed(get_recent_messages(user_id, count=10)):
+        if msg["role"] == role:
+            return msg
     
-    return history[-1]
+    for msg in reversed(load_history(user_id)):
+        if msg["role"] == role:
+            return msg
+    return None
 
 
 def get_message_count(user_id: str) -> int:
-    """Get total message count."""
-    history = load_history(user_id)
-    return len(history)
+    """Get total message count (from the log index, no log parse)."""
+    return get_backend().message_index(user_id)["count"]
 
 
 def get_messages_since_last_completion(user_id: str) -> List[Dict]:
@@ -241,15 +249,9 @@ def search_history(user_id: str, query: str, limit: int = 10) -> List[Dict]:
 
 def clear_history(user_id: str) -> bool:
     """Clear all conversation history."""
-    history_file = get_user_dir(user_id) / "history.json"
-    text_file = get_user_dir(user_id) / "history.txt"
-    
     try:
-        if history_file.exists():
-            history_file.unlink()
-        if text_file.exists():
-            text_file.unlink()
+        get_backend().clear_messages(user_id)
         return True
-    except IOError as e:
+    except Exception as e:
         logger.error(f"Error clearing history for {user_id}: {e}")
         return False
@@ -3,36 +3,24 @@ Scheduled Messages Module
 Handles dynamic re-engagement message scheduling based on user activity patterns.
 """
 
-import json
 import logging
 from datetime import datetime, timedelta
-from pathlib import Path
 from typing import Dict, List, Optional, Tuple
 import random
 
-from config import DATA_DIR, REENGAGEMENT_WINDOWS
+from config import REENGAGEMENT_WINDOWS
+from memory.backends import get_backend
+from memory.storage import with_user_lock
 
 logger = logging.getLogger(__name__)
 
 
-def get_user_dir(user_id: str) -> Path:
-    """Get or create user data directory."""
-    user_dir = DATA_DIR / str(user_id)
-    user_dir.mkdir(parents=True, exist_ok=True)
-    return user_dir
-
-
 def load_activity(user_id: str) -> Dict:
     """Load user activity data for availability inference."""
-    activity_file = get_user_dir(user_id) / "activity.json"
-    
-    if activity_file.exists():
-        try:
-            with open(activity_file, 'r', encoding='utf-8') as f:
-                return json.load(f)
-        except (json.JSONDecodeError, IOError) as e:
-            logger.error(f"Error loading activity for {user_id}: {e}")
-    
+    return get_backend().load_document(user_id, "activity", lambda: _default_activity(user_id))
+
+
+def _default_activity(user_id: str) -> Dict:
     return {
         "user_id": user_id,
         "message_timestamps": [],
@@ -44,17 +32,15 @@ def load_activity(user_id: str) -> Dict:
 
 def save_activity(user_id: str, activity: Dict) -> bool:
     """Save user activity data."""
-    activity_file = get_user_dir(user_id) / "activity.json"
-    
     try:
-        with open(activity_file, 'w', encoding='utf-8') as f:
-            json.dump(activity, f, indent=2, ensure_ascii=False)
+        get_backend().save_document(user_id, "activity", activity)
         return True
-    except IOError as e:
+    except Exception as e:
         logger.error(f"Error saving activity for {user_id}: {e}")
         return False
 
 
+@with_user_lock
 def record_user_activity(user_id: str, response_latency: float = None):
     """
     Record a user message for activity pattern inference.
@@ -78,6 +64,7 @@ def record_user_activity(user_id: str, response_latency: float = None):
     save_activity(user_id, activity)
 
 
+@with_user_lock
 def analyze_availability_windows(user_id: str) -> Dict:
     """
     Analyze user message patterns to infer availability windows.
@@ -222,31 +209,22 @@ def get_best_send_time(user_id: str, min_hours_from_now: float = 1) -> datetime:
 
 def load_scheduled(user_id: str) -> Dict:
     """Load scheduled messages for user."""
-    scheduled_file = get_user_dir(user_id) / "scheduled.json"
-    
-    if scheduled_file.exists():
-        try:
-            with open(scheduled_file, 'r', encoding='utf-8') as f:
-                return json.load(f)
-        except (json.JSONDecodeError, IOError) as e:
-            logger.error(f"Error loading scheduled for {user_id}: {e}")
-    
-    return {"pending": [], "sent": []}
+    return get_backend().load_document(user_id, "scheduled", lambda: {"pending": [], "sent": []})
 
 
 def save_scheduled(user_id: str, scheduled: Dict) -> bool:
     """Save scheduled messages."""
-    scheduled_file = get_user_dir(user_id) / "scheduled.json"
-    
     try:
-        with open(scheduled_file, 'w', encoding='utf-8') as f:
-            json.dump(scheduled, f, indent=2, ensure_ascii=False)
+        backend = get_backend()
+        backend.save_document(user_id, "scheduled", scheduled)
+        backend.index_pending(user_id, scheduled.get("pending", []))
         return True
-    except IOError as e:
+    except Exception as e:
         logger.error(f"Error saving scheduled for {user_id}: {e}")
         return False
 
 
+@with_user_lock
 def schedule_reengagement(
     user_id: str,
     trigger_type: str = "soft_ping",
@@ -298,6 +276,7 @@ def schedule_reengagement(
     return message_entry
 
 
+@with_user_lock
 def cancel_pending(user_id: str, reason: str = "user_message") -> int:
     """
     Cancel all pending scheduled messages.
@@ -336,24 +315,10 @@ def get_due_messages() -> List[Tuple[str, Dict]]:
     Returns:
         List of (user_id, message_dict) tuples
     """
-    due = []
-    now = datetime.now()
-    
-    # Iterate through all user directories
-    if DATA_DIR.exists():
-        for user_dir in DATA_DIR.iterdir():
-            if user_dir.is_dir():
-                user_id = user_dir.name
-                scheduled = load_scheduled(user_id)
-                
-                for msg in scheduled.get("pending", []):
-                    send_at = datetime.fromisoformat(msg["send_at"])
-                    if send_at <= now:
-                        due.append((user_id, msg))
-    
-    return due
+    return get_backend().due_pending(datetime.now())
 
 
+@with_user_lock
 def mark_sent(user_id: str, message_id: int, actual_message: str) -> bool:
     """
     Mark a scheduled message as sent.
@@ -0,0 +1,279 @@
+"""
+User Session Cache
+Keeps hot users' state, recent history window and activity in RAM,
+plus the rolling escalation window built from per-message suspicion
+verdicts (stored in user messages' metadata).
+
+History appends still go straight to the append-only log. State and
+activity changes are marked dirty and written behind by a debounced
+flush, so a hot user's turn costs no JSON parses at all. Idle users are
+flushed and evicted (LRU by last access). Call flush() on shutdown.
+Users that memory.archive evicted to cold storage are rehydrated on load.
+"""
+
+import atexit
+import logging
+import threading
+import time
+from collections import OrderedDict, deque
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from config import (
+    SESSION_CACHE_IDLE_SECONDS,
+    SESSION_CACHE_MAX_USERS,
+    SESSION_FLUSH_DELAY_SECONDS,
+    SESSION_HISTORY_WINDOW,
+)
+from memory.archive import rehydrate
+from memory.state import load_state, save_state
+from memory.storage import user_lock, async_user_lock_held
+from memory.history import append_message, get_recent_messages, get_history_index
+from memory.scheduled import load_activity, save_activity
+
+logger = logging.getLogger(__name__)
+
+
+class UserSession:
+    """One user's cached memory. Mutate only while holding `lock`."""
+
+    def __init__(self, user_id: str):
+        self.user_id = user_id
+        self.lock = threading.RLock()
+        self.state: Dict = load_state(user_id)
+        self.history_index: Dict = get_history_index(user_id)
+        self.recent = deque(
+            get_recent_messages(user_id, count=SESSION_HISTORY_WINDOW),
+            maxlen=SESSION_HISTORY_WINDOW
+        )
+        self._activity: Optional[Dict] = None
+        self._escalation = None
+        self.dirty = set()
+        # Set when the user's data is deleted; nothing of this session is written after that
+        self.dropped = False
+        self.last_access = time.monotonic()
+
+    @property
+    def message_count(self) -> int:
+        return self.history_index["count"]
+
+    @property
+    def activity(self) -> Dict:
+        # Only needed by scheduling, so load on first use
+        if self._activity is None:
+            self._activity = load_activity(self.user_id)
+        return self._activity
+
+    @property
+    def escalation(self):
+        """ConversationMonitor window over the latest messages' suspicion verdicts."""
+        if self._escalation is None:
+            from core.security import conversation_monitor, sanitizer
+
+            flags = []
+            for m in self.recent_messages(conversation_monitor.window_size):
+                if m.get("role") != "user":
+                    flags.append(False)
+                elif "suspicious" in m.get("metadata", {}):
+                    flags.append(m["metadata"]["suspicious"])
+                else:
+                    # Stored before verdicts were recorded - scan once
+                    flags.append(sanitizer.detect_injection(m.get("content", ""))[0])
+            self._escalation = conversation_monitor.new_window(flags)
+        return self._escalation
+
+    def recent_messages(self, count: int = None) -> List[Dict]:
+        messages = list(self.recent)
+        return messages[-count:] if count else messages
+
+
+class SessionCache:
+    """LRU cache of UserSession objects with write-behind flushing."""
+
+    def __init__(
+        self,
+        idle_seconds: float = SESSION_CACHE_IDLE_SECONDS,
+        max_users: int = SESSION_CACHE_MAX_USERS,
+        flush_delay: float = SESSION_FLUSH_DELAY_SECONDS
+    ):
+        self.idle_seconds = idle_seconds
+        self.max_users = max_users
+        self.flush_delay = flush_delay
+        self._sessions: "OrderedDict[str, UserSession]" = OrderedDict()
+        self._loading: Dict[str, int] = {}
+        self._lock = threading.RLock()
+        self._timer: Optional[threading.Timer] = None
+
+    def get(self, user_id: str) -> UserSession:
+        """Get a user's session, loading it from disk on a miss."""
+        user_id = str(user_id)
+        with self._lock:
+            session = self._sessions.get(user_id)
+            if session is not None:
+                self._sessions.move_to_end(user_id)
+                session.last_access = time.monotonic()
+                return session
+
+            self._loading[user_id] = self._loading.get(user_id, 0) + 1
+
+        # Load outside the cache lock so cold users don't serialize each other
+        try:
+            with user_lock(user_id):
+                rehydrate(user_id)
+                loaded = UserSession(user_id)
+        finally:
+            with self._lock:
+                self._loading[user_id] -= 1
+                if not self._loading[user_id]:
+                    del self._loading[user_id]
+
+        with self._lock:
+            session = self._sessions.setdefault(user_id, loaded)
+            self._sessions.move_to_end(user_id)
+            session.last_access = time.monotonic()
+        self._evict_idle()
+        return session
+
+    def peek(self, user_id: str) -> Optional[UserSession]:
+        """Cached session if present, without loading or touching LRU order."""
+        with self._lock:
+            return self._sessions.get(str(user_id))
+
+    def active(self, user_id: str) -> bool:
+        """Cached or being loaded right now (memory.archive won't evict them)."""
+        user_id = str(user_id)
+        with self._lock:
+            return user_id in self._sessions or user_id in self._loading
+
+    def append_message(
+        self,
+        session: UserSession,
+        role: str,
+        content: str,
+        metadata: Optional[Dict] = None
+    ) -> Dict:
+        """Append to the on-disk log and the in-memory window."""
+        with session.lock:
+            message = append_message(
+                session.user_id, role, content, metadata,
+                state=session.state,
+                index=session.history_index
+            )
+            session.recent.append(message)
+            if session._escalation is not None:
+                session._escalation.push(role == "user" and bool((metadata or {}).get("suspicious")))
+        return message
+
+    def record_activity(self, session: UserSession, response_latency: float = None):
+        """In-memory equivalent of scheduled.record_user_activity."""
+        with session.lock:
+            activity = session.activity
+            activity["message_timestamps"].append(datetime.now().isoformat())
+            if response_latency is not None:
+                activity["response_latencies"].append(response_latency)
+            activity["message_timestamps"] = activity["message_timestamps"][-100:]
+            activity["response_latencies"] = activity["response_latencies"][-100:]
+        self.mark_dirty(session, "activity")
+
+    def mark_dirty(self, session: UserSession, *parts: str):
+        """Queue parts ('state', 'activity') for the next debounced flush."""
+        with session.lock:
+            session.dirty.update(parts or ("state",))
+        self._schedule_flush()
+
+    def _schedule_flush(self):
+        with self._lock:
+            if self._timer is None:
+                self._timer = threading.Timer(self.flush_delay, self._timer_flush)
+                self._timer.daemon = True
+                self._timer.start()
+
+    def _timer_flush(self):
+        with self._lock:
+            self._timer = None
+        self._evict_idle()
+        self.flush()
+
+    def _flush_session(self, session: UserSession) -> bool:
+        """Write a session's dirty parts. Parts that fail stay dirty for the next flush."""
+        with session.lock:
+            dirty = session.dirty
+            session.dirty = set()
+            if session.dropped:
+                return True
+            if "state" in dirty and not save_state(session.user_id, session.state):
+                session.dirty.add("state")
+            if "activity" in dirty and session._activity is not None:
+                if not save_activity(session.user_id, session._activity):
+                    session.dirty.add("activity")
+            return not session.dirty
+
+    def flush(self, user_id: str = None):
+        """Write dirty sessions to disk (one user, or all)."""
+        with self._lock:
+            if user_id is not None:
+                session = self._sessions.get(str(user_id))
+                sessions = [session] if session else []
+            else:
+                sessions = list(self._sessions.values())
+
+        for session in sessions:
+            if session.dirty:
+                try:
+                    self._flush_session(session)
+                except Exception as e:
+                    logger.error(f"[SESSION] Flush failed for {session.user_id}: {e}")
+
+    def drop(self, user_id: str):
+        """
+        Forget a user without flushing (their data is being deleted). Waits
+        for a flush already writing this session, and stops any later one.
+        """
+        with self._lock:
+            session = self._sessions.pop(str(user_id), None)
+        if session is not None:
+            with session.lock:
+                session.dropped = True
+                session.dirty = set()
+
+    def _evict_idle(self):
+        """
+        Flush and evict from the cold end. Call without holding self._lock:
+        victims are picked under it, flushed outside it, and only removed
+        once their flush succeeded. Sessions in use are skipped.
+        """
+        cutoff = time.monotonic() - self.idle_seconds
+        with self._lock:
+            over = len(self._sessions) - self.max_users
+            victims = []
+            for session in self._sessions.values():
+                if session.last_access > cutoff and over <= 0:
+                    break
+                victims.append(session)
+                over -= 1
+
+        for session in victims:
+            if async_user_lock_held(session.user_id) or not session.lock.acquire(blocking=False):
+                continue
+            try:
+                if session.dirty and not self._flush_session(session):
+                    continue
+                with self._lock:
+                    # Touched again since it was picked?
+                    if self._sessions.get(session.user_id) is not session:
+                        continue
+                    if session.last_access > cutoff and len(self._sessions) <= self.max_users:
+                        continue
+                    del self._sessions[session.user_id]
+            except Exception as e:
+                logger.error(f"[SESSION] Flush failed for {session.user_id}: {e}")
+            finally:
+                session.lock.release()
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+
+# Global cache instance
+session_cache = SessionCache()
+atexit.register(session_cache.flush)
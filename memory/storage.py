@@ -0,0 +1,219 @@
+"""
+Storage Primitives
+Crash-safe JSON writes and per-user locking shared by every memory/ module.
+
+- atomic_write_json: write to a temp file in the same directory, fsync,
+  then rename over the target. Readers see the old file or the new one,
+  never a truncated mix.
+- read_json: load a JSON file. A corrupt file is moved aside instead of
+  being silently replaced by an empty default on the next save.
+- user_lock / async_user_lock: serialize read-modify-write cycles for one
+  user across threads (and across processes via a lock file, when the
+  storage backend wants one), and across tasks on the event loop.
+"""
+
+import asyncio
+import functools
+import json
+import logging
+import os
+import tempfile
+import threading
+import weakref
+from contextlib import asynccontextmanager, contextmanager
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Callable, Optional
+
+from config import DATA_DIR
+from core.tracing import add_io
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    try:
+        import msvcrt
+    except ImportError:
+        msvcrt = None
+
+logger = logging.getLogger(__name__)
+
+LOCK_FILE = ".lock"
+
+
+def _fsync_dir(directory: Path):
+    """Persist the rename itself (POSIX only)."""
+    if os.name != "posix":
+        return
+    fd = os.open(directory, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def atomic_write_bytes(path: Path, data: bytes):
+    """Replace `path` with `data` atomically. Raises OSError on failure."""
+    path = Path(path)
+    fd, tmp_name = tempfile.mkstemp(dir=path.parent, prefix=f".{path.name}.", suffix=".tmp")
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_name, path)
+        add_io(written=len(data))
+    except BaseException:
+        try:
+            os.unlink(tmp_name)
+        except OSError:
+            pass
+        raise
+    _fsync_dir(path.parent)
+
+
+def atomic_write_json(path: Path, data: Any, indent: int = 2):
+    """Serialize and atomically replace `path`. Raises OSError/TypeError on failure."""
+    payload = json.dumps(data, indent=indent, ensure_ascii=False).encode("utf-8")
+    atomic_write_bytes(path, payload)
+
+
+def read_json(path: Path, default: Callable[[], Any]) -> Any:
+    """
+    Load JSON from `path`, or return default() if it doesn't exist.
+
+    A file that fails to parse is renamed to <name>.corrupt-<timestamp> so
+    the data is kept for inspection and the next save doesn't overwrite it.
+    """
+    path = Path(path)
+    try:
+        with open(path, 'rb') as f:
+            raw = f.read()
+        add_io(read=len(raw))
+        return json.loads(raw)
+    except FileNotFoundError:
+        return default()
+    except json.JSONDecodeError as e:
+        quarantine = path.with_name(f"{path.name}.corrupt-{datetime.now().strftime('%Y%m%d%H%M%S')}")
+        logger.error(f"Corrupt {path}: {e} - moved to {quarantine.name}")
+        try:
+            os.replace(path, quarantine)
+        except OSError as move_error:
+            logger.error(f"Could not quarantine {path}: {move_error}")
+        return default()
+    except IOError as e:
+        logger.error(f"Error reading {path}: {e}")
+        return default()
+
+
+class _UserLock:
+    """Re-entrant per-user lock: a thread RLock plus an OS file lock held at depth 0->1."""
+
+    def __init__(self, user_id: str):
+        self.user_id = user_id
+        self._rlock = threading.RLock()
+        self._depth = 0
+        self._fd = None
+
+    def _lock_file(self):
+        if _lock_root is None or (fcntl is None and msvcrt is None):
+            return
+        user_dir = _lock_root / self.user_id
+        user_dir.mkdir(parents=True, exist_ok=True)
+        self._fd = os.open(user_dir / LOCK_FILE, os.O_RDWR | os.O_CREAT, 0o644)
+        if fcntl is not None:
+            fcntl.flock(self._fd, fcntl.LOCK_EX)
+        else:
+            msvcrt.locking(self._fd, msvcrt.LK_LOCK, 1)
+
+    def _unlock_file(self):
+        if self._fd is None:
+            return
+        try:
+            if fcntl is not None:
+                fcntl.flock(self._fd, fcntl.LOCK_UN)
+            else:
+                os.lseek(self._fd, 0, os.SEEK_SET)
+                msvcrt.locking(self._fd, msvcrt.LK_UNLCK, 1)
+        finally:
+            os.close(self._fd)
+            self._fd = None
+
+    def acquire(self):
+        self._rlock.acquire()
+        if self._depth == 0:
+            try:
+                self._lock_file()
+            except BaseException:
+                self._rlock.release()
+                raise
+        self._depth += 1
+
+    def release(self):
+        self._depth -= 1
+        if self._depth == 0:
+            self._unlock_file()
+        self._rlock.release()
+
+
+# Where per-user lock files live; None disables the cross-process file lock
+_lock_root: Optional[Path] = DATA_DIR
+
+
+def set_lock_root(path: Optional[Path]):
+    """Point user_lock's lock files at a backend's data dir (None = thread lock only)."""
+    global _lock_root
+    _lock_root = Path(path) if path is not None else None
+
+
+_user_locks = {}
+_user_locks_guard = threading.Lock()
+# Only referenced while a coroutine waits for or holds it, so idle users' locks go away
+_async_locks: "weakref.WeakValueDictionary[str, asyncio.Lock]" = weakref.WeakValueDictionary()
+
+
+def _get_user_lock(user_id: str) -> _UserLock:
+    user_id = str(user_id)
+    lock = _user_locks.get(user_id)
+    if lock is None:
+        with _user_locks_guard:
+            lock = _user_locks.setdefault(user_id, _UserLock(user_id))
+    return lock
+
+
+@contextmanager
+def user_lock(user_id: str):
+    """Exclusive access to one user's files (threads and processes). Re-entrant."""
+    lock = _get_user_lock(user_id)
+    lock.acquire()
+    try:
+        yield
+    finally:
+        lock.release()
+
+
+def with_user_lock(func):
+    """Decorator for read-modify-write helpers taking user_id as first argument."""
+    @functools.wraps(func)
+    def wrapper(user_id, *args, **kwargs):
+        with user_lock(user_id):
+            return func(user_id, *args, **kwargs)
+    return wrapper
+
+
+@asynccontextmanager
+async def async_user_lock(user_id: str):
+    """Serialize coroutines for one user on the event loop (does not take the file lock)."""
+    user_id = str(user_id)
+    lock = _async_locks.get(user_id)
+    if lock is None:
+        lock = _async_locks.setdefault(user_id, asyncio.Lock())
+    async with lock:
+        yield
+
+
+def async_user_lock_held(user_id: str) -> bool:
+    """Whether a coroutine holds this user's async lock (a turn is in flight)."""
+    lock = _async_locks.get(str(user_id))
+    return lock is not None and lock.locked()
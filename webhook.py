@@ -0,0 +1,284 @@
+"""
+Gate Bot - Webhook Mode
+
+Telegram posts updates to WEBHOOK_URL. This process is a small HTTP
+server that hands each update to one of WEBHOOK_WORKERS worker processes,
+picked by a hash of the user id (core.workers). A user's messages always
+land in the same worker, in arrival order, so their session cache,
+rate-limit counters and turn locks stay process-local; different users
+spread over every core.
+
+Each worker is a full bot - bot.build_application() without an Updater -
+fed through its own queue. Conversation data is shared through the
+storage backend (file locks / SQLite), /limit overrides through
+RATE_LIMIT_OVERRIDES_PATH; counters, metrics exports and scheduled
+delivery are per worker. Dead workers are restarted and pick up their
+queue where it left off.
+
+Usage:
+    WEBHOOK_URL=https://gate.example.com/telegram WEBHOOK_SECRET=... python webhook.py
+"""
+
+import asyncio
+import json
+import logging
+import multiprocessing
+import os
+import signal
+import threading
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from queue import Empty
+from typing import List, Optional
+from urllib.parse import urlparse
+
+from config import (
+    TELEGRAM_BOT_TOKEN,
+    WEBHOOK_URL,
+    WEBHOOK_LISTEN,
+    WEBHOOK_PORT,
+    WEBHOOK_SECRET,
+    WEBHOOK_WORKERS,
+)
+from core.workers import worker_for
+
+logging.basicConfig(
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+    level=logging.INFO
+)
+logger = logging.getLogger(__name__)
+
+# How often the router checks for dead workers
+SUPERVISE_SECONDS = 5
+# How long shutdown waits for workers to finish their queued updates
+SHUTDOWN_SECONDS = 30
+
+
+def user_of(update: dict) -> Optional[int]:
+    """The user an update belongs to: 'from' / 'user' of its payload, else its chat."""
+    for key, value in update.items():
+        if key == "update_id" or not isinstance(value, dict):
+            continue
+        for field in ("from", "user"):
+            sender = value.get(field)
+            if isinstance(sender, dict) and "id" in sender:
+                return sender["id"]
+        chat = value.get("chat")
+        if isinstance(chat, dict) and "id" in chat:
+            return chat["id"]
+    return None
+
+
+# ---- worker ----------------------------------------------------------------
+
+def run_worker(worker_id: int, updates: multiprocessing.Queue):
+    """Worker process entry point (WORKER_ID is already in the environment)."""
+    asyncio.run(_serve(worker_id, updates))
+
+
+async def _serve(worker_id: int, updates: multiprocessing.Queue):
+    # Imported here: the router process never loads the bot itself
+    from telegram import Update
+    import bot
+
+    application = bot.build_application(polling=False)
+    loop = asyncio.get_running_loop()
+    drained = asyncio.Event()
+    parent = os.getppid()
+
+    def read():
+        """Blocking queue reads on a thread of their own, handed to the event loop in order."""
+        while True:
+            try:
+                data = updates.get(timeout=1)
+            except Empty:
+                # Keep waiting unless the router is gone
+                if os.getppid() != parent:
+                    break
+                continue
+            if data is None:
+                break
+            try:
+                update = Update.de_json(json.loads(data), application.bot)
+            except Exception as e:
+                logger.error(f"[WORKER {worker_id}] Bad update: {e}")
+                continue
+            asyncio.run_coroutine_threadsafe(application.update_queue.put(update), loop).result()
+        loop.call_soon_threadsafe(drained.set)
+
+    # The router decides when to stop (after closing the server), by sending None
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, lambda: None)
+
+    async with application:
+        if worker_id == 0:
+            await application.post_init(application)
+        else:
+            await asyncio.to_thread(bot.warm_up)
+        await application.start()
+        threading.Thread(target=read, name="updates", daemon=True).start()
+        logger.info(f"[WORKER {worker_id}] Ready (pid {os.getpid()})")
+
+        await drained.wait()
+        await application.stop()
+        await application.post_shutdown(application)
+    logger.info(f"[WORKER {worker_id}] Stopped")
+
+
+# ---- router ----------------------------------------------------------------
+
+class Router:
+    """Worker processes and their queues."""
+
+    def __init__(self, workers: int):
+        self._context = multiprocessing.get_context("spawn")
+        self.queues: List[multiprocessing.Queue] = [self._context.Queue() for _ in range(workers)]
+        self.processes: List[Optional[multiprocessing.Process]] = [None] * workers
+        self._stopping = threading.Event()
+
+    def start(self, worker_id: int):
+        # A spawned child inherits the environment as it is at start(), before config is imported
+        os.environ["WORKER_ID"] = str(worker_id)
+        try:
+            process = self._context.Process(
+                target=run_worker, args=(worker_id, self.queues[worker_id]),
+                name=f"gate-worker-{worker_id}"
+            )
+            process.start()
+        finally:
+            del os.environ["WORKER_ID"]
+        self.processes[worker_id] = process
+
+    def start_all(self):
+        for worker_id in range(len(self.queues)):
+            self.start(worker_id)
+        threading.Thread(target=self._supervise, name="supervisor", daemon=True).start()
+
+    def _supervise(self):
+        while not self._stopping.wait(SUPERVISE_SECONDS):
+            for worker_id, process in enumerate(self.processes):
+                if not process.is_alive():
+                    logger.error(f"Worker {worker_id} exited ({process.exitcode}) - restarting")
+                    self.start(worker_id)
+
+    def route(self, data: bytes, update: dict) -> int:
+        user_id = user_of(update)
+        worker_id = worker_for(user_id, len(self.queues)) if user_id is not None else 0
+        self.queues[worker_id].put(data)
+        return worker_id
+
+    def alive(self) -> int:
+        return sum(1 for process in self.processes if process is not None and process.is_alive())
+
+    def stop(self):
+        """Let every worker finish what's queued, then wait for them."""
+        self._stopping.set()
+        for queue in self.queues:
+            queue.put(None)
+        for worker_id, process in enumerate(self.processes):
+            if process is None:
+                continue
+            process.join(SHUTDOWN_SECONDS)
+            if process.is_alive():
+                logger.warning(f"Worker {worker_id} didn't stop in {SHUTDOWN_SECONDS}s - terminating")
+                process.terminate()
+
+
+class WebhookHandler(BaseHTTPRequestHandler):
+    """POST <webhook path>: one Telegram update. GET /healthz: worker liveness."""
+
+    server: "WebhookServer"
+
+    def _respond(self, status: HTTPStatus, body: str = ""):
+        payload = body.encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "text/plain; charset=utf-8")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def do_POST(self):
+        if urlparse(self.path).path != self.server.webhook_path:
+            self._respond(HTTPStatus.NOT_FOUND)
+            return
+        if WEBHOOK_SECRET and self.headers.get("X-Telegram-Bot-Api-Secret-Token") != WEBHOOK_SECRET:
+            self._respond(HTTPStatus.FORBIDDEN)
+            return
+
+        data = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+        try:
+            update = json.loads(data)
+        except ValueError:
+            self._respond(HTTPStatus.BAD_REQUEST)
+            return
+
+        # Acknowledge once queued - Telegram retries anything that isn't a 2xx
+        self.server.router.route(data, update)
+        self._respond(HTTPStatus.OK)
+
+    def do_GET(self):
+        if urlparse(self.path).path != "/healthz":
+            self._respond(HTTPStatus.NOT_FOUND)
+            return
+        alive = self.server.router.alive()
+        total = len(self.server.router.processes)
+        self._respond(HTTPStatus.OK if alive == total else HTTPStatus.SERVICE_UNAVAILABLE, f"{alive}/{total} workers\n")
+
+    def log_message(self, format, *args):
+        logger.debug(f"{self.address_string()} {format % args}")
+
+
+class WebhookServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, router: Router, webhook_path: str):
+        super().__init__(address, WebhookHandler)
+        self.router = router
+        self.webhook_path = webhook_path
+
+
+async def set_webhook():
+    """Point Telegram at WEBHOOK_URL (replaces any polling session)."""
+    from telegram import Bot, Update
+
+    async with Bot(TELEGRAM_BOT_TOKEN) as telegram_bot:
+        await telegram_bot.set_webhook(
+            WEBHOOK_URL,
+            secret_token=WEBHOOK_SECRET or None,
+            allowed_updates=Update.ALL_TYPES
+        )
+
+
+def _interrupt(signum, frame):
+    raise KeyboardInterrupt
+
+
+def main():
+    """Start the router and its workers."""
+    if not TELEGRAM_BOT_TOKEN:
+        logger.error("TELEGRAM_BOT_TOKEN not set")
+        return
+    if not WEBHOOK_URL:
+        logger.error("WEBHOOK_URL not set (use bot.py for long polling)")
+        return
+
+    router = Router(WEBHOOK_WORKERS)
+    server = WebhookServer((WEBHOOK_LISTEN, WEBHOOK_PORT), router, urlparse(WEBHOOK_URL).path or "/")
+    signal.signal(signal.SIGTERM, _interrupt)
+
+    try:
+        # Workers first: updates queue up while they load and Telegram starts posting
+        router.start_all()
+        asyncio.run(set_webhook())
+        logger.info(f"Webhook on {WEBHOOK_LISTEN}:{WEBHOOK_PORT}{server.webhook_path} -> {WEBHOOK_WORKERS} workers")
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        router.stop()
+        logger.info("Stopped")
+
+
+if __name__ == "__main__":
+    main()